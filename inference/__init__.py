@@ -0,0 +1,24 @@
+"""
+Importable async inference engine shared by the notebooks and the headless runner.
+
+Run `python -m inference --help` from the repository root for the batch CLI.
+"""
+from .clients import GenAIClient, create_genai_client
+from .engine import perform_batch_inference_async, perform_inference_single_async, results_writer_task, run_bulk_inference_async
+from .jobs import InferenceJob, build_prompt, make_answer_job, make_cocot_job, make_question_generation_job
+from .rate_limiter import AsyncRateLimiter
+
+__all__ = [
+    "AsyncRateLimiter",
+    "GenAIClient",
+    "InferenceJob",
+    "build_prompt",
+    "create_genai_client",
+    "make_answer_job",
+    "make_cocot_job",
+    "make_question_generation_job",
+    "perform_batch_inference_async",
+    "perform_inference_single_async",
+    "results_writer_task",
+    "run_bulk_inference_async",
+]
@@ -0,0 +1,114 @@
+import json
+import logging
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Sequence
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH_SIZE = 10
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Video-Level Question Batching
+# ──────────────────────────────────────────────────────────────────────────────
+# All questions of a video go into one structured-output request, so the video is
+# sent (and billed, and rate limited) once instead of once per qid. The response
+# schema pins the qids to an enum; answers are matched back by qid, and any qid
+# missing or malformed in the response is answered with a single-question call.
+
+def batch_response_schema(qids: Sequence[str]) -> type:
+    """Response schema for one batch: exactly one `{qid, answer}` entry per question."""
+    from pydantic import BaseModel, Field, create_model
+
+    QuestionAnswer = create_model(
+        "QuestionAnswer",
+        qid=(Literal[tuple(qids)], Field(description="The qid of the question being answered.")),
+        answer=(str, Field(description="The complete answer to this question alone, in the required output format.")),
+    )
+
+    class BatchAnswerResponse(BaseModel):
+        answers: List[QuestionAnswer] = Field(min_length=len(qids), max_length=len(qids),
+                                              description="One answer per question, in the order asked.")
+
+    return BatchAnswerResponse
+
+
+def build_batch_prompt(prompts: Dict[str, str]) -> str:
+    """One message asking every question of the video, each tagged with its qid."""
+    lines = [
+        f"Answer each of the following {len(prompts)} questions about the video.",
+        "Each question is SEPARATE and must be answered INDEPENDENTLY, exactly as you would answer it if it were asked alone, "
+        "following the output format of your instructions.",
+        "Return one entry per question in `answers`, with its `qid` and the full answer as `answer`.",
+    ]
+    for qid, prompt_text in prompts.items():
+        lines += ["", f"### Question qid: {qid}", prompt_text]
+    return "\n".join(lines)
+
+
+def batch_config(config: Any, qids: Sequence[str]) -> "types.GenerateContentConfig":
+    """The job config switched to JSON output with the batch schema (system prompt unchanged)."""
+    from google.genai import types
+
+    update = {"response_mime_type": "application/json", "response_schema": batch_response_schema(qids)}
+    if config is None:
+        return types.GenerateContentConfig(**update)
+    return config.model_copy(update=update)
+
+
+def _strip_code_fence(text: str) -> str:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text
+
+
+def split_batch_answers(response: Any, qids: Sequence[str]) -> Dict[str, str]:
+    """
+    Maps qid -> answer for every well-formed answer in a batch response.
+
+    Entries are checked one by one, so one malformed answer does not discard the rest;
+    unknown qids, duplicates (the first one wins) and empty answers are dropped.
+    """
+    from pydantic import BaseModel
+
+    parsed = getattr(response, "parsed", None)
+    if parsed is not None and hasattr(parsed, "answers"):
+        entries = [entry.model_dump() if isinstance(entry, BaseModel) else entry for entry in parsed.answers]
+    else:
+        try:
+            raw = json.loads(_strip_code_fence(getattr(response, "text", None) or ""))
+        except ValueError:
+            return {}
+        entries = raw.get("answers", []) if isinstance(raw, dict) else []
+
+    wanted = set(qids)
+    answers: Dict[str, str] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        qid, answer = str(entry.get("qid")), entry.get("answer")
+        if qid in wanted and qid not in answers and isinstance(answer, str) and answer.strip():
+            answers[qid] = answer.strip()
+    return answers
+
+
+def group_into_batches(items: List[Dict], max_batch_size: int = DEFAULT_MAX_BATCH_SIZE) -> List[Dict]:
+    """
+    Turns per-question rows into one item per video (at most `max_batch_size` questions each).
+
+    Each batch item is a copy of its first question's row (so it carries the video
+    handle columns) with the question rows under `"batch"`.
+    """
+    videos: Dict[str, List[Dict]] = {}
+    for item in items:
+        videos.setdefault(item.get("video_id", ""), []).append(item)
+    batches = []
+    for questions in videos.values():
+        for start in range(0, len(questions), max_batch_size):
+            chunk = questions[start:start + max_batch_size]
+            batches.append({**chunk[0], "batch": chunk})
+    return batches
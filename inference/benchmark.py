@@ -0,0 +1,319 @@
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import logging
+import math
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from .chat_store import ChatHistoryStore, serialize_chat
+from .engine import run_bulk_inference_async
+from .fake_client import FakeGeminiClient, FakeResponse
+from .jobs import make_answer_job, make_cocot_job, make_question_generation_job
+from .metrics import DEFAULT_METRICS
+from .quota_sim import ResourceExhausted
+from .rate_limiter import QuotaManager
+from .retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+FLOWS = ("cot", "cocot", "questions") # Same names as the CLI tasks
+DEFAULT_RESULTS_LOG = os.path.join("benchmarks", "results.jsonl")
+REGRESSION_THRESHOLD = 0.10 # Flag >10% worse than the previous run of the same scenario
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Simulated Backend
+# ──────────────────────────────────────────────────────────────────────────────
+# Latencies are sampled from a distribution instead of being constant, a share of
+# requests is rejected with 429, and responses have a configurable size. All
+# waiting is `asyncio.sleep`, so the process CPU time is the pipeline's own cost.
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Builds a latency sampler (seconds) from a spec string:
+    `const:S`, `uniform:LO,HI`, `exp:MEAN`, `lognormal:MEDIAN,SIGMA`.
+    """
+    kind, _, raw = spec.partition(":")
+    args = [float(x) for x in raw.split(",")] if raw else []
+    if kind == "const":
+        return lambda rng: args[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(args[0], args[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / args[0]) if args[0] > 0 else 0.0
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(args[0]), args[1]) if args[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution '{spec}'.")
+
+
+class _BenchModels:
+    def __init__(self, owner: "BenchmarkClient", inner: Any):
+        self._owner = owner
+        self._inner = inner
+
+    async def generate_content(self, *, model: str, contents: List[Any], config: Any = None) -> FakeResponse:
+        owner = self._owner
+        owner.requests += 1
+        delay = owner.latency(owner.rng)
+        if owner.rng.random() < owner.throttle_rate:
+            owner.throttled += 1
+            await asyncio.sleep(delay / 10) # Rejections come back fast
+            raise ResourceExhausted("429 RESOURCE_EXHAUSTED: injected.", owner.retry_delay_sec)
+        await asyncio.sleep(delay)
+        owner.latency_total += delay
+        return await self._inner.generate_content(model=model, contents=contents, config=config)
+
+
+class _BenchFiles:
+    def __init__(self, owner: "BenchmarkClient"):
+        self._owner = owner
+
+    async def get(self, *, name: str) -> Any:
+        owner = self._owner
+        owner.file_gets += 1
+        await asyncio.sleep(owner.files_latency(owner.rng))
+        return SimpleNamespace(name=name, uri=f"https://fake.local/{name}", mime_type="video/mp4")
+
+
+class BenchmarkClient(FakeGeminiClient):
+    """
+    `FakeGeminiClient` with sampled latencies, injected 429s and sized responses.
+
+    Args:
+        latency (str): `generate_content` latency spec (see `parse_latency`).
+        files_latency (str): `files.get` latency spec.
+        throttle_rate (float): Share of requests rejected with `ResourceExhausted`.
+        retry_delay_sec (float): `retryDelay` sent with every 429.
+        response_chars (int): Size of unstructured responses.
+        seed (int): RNG seed, so runs are repeatable.
+    """
+    def __init__(self, latency: str = "lognormal:0.05,0.5", files_latency: str = "const:0.01",
+                 throttle_rate: float = 0.0, retry_delay_sec: float = 0.05, response_chars: int = 800, seed: int = 0):
+        body = "```thinking\n" + "- Fake reasoning step.\n" * max(1, response_chars // 23) + "```\nA."
+        super().__init__(response_text=body[:max(response_chars, 20)])
+        self.rng = random.Random(seed)
+        self.latency = parse_latency(latency)
+        self.files_latency = parse_latency(files_latency)
+        self.throttle_rate = throttle_rate
+        self.retry_delay_sec = retry_delay_sec
+        self.requests = 0
+        self.throttled = 0
+        self.latency_total = 0.0
+        self.aio.models = _BenchModels(self, self.aio.models)
+        self.aio.files = _BenchFiles(self)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Synthetic Datasets
+# ──────────────────────────────────────────────────────────────────────────────
+
+def synthetic_questions(num_qids: int, questions_per_video: int = 4) -> List[Dict]:
+    """Metadata rows shaped like `video_metadata_non_vertex.csv` (qids `0000-0`, `0000-1`, ...)."""
+    return [{"qid": f"{i // questions_per_video:05d}-{i % questions_per_video}",
+             "video_id": f"{i // questions_per_video:05d}",
+             "question": f"Synthetic question {i} about the video?",
+             "question_prompt": "Answer with the option's letter.",
+             "question_type": "default",
+             "file_api_name": f"files/bench{i // questions_per_video:05d}"}
+            for i in range(num_qids)]
+
+
+def synthetic_videos(num_qids: int, questions_per_video: int = 4) -> List[Dict]:
+    """One row per video, for the question generation flow."""
+    return [{"video_id": f"{v:05d}", "file_api_name": f"files/bench{v:05d}"}
+            for v in range(math.ceil(num_qids / questions_per_video))]
+
+
+def write_chat_histories(answers_dir: str, video_ids: List[str], turns: int = 3):
+    """Generated-question chat histories like `generated_questions/<model>/chat_history`."""
+    from google.genai import types
+    os.makedirs(answers_dir, exist_ok=True)
+    chat = []
+    for t in range(turns):
+        chat += [types.Content(role="user", parts=[types.Part.from_text(text=f"Guideline question {t + 1}?")]),
+                 types.Content(role="model", parts=[types.Part.from_text(text="Fake answer. " * 40)])]
+    payload = json.dumps(serialize_chat(chat))
+    for video_id in video_ids:
+        with open(os.path.join(answers_dir, f"{video_id}.json"), "w", encoding="utf-8") as f:
+            f.write(payload)
+
+
+def build_flow(flow: str, num_qids: int, work_dir: str) -> tuple:
+    """Returns `(job, items)` for a flow, built from the real `models/*` configs."""
+    from models.registry import get_model_config
+    if flow == "cot":
+        return make_answer_job(get_model_config("cot", "gemini-2.0-flash")), synthetic_questions(num_qids)
+    if flow == "cocot":
+        items = synthetic_questions(num_qids)
+        answers_dir = os.path.join(work_dir, "chat_history")
+        write_chat_histories(answers_dir, sorted({item["video_id"] for item in items}))
+        store = ChatHistoryStore(answers_dir)
+        return make_cocot_job(get_model_config("cot", "gemini-2.0-flash"), answers_dir, store), items
+    if flow == "questions":
+        return (make_question_generation_job(get_model_config("brainstorm", "gemini-2.0-flash", num_questions=5)),
+                synthetic_videos(num_qids))
+    raise ValueError(f"Unknown flow '{flow}'.")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Scenario Runner
+# ──────────────────────────────────────────────────────────────────────────────
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1) # bytes on macOS, KiB on Linux
+
+
+async def _run_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    with tempfile.TemporaryDirectory() as work_dir:
+        job, items = build_flow(params["flow"], params["qids"], work_dir)
+        job.requests_per_minute = params["rpm"]
+        job.max_async_workers = params["workers"]
+        job.retry_policy = RetryPolicy(max_retries=8, initial_backoff_sec=0.05, max_backoff_sec=1.0, deadline_sec=600.0)
+        client = BenchmarkClient(params["latency"], params["files_latency"], params["throttle_rate"],
+                                 response_chars=params["response_chars"], seed=params["seed"])
+        results_file = os.path.join(work_dir, f"results.{params['results_format']}")
+
+        DEFAULT_METRICS.reset()
+        cpu_start = time.process_time()
+        summary = await run_bulk_inference_async(items, client, job, results_file, show_progress=False,
+                                                 quota_manager=QuotaManager(adaptive=True))
+        cpu_sec = time.process_time() - cpu_start
+        results_mb = os.path.getsize(results_file) / 2**20 if os.path.isfile(results_file) else 0.0
+
+    wall = summary["duration_sec"]
+    snap = DEFAULT_METRICS.snapshot()
+    writer = snap["latency_sec"].get("writer_batch", {})
+    item_total = snap["latency_sec"].get("item_total", {})
+    # Perfect scheduling would keep every worker busy with simulated latency only
+    ideal_sec = client.latency_total / params["workers"]
+    return {
+        "completed": summary["completed"],
+        "items": summary["total"],
+        "requests": client.requests,
+        "throttled": client.throttled,
+        "wall_sec": round(wall, 3),
+        "requests_per_sec": round(client.requests / wall, 1) if wall else 0.0,
+        "items_per_sec": round(summary["total"] / wall, 1) if wall else 0.0,
+        "cpu_ms_per_request": round(cpu_sec * 1000 / max(client.requests, 1), 3),
+        "scheduling_efficiency": round(ideal_sec / wall, 3) if wall else 0.0,
+        "writer_rows_per_sec": round(item_total.get("count", 0) / writer["sum"], 1) if writer.get("sum") else None,
+        "writer_batches": writer.get("count", 0),
+        "item_p50_sec": item_total.get("p50"),
+        "item_p99_sec": item_total.get("p99"),
+        "results_mb": round(results_mb, 2),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_scenario(params: Dict[str, Any]) -> Dict[str, Any]:
+    """Runs one scenario (meant for a fresh process, so peak RSS is per scenario)."""
+    logging.basicConfig(level=params.get("log_level", "ERROR").upper(),
+                        format='%(asctime)s - %(levelname)s - %(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+    return asyncio.run(_run_scenario(params))
+
+
+def code_version() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip() + ("+dirty" if subprocess.run(
+                                  ["git", "diff", "--quiet"], capture_output=True).returncode else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# --- Results Log ---
+def scenario_key(params: Dict[str, Any]) -> str:
+    return json.dumps({k: v for k, v in params.items() if k != "log_level"}, sort_keys=True)
+
+
+def previous_results(log_path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest recorded result per scenario."""
+    latest: Dict[str, Dict[str, Any]] = {}
+    if os.path.isfile(log_path):
+        with open(log_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    latest[scenario_key(record["params"])] = record
+    return latest
+
+
+def compare(current: Dict[str, Any], previous: Optional[Dict[str, Any]]) -> List[str]:
+    """Human-readable deltas; higher is better for rates, lower is better for costs."""
+    if previous is None:
+        return []
+    notes = []
+    for metric, higher_is_better in (("requests_per_sec", True), ("cpu_ms_per_request", False), ("peak_rss_mb", False)):
+        old, new = previous["result"].get(metric), current.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = change < -REGRESSION_THRESHOLD if higher_is_better else change > REGRESSION_THRESHOLD
+        notes.append(f"{metric} {old} -> {new} ({change:+.0%}){'  REGRESSION' if worse else ''}")
+    return notes
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m inference.benchmark",
+                                     description="Offline throughput benchmarks of the inference pipeline.")
+    parser.add_argument("--flows", default=",".join(FLOWS), help=f"Comma-separated subset of {FLOWS}.")
+    parser.add_argument("--sizes", default="1000,10000", help="Comma-separated qid counts (e.g. 1000,10000,100000).")
+    parser.add_argument("--workers", type=int, default=64, help="MAX_ASYNC_WORKERS.")
+    parser.add_argument("--rpm", type=int, default=None, help="REQUESTS_PER_MINUTE (default: no rate limit).")
+    parser.add_argument("--latency", default="lognormal:0.05,0.5", help="generate_content latency distribution.")
+    parser.add_argument("--files-latency", default="const:0.01", help="files.get latency distribution.")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests answered with 429.")
+    parser.add_argument("--response-chars", type=int, default=800)
+    parser.add_argument("--results-format", choices=("csv", "sqlite"), default="csv")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log", default=DEFAULT_RESULTS_LOG, help="JSONL file the results are appended to.")
+    parser.add_argument("--no-save", action="store_true", help="Do not append to the results log.")
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    previous = previous_results(args.log)
+    version = code_version()
+    regressions = 0
+    # A fresh interpreter per scenario: clean metrics, limiter state and peak RSS
+    spawn = multiprocessing.get_context("spawn")
+    for flow in args.flows.split(","):
+        for size in (int(s) for s in args.sizes.split(",")):
+            params = {"flow": flow, "qids": size, "workers": args.workers, "rpm": args.rpm,
+                      "latency": args.latency, "files_latency": args.files_latency,
+                      "throttle_rate": args.throttle_rate, "response_chars": args.response_chars,
+                      "results_format": args.results_format, "seed": args.seed, "log_level": args.log_level}
+            with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=spawn) as pool:
+                result = pool.submit(run_scenario, params).result()
+            record = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "version": version,
+                      "python": platform.python_version(), "params": {k: v for k, v in params.items() if k != "log_level"},
+                      "result": result}
+            logger.info(f"{flow} x {size}: {result}")
+            for note in compare(result, previous.get(scenario_key(params))):
+                regressions += note.endswith("REGRESSION")
+                logger.info(f"  vs previous: {note}")
+            if not args.no_save:
+                Path(args.log).parent.mkdir(parents=True, exist_ok=True)
+                with open(args.log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+    if regressions:
+        logger.warning(f"{regressions} metrics regressed by more than {REGRESSION_THRESHOLD:.0%}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
+
+from .chat_store import serialize_chat
+from .engine import (RetriesExhausted, finish_reason_of, generate_memoized, generate_with_context_cache,
+                     generate_with_retries, resolve_video_part)
+from .jobs import InferenceJob, text_response
+from .rate_limiter import AsyncRateLimiter
+from .retry import is_handle_error
+from .video_cache import VideoHandleCache
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_NUM_TURNS = 3
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# CoCoT Chat History Builder (answers.csv + ANSWERS_DIR/<video_id>.json)
+# ──────────────────────────────────────────────────────────────────────────────
+# Each video answers its guideline questions turn by turn. Turns of one video are
+# necessarily sequential (every turn carries the previous answers), but every turn
+# is a separate awaitable request: it takes a semaphore slot and a rate-limiter
+# token only for its own duration, so turns of many videos interleave.
+
+@dataclass
+class ChatJob(InferenceJob):
+    """An `InferenceJob` that answers each video's generated questions as chat turns."""
+    generated_questions: Dict[str, List[str]] = field(default_factory=dict)
+    answers_dir: str = ""
+    num_turns: int = DEFAULT_NUM_TURNS
+
+    def questions_for(self, video_info: Dict) -> List[str]:
+        return list(self.generated_questions.get(video_info.get("video_id"), []))[:self.num_turns]
+
+
+def make_chat_job(model_tuple: Tuple, generated_questions: Dict[str, List[str]],
+                  answers_dir: str, num_turns: int = DEFAULT_NUM_TURNS) -> ChatJob:
+    """Builds the job answering generated questions with a `get_cot_model` config."""
+    model_name, _system_prompt, _prompt_templates, config, rpm, max_retries, max_workers = model_tuple
+    return ChatJob(
+        model_name=model_name, config=config,
+        build_contents=lambda video_info, video_part: [video_part],
+        parse_response=text_response, requests_per_minute=rpm,
+        max_retries=max_retries, max_async_workers=max_workers,
+        key_field="video_id", output_field="questions",
+        generated_questions=generated_questions, answers_dir=answers_dir, num_turns=num_turns,
+    )
+
+
+def list_answered_videos(answers_dir: str) -> Set[str]:
+    """Video IDs that already have a saved chat history (one directory listing, not one per video)."""
+    if not os.path.isdir(answers_dir):
+        return set()
+    return {name[:-len(".json")] for name in os.listdir(answers_dir) if name.endswith(".json")}
+
+
+def _save_chat(saved_path: str, chat: List["types.Content"]):
+    os.makedirs(os.path.dirname(saved_path), exist_ok=True)
+    tmp_path = saved_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(serialize_chat(chat), f, indent=2)
+    os.replace(tmp_path, saved_path) # Never leave a half-written history behind
+
+
+async def build_chat_history_async(
+    video_info: Dict,
+    client: Any,
+    job: ChatJob,
+    semaphore: asyncio.Semaphore,
+    rate_limiter: Optional[AsyncRateLimiter],
+    results_queue: asyncio.Queue,
+    use_vertex: bool = False,
+    video_cache: Optional[VideoHandleCache] = None,
+) -> None:
+    """
+    Answers a video's guideline questions as a multi-turn chat and saves the history.
+
+    As in the notebook, a failed turn keeps "ERROR: ..." as its answer and the chat
+    continues; only an expired / missing video handle leaves the video unsaved.
+
+    Same signature as `perform_inference_single_async`, so it plugs into
+    `run_bulk_inference_async(..., producer=build_chat_history_async)`.
+    """
+    video_id = video_info.get("video_id", "?")
+    label = f"Video_ID {video_id} (Async)"
+    questions_list = job.questions_for(video_info)
+    start_time = time.time()
+
+    def make_result(status: str, finish_reason: str = "N/A", error: Optional[BaseException] = None) -> Dict:
+        result = {"video_id": video_id, "questions": questions_list, "status": status,
+                  "finish_reason": finish_reason, "duration": time.time() - start_time}
+        if error is not None and is_handle_error(error):
+            result["handle_error"] = True
+        return result
+
+    if not questions_list:
+        logger.warning(f"{label}: No generated questions found.")
+        await results_queue.put(make_result("Failed (No Questions)"))
+        return
+
+    try:
+        video_part = await resolve_video_part(client, video_info, use_vertex, video_cache)
+    except (ValueError, FileNotFoundError, RuntimeError) as e:
+        logger.error(f"{label}: Input Error - {e}")
+        await results_queue.put(make_result("Failed (Input)", error=e))
+        return
+
+    if job.context_cache is not None:
+        # Every turn reuses the cached system prompt + video; only the chat so far is resent
+        job.context_cache.plan(video_id, len(questions_list))
+
+    from google.genai import types
+
+    chat: List[types.Content] = []
+    finish_reason = "UNKNOWN"
+    for idx, q in enumerate(questions_list, 1):
+        user_msg = types.Content(role="user", parts=[types.Part.from_text(text=q)])
+        contents = [video_part] + chat + [user_msg] # always include video_part
+        turn_label = f"{label} turn {idx}"
+        async def send() -> Any:
+            if job.context_cache is not None:
+                return await generate_with_context_cache(client, job, video_id, [video_part], chat + [user_msg],
+                                                         contents, semaphore, rate_limiter, turn_label)
+            return await generate_with_retries(client, job, contents, semaphore, rate_limiter, turn_label)
+
+        try:
+            rsp = await generate_memoized(job, video_info, contents, send)
+            answer = rsp.text.strip()
+            finish_reason = finish_reason_of(rsp)
+        except Exception as e:
+            cause = e.last_error if isinstance(e, RetriesExhausted) else e
+            if is_handle_error(cause):
+                # Every later turn would fail the same way; leave the video unanswered for a requeue
+                logger.error(f"{label}: Turn {idx} failed - {e}")
+                await results_queue.put(make_result("Failed (Input)", "Failed (API)", error=cause))
+                return
+            # Like the notebook: the error becomes this turn's answer and the chat goes on
+            logger.warning(f"{label}: Turn {idx} failed, saving the error as its answer - {e}")
+            answer, finish_reason = f"ERROR: {e}", "Failed (API)"
+
+        chat.extend([
+            user_msg,
+            types.Content(role="model", parts=[types.Part.from_text(text=answer or "…")])
+        ])
+
+    saved_path = os.path.join(job.answers_dir, f"{video_id}.json")
+    await asyncio.to_thread(_save_chat, saved_path, chat)
+    await results_queue.put(make_result("Success", finish_reason))
@@ -0,0 +1,199 @@
+import argparse
+import json
+import logging
+import mmap
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 4096
+PACK_NAME = "chat_histories.pack.jsonl"
+
+Chat = Tuple["types.Content", ...]
+
+
+def default_pack_path(answers_dir: str) -> str:
+    return os.path.join(answers_dir, PACK_NAME)
+
+
+# --- (De)serialization (same JSON layout as the notebooks) ---
+def deserialize_chat(chat_json: List[Dict]) -> List["types.Content"]:
+    from google.genai import types
+
+    return [
+        types.Content(
+            role=msg["role"],
+            parts=[types.Part.from_text(text=msg["parts"][0])]
+        ) for msg in chat_json
+    ]
+
+
+def serialize_chat(chat: List["types.Content"]) -> List[Dict]:
+    return [
+        {
+            "role": msg.role,
+            "parts": [part.text for part in msg.parts]
+        } for msg in chat
+    ]
+
+
+# --- Packed Format ---
+def pack_chat_histories(answers_dir: str, packed_path: Optional[str] = None) -> int:
+    """
+    Packs every `<video_id>.json` history in `answers_dir` into one JSONL file.
+
+    Each line is `{"video_id": ..., "chat": [...]}`. Reading one sequential file is much
+    cheaper than opening a few thousand small files on a network filesystem.
+
+    Returns:
+        int: Number of histories packed.
+    """
+    packed_path = packed_path or default_pack_path(answers_dir)
+    names = sorted(name for name in os.listdir(answers_dir) if name.endswith(".json"))
+    tmp_path = packed_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as out:
+        for name in names:
+            with open(os.path.join(answers_dir, name), encoding="utf-8") as f:
+                chat_json = json.load(f)
+            out.write(json.dumps({"video_id": name[:-len(".json")], "chat": chat_json}, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, packed_path)
+    logger.info(f"Packed {len(names)} chat histories into {packed_path}")
+    return len(names)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Chat History Store
+# ──────────────────────────────────────────────────────────────────────────────
+
+class ChatHistoryStore:
+    """
+    Parses each video's CoCoT chat history once and shares it between all of its questions.
+
+    Histories come from the packed file when present (memory-mapped, one offset per
+    video), otherwise from `<answers_dir>/<video_id>.json`. A `.json` file at least as
+    new as the pack wins over its packed copy. Parsed histories are
+    immutable tuples of `types.Content`, kept in an LRU of `max_entries` videos;
+    callers must not mutate the returned messages.
+
+    Args:
+        answers_dir (str): Directory with the `<video_id>.json` histories.
+        max_entries (int): Parsed histories kept in memory.
+        packed_path (str, optional): Packed JSONL file (default: `answers_dir/chat_histories.pack.jsonl`).
+    """
+    def __init__(self, answers_dir: str, max_entries: int = DEFAULT_MAX_ENTRIES, packed_path: Optional[str] = None):
+        self.answers_dir = answers_dir
+        self.max_entries = max_entries
+        self.packed_path = packed_path or default_pack_path(answers_dir)
+        self._cache: "OrderedDict[str, Chat]" = OrderedDict()
+        self._lock = threading.Lock() # `preload` runs in a worker thread
+        self._mmap: Optional[mmap.mmap] = None
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.isfile(self.packed_path) and os.path.getsize(self.packed_path) > 0:
+            self._open_pack()
+
+    def _open_pack(self):
+        with open(self.packed_path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        # Index line offsets with a cheap scan; lines are only parsed on first use
+        start, size = 0, len(self._mmap)
+        prefix = b'{"video_id": "'
+        while start < size:
+            end = self._mmap.find(b"\n", start)
+            end = size if end == -1 else end
+            if self._mmap[start:start + len(prefix)] == prefix:
+                id_end = self._mmap.find(b'"', start + len(prefix))
+                self._offsets[self._mmap[start + len(prefix):id_end].decode()] = (start, end)
+            start = end + 1
+        # A `<video_id>.json` written since packing (answers re-run / regenerated) supersedes its packed copy
+        # (>=: on coarse-mtime filesystems a same-second rewrite still falls back to the .json)
+        pack_mtime = os.stat(self.packed_path).st_mtime_ns
+        stale = 0
+        if os.path.isdir(self.answers_dir):
+            for entry in os.scandir(self.answers_dir):
+                video_id = entry.name[:-len(".json")]
+                if entry.name.endswith(".json") and video_id in self._offsets and entry.stat().st_mtime_ns >= pack_mtime:
+                    del self._offsets[video_id]
+                    stale += 1
+        logger.info(f"Indexed {len(self._offsets)} packed chat histories in {self.packed_path}"
+                    f" ({stale} superseded by newer .json files)")
+
+    def _read_json(self, video_id: str) -> List[Dict]:
+        span = self._offsets.get(video_id)
+        if span is not None:
+            return json.loads(self._mmap[span[0]:span[1]])["chat"]
+        chat_path = os.path.join(self.answers_dir, video_id + ".json")
+        if not os.path.isfile(chat_path):
+            raise FileNotFoundError(f"Chat file not found for video ID {video_id}.")
+        with open(chat_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def get(self, video_id: str) -> Chat:
+        """Returns the shared, parsed chat history of `video_id`."""
+        with self._lock:
+            chat = self._cache.get(video_id)
+            if chat is not None:
+                self._cache.move_to_end(video_id)
+                self.hits += 1
+                return chat
+        chat = tuple(deserialize_chat(self._read_json(video_id)))
+        with self._lock:
+            self.misses += 1
+            self._cache[video_id] = chat
+            self._cache.move_to_end(video_id)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return chat
+
+    def invalidate(self, video_id: str):
+        """Forgets the parsed and packed history of `video_id`, so the next `get` reads its fresh `.json`."""
+        with self._lock:
+            self._cache.pop(video_id, None)
+            self._offsets.pop(video_id, None)
+
+    def preload(self, video_ids: Iterable[str]) -> int:
+        """Parses the histories of `video_ids` ahead of time (run it via `asyncio.to_thread`)."""
+        loaded = 0
+        for video_id in video_ids:
+            try:
+                self.get(video_id)
+                loaded += 1
+            except FileNotFoundError:
+                pass # Reported per question when the history is actually needed
+        return loaded
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._cache), "packed": len(self._offsets), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+PACK_COMMAND = "pack-chats"
+
+
+def pack_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference pack-chats ANSWERS_DIR`."""
+    parser = argparse.ArgumentParser(prog=f"python -m inference {PACK_COMMAND}",
+                                     description="Pack <video_id>.json chat histories into one file.")
+    parser.add_argument("command", choices=(PACK_COMMAND,))
+    parser.add_argument("answers_dir", help="e.g. generated_questions/gemini-2.0-flash/chat_history")
+    parser.add_argument("--output", default=None, help=f"Packed file (default: ANSWERS_DIR/{PACK_NAME}).")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    if not Path(args.answers_dir).is_dir():
+        parser.error(f"{args.answers_dir} is not a directory.")
+    pack_chat_histories(args.answers_dir, args.output)
+    return 0
@@ -0,0 +1,289 @@
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from .batching import DEFAULT_MAX_BATCH_SIZE, group_into_batches
+from .chat_builder import DEFAULT_NUM_TURNS, ChatJob, build_chat_history_async, list_answered_videos, make_chat_job
+from .chat_store import PACK_COMMAND, ChatHistoryStore, pack_main
+from .data import (get_questions_for_video, group_by_video, load_metadata_for_inference,
+                   load_metadata_questions_generation, load_processed_qids, resource_column)
+from .context_cache import DEFAULT_CACHE_TTL_SEC, ContextCacheManager
+from .dataset_store import DATASET_COMMAND, dataset_main
+from .engine import perform_batch_inference_async, run_bulk_inference_async
+from .fake_client import DEFAULT_FAKE_LATENCY_SEC
+from .ingest import INGEST_COMMAND, ingest_main
+from .jobs import InferenceJob, make_answer_job, make_cocot_job, make_question_generation_job
+from .metrics import DEFAULT_FLUSH_INTERVAL_SEC
+from .pipeline import PIPELINE_COMMAND, pipeline_main
+from .rate_limiter import QuotaManager
+from .sharding import SHARD_COMMAND, parse_shard, shard_main, shard_of
+from .scheduling import (DEFAULT_HEDGE_BUDGET, DEFAULT_HEDGE_QUANTILE, DEFAULT_REQUEUE_PASSES, CostModel,
+                         HedgePolicy, TailScheduler, load_past_latencies, load_video_durations)
+from .streaming import answer_section_complete
+from .response_cache import DEFAULT_MAX_ENTRIES, DEFAULT_RESPONSE_CACHE, ResponseCache
+from .results_store import STORE_COMMANDS, ResultsStore, is_store_path, store_main
+from .video_cache import VideoHandleCache, default_handle_cache_path
+from .uploads import UPLOAD_COMMAND, upload_main
+from .video_prep import PREP_COMMAND, prep_main
+
+logger = logging.getLogger(__name__)
+
+TASKS = ("noncot", "cot", "questions", "answers", "cocot")
+DEFAULT_VIDEO_DURATIONS = "speed_videos/probe_cache.json" # Written by `prepare-videos` (default --output-root)
+
+
+def default_results_file(task: str, model_name: str, questions_model_name: str) -> str:
+    """Mirrors the output locations used by the notebooks."""
+    if task == "questions":
+        return os.path.join(f"generated_questions/{model_name}", "questions.csv")
+    if task == "answers":
+        return os.path.join(f"generated_questions/{questions_model_name}", "answers.csv")
+    if task == "cocot":
+        return os.path.join(f"all_results/full_inference_CoCoT_generated_questions/{model_name}", "results_ccot_full_inference.csv")
+    return os.path.join(f"all_results/full_inference_nonCoT/{model_name}", "results_noncot_full_inference.csv")
+
+
+def answers_dir_for(args: argparse.Namespace) -> str:
+    return args.answers_dir or f"generated_questions/{args.questions_model}/chat_history"
+
+
+def build_job(args: argparse.Namespace, chat_store: Optional[ChatHistoryStore] = None) -> InferenceJob:
+    # Imported here so `--help` works without the model configs on the path
+    from models.registry import get_model_config
+    if args.task == "questions":
+        model = get_model_config("brainstorm", args.model, num_questions=args.num_questions)
+    else:
+        model = get_model_config("noncot" if args.task == "noncot" else "cot", args.model)
+    logger.info(f"Model config {model.kind}/{model.name} (fingerprint {model.fingerprint}).")
+    if args.task in ("noncot", "cot"):
+        return make_answer_job(model)
+    answers_dir = answers_dir_for(args)
+    if args.task == "answers":
+        questions_file = os.path.join(f"generated_questions/{args.questions_model}", "questions.csv")
+        return make_chat_job(model, get_questions_for_video(questions_file), answers_dir, args.num_turns)
+    if args.task == "cocot":
+        return make_cocot_job(model, answers_dir, chat_store)
+    return make_question_generation_job(model)
+
+
+def load_metadata_rows(job: InferenceJob, metadata_file: str, use_vertex: bool) -> List[Dict]:
+    """One row per job key: per video for video-level jobs, else per question."""
+    if job.key_field == "video_id":
+        return list(load_metadata_questions_generation(metadata_file, use_vertex).values())
+    return [q for questions in load_metadata_for_inference(metadata_file, use_vertex).values() for q in questions]
+
+
+def select_items(job: InferenceJob, metadata_file: str, results_file: str, use_vertex: bool,
+                 limit: Optional[int] = None, shard: Optional[Tuple[int, int]] = None) -> Tuple[List[Dict], int]:
+    """Returns the metadata rows still to process (of one `(index, count)` shard) and the number skipped."""
+    rows = load_metadata_rows(job, metadata_file, use_vertex)
+    if shard is not None:
+        rows = [row for row in rows if shard_of(row.get("video_id", ""), shard[1]) == shard[0]]
+
+    if is_store_path(results_file):
+        # Keys only, straight from the primary-key index; failed rows are retried
+        with ResultsStore(results_file, job.key_field, job.output_field) as store:
+            processed = store.done_keys()
+    else:
+        processed = load_processed_qids(results_file, job.key_field)
+    required_col = resource_column(use_vertex)
+    items = [row for row in rows
+             if row.get(job.key_field) and row[job.key_field] not in processed and row.get(required_col)]
+    skipped = len(rows) - len(items)
+    # Questions of one video run back to back: shared video handle, chat history and prompt prefix
+    items = group_by_video(items)
+    if limit is not None:
+        items = items[:limit]
+    return items, skipped
+
+
+def build_scheduler(args: argparse.Namespace, job: InferenceJob, metadata_file: str, results_file: str) -> TailScheduler:
+    """Tail policies selected by --schedule / --hedge / --requeue-passes."""
+    cost_model = None
+    if args.schedule == "ljf":
+        rows = load_metadata_rows(job, metadata_file, args.vertex)
+        video_of = {str(row[job.key_field]): row.get("video_id", "") for row in rows if row.get(job.key_field)}
+        cost_model = CostModel(video_of, load_past_latencies(results_file, job.key_field),
+                               load_video_durations(args.video_durations))
+    hedge = HedgePolicy(args.hedge_quantile, args.hedge_budget) if args.hedge else None
+    if hedge is not None and args.stream:
+        logger.warning("Streamed requests are never hedged; --hedge only applies to structured requests.")
+    return TailScheduler(cost_model, hedge, max(args.requeue_passes, 0))
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m inference",
+                                     description="Headless bulk inference over prepared videos.",
+                                     epilog="Results stores: python -m inference {summary,export,export-failed,import} STORE [CSV]. "
+                                            f"Video preparation: python -m inference {{{INGEST_COMMAND},{PREP_COMMAND},{UPLOAD_COMMAND}}} --help. "
+                                            f"Chat histories: python -m inference {PACK_COMMAND} ANSWERS_DIR. "
+                                            f"Sharded runs: python -m inference {SHARD_COMMAND} --help. "
+                                            f"All CoCoT stages at once: python -m inference {PIPELINE_COMMAND} --help")
+    parser.add_argument("task", choices=TASKS, help="Which notebook flow to run.")
+    parser.add_argument("--model", required=True, help="Model name registered in models/registry.py for the task.")
+    parser.add_argument("--metadata", default=None, help="Video metadata CSV or dataset store directory (default: video_metadata_{vertex,non_vertex}.csv).")
+    parser.add_argument("--results", default=None, help="Output CSV, or a .sqlite results store (default: same CSV location the notebooks use).")
+    parser.add_argument("--questions-model", default="gemini-2.0-flash", help="Model that generated the CoCoT chat histories.")
+    parser.add_argument("--answers-dir", default=None, help="Directory with <video_id>.json chat histories (cocot).")
+    parser.add_argument("--num-questions", type=int, default=5, help="Guideline questions per video (questions).")
+    parser.add_argument("--num-turns", type=int, default=DEFAULT_NUM_TURNS, help="Generated questions answered per video (answers).")
+    parser.add_argument("--limit", type=int, default=None, help="Process at most N items (testing).")
+    parser.add_argument("--vertex", action="store_true", help="Use the Vertex AI backend instead of the Gemini API.")
+    parser.add_argument("--project", default=os.environ.get("GOOGLE_CLOUD_PROJECT"), help="GCP project (Vertex).")
+    parser.add_argument("--location", default=os.environ.get("GOOGLE_CLOUD_LOCATION"), help="GCP region (Vertex).")
+    parser.add_argument("--handle-cache", default=None,
+                        help="Video handle cache file (default: next to the metadata file). Use 'none' to disable persistence.")
+    parser.add_argument("--rpm", type=int, default=None, help="Override the requests-per-minute budget of the model config.")
+    parser.add_argument("--tpm", type=int, default=None, help="Tokens-per-minute budget for the model (default: unlimited).")
+    parser.add_argument("--max-retries", type=int, default=None, help="Override MAX_RETRIES from the model config.")
+    parser.add_argument("--fixed-rate", action="store_true",
+                        help="Use a fixed token bucket instead of adapting the rate to 429 responses.")
+    parser.add_argument("--context-cache", action="store_true",
+                        help="Cache the system prompt + video (+ chat history) once per video and reuse it for every question.")
+    parser.add_argument("--cache-ttl", type=float, default=DEFAULT_CACHE_TTL_SEC, help="Context cache TTL in seconds.")
+    parser.add_argument("--batch-questions", action="store_true",
+                        help="Answer all questions of a video in one structured request (noncot / cot / cocot).")
+    parser.add_argument("--max-batch-size", type=int, default=DEFAULT_MAX_BATCH_SIZE,
+                        help="Most questions per batched request.")
+    parser.add_argument("--response-cache", nargs="?", const=DEFAULT_RESPONSE_CACHE, default=None, metavar="PATH",
+                        help=f"Reuse responses of identical earlier requests (default file: {DEFAULT_RESPONSE_CACHE}).")
+    parser.add_argument("--response-cache-max", type=int, default=DEFAULT_MAX_ENTRIES, help="Responses kept (LRU).")
+    parser.add_argument("--read-only-cache", action="store_true",
+                        help="Serve cached responses but never add new ones (reproducible submissions).")
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream responses (time to first token, tokens/sec); structured requests are never streamed.")
+    parser.add_argument("--stream-cutoff", action="store_true",
+                        help="With --stream: close a multiple-choice stream once its answer line after the thinking block is complete.")
+    parser.add_argument("--partial-interval", type=float, default=None,
+                        help="With --stream and a .sqlite results store: upsert the text so far as a 'Partial' row every N seconds.")
+    parser.add_argument("--request-timeout", type=float, default=None,
+                        help="Cancel (and retry) an attempt with no complete response after N seconds, freeing its slot.")
+    parser.add_argument("--metrics-file", default=None,
+                        help="Periodically write stage latencies / tokens / errors here (.prom: Prometheus text, else JSON).")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_FLUSH_INTERVAL_SEC, help="Seconds between metrics flushes.")
+    parser.add_argument("--schedule", choices=("input", "ljf"), default="input",
+                        help="Start order: metadata order, or longest predicted job first (past latency, video length).")
+    parser.add_argument("--video-durations", nargs="*", default=[DEFAULT_VIDEO_DURATIONS], metavar="PATH",
+                        help="ffprobe output of prepare-videos (probe_cache.json / prep_report.csv) used by --schedule ljf.")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Send a duplicate of requests slower than --hedge-quantile while budget allows; first answer wins.")
+    parser.add_argument("--hedge-quantile", type=float, default=DEFAULT_HEDGE_QUANTILE, help="Latency quantile that triggers a hedge.")
+    parser.add_argument("--hedge-budget", type=float, default=DEFAULT_HEDGE_BUDGET, help="Maximum hedged requests per request.")
+    parser.add_argument("--requeue-passes", type=int, default=DEFAULT_REQUEUE_PASSES,
+                        help="Extra passes over retryable failures (retries exhausted, blocked/empty, expired handles); 0 disables.")
+    parser.add_argument("--shard", type=parse_shard, default=None, metavar="K/N",
+                        help="Process only the videos hashed to shard K of N (set by `shard`).")
+    parser.add_argument("--fake-client", action="store_true", help="Use the offline fake Gemini client.")
+    parser.add_argument("--fake-latency", type=float, default=DEFAULT_FAKE_LATENCY_SEC, help="Per-request latency of the fake client (seconds).")
+    parser.add_argument("--no-progress", action="store_true", help="Disable the progress bar.")
+    parser.add_argument("--log-level", default="INFO")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in STORE_COMMANDS:
+        return store_main(argv)
+    if argv and argv[0] == INGEST_COMMAND:
+        return ingest_main(argv)
+    if argv and argv[0] == PREP_COMMAND:
+        return prep_main(argv)
+    if argv and argv[0] == UPLOAD_COMMAND:
+        return upload_main(argv)
+    if argv and argv[0] == PACK_COMMAND:
+        return pack_main(argv)
+    if argv and argv[0] == DATASET_COMMAND:
+        return dataset_main(argv)
+    if argv and argv[0] == SHARD_COMMAND:
+        return shard_main(argv)
+    if argv and argv[0] == PIPELINE_COMMAND:
+        return pipeline_main(argv)
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    chat_store = ChatHistoryStore(answers_dir_for(args)) if args.task == "cocot" else None
+    job = build_job(args, chat_store)
+    job.tokens_per_minute = args.tpm
+    if args.rpm is not None:
+        job.requests_per_minute = args.rpm
+    job.request_timeout_sec = args.request_timeout
+    if args.stream:
+        job.stream = True
+        job.stream_cutoff = answer_section_complete if args.stream_cutoff else None
+    elif args.stream_cutoff or args.partial_interval is not None:
+        logger.warning("--stream-cutoff / --partial-interval need --stream; ignoring them.")
+    if args.max_retries is not None:
+        job.max_retries = job.retry_policy.max_retries = args.max_retries
+    metadata_file = args.metadata or ("video_metadata_vertex.csv" if args.vertex else "video_metadata_non_vertex.csv")
+    results_file = args.results or default_results_file(args.task, job.model_name, args.questions_model)
+    if args.stream and args.partial_interval is not None:
+        if is_store_path(results_file):
+            job.partial_interval_sec = args.partial_interval
+        else:
+            logger.warning("Partial rows need a .sqlite results store (a CSV row cannot be replaced); ignoring --partial-interval.")
+
+    items, skipped = select_items(job, metadata_file, results_file, args.vertex, args.limit, args.shard)
+    producer = None
+    if isinstance(job, ChatJob):
+        answered = list_answered_videos(job.answers_dir)
+        items = [item for item in items if item["video_id"] not in answered]
+        producer = build_chat_history_async
+    logger.info(f"Prepared {len(items)} new inference tasks. Skipped {skipped}.")
+    if not items:
+        return 0
+    if args.batch_questions:
+        if job.build_batch_contents is None or producer is not None:
+            logger.warning(f"Question batching is not supported for task '{args.task}'; ignoring --batch-questions.")
+        else:
+            num_questions = len(items)
+            items = group_into_batches(items, args.max_batch_size)
+            producer = perform_batch_inference_async
+            logger.info(f"Batched {num_questions} questions into {len(items)} video requests.")
+    if chat_store is not None:
+        # Parse every needed history once, before the event loop starts
+        loaded = chat_store.preload(dict.fromkeys(item["video_id"] for item in items))
+        logger.info(f"Preloaded {loaded} chat histories from {chat_store.answers_dir}.")
+
+    if args.fake_client:
+        from .fake_client import FakeGeminiClient
+        client = FakeGeminiClient(latency_sec=args.fake_latency)
+    else:
+        from .clients import create_genai_client
+        client = create_genai_client(args.vertex, args.project, args.location)
+
+    if args.context_cache:
+        if producer is perform_batch_inference_async:
+            logger.warning("Batched requests send each video once; ignoring --context-cache.")
+        elif job.split_contents is None and producer is None:
+            logger.warning(f"Context caching is not supported for task '{args.task}'; ignoring --context-cache.")
+        else:
+            job.context_cache = ContextCacheManager(client, job.model_name, job.config, ttl_sec=args.cache_ttl)
+            if producer is None: # Chat producers plan their own turns
+                job.context_cache.plan_items(items)
+
+    if args.response_cache:
+        job.response_cache = ResponseCache(args.response_cache, args.response_cache_max, read_only=args.read_only_cache)
+        logger.info(f"Response cache {args.response_cache}: {len(job.response_cache)} entries"
+                    f"{' (read-only)' if args.read_only_cache else ''}.")
+
+    handle_cache_path = args.handle_cache or default_handle_cache_path(metadata_file)
+    video_cache = VideoHandleCache(client, args.vertex,
+                                   persist_path=None if handle_cache_path == "none" else handle_cache_path)
+
+    summary = asyncio.run(run_bulk_inference_async(items, client, job, results_file,
+                                                   use_vertex=args.vertex, show_progress=not args.no_progress,
+                                                   producer=producer, video_cache=video_cache,
+                                                   quota_manager=QuotaManager(adaptive=not args.fixed_rate),
+                                                   metrics_file=args.metrics_file,
+                                                   metrics_interval_sec=args.metrics_interval,
+                                                   scheduler=build_scheduler(args, job, metadata_file, results_file)))
+    if chat_store is not None:
+        logger.info(f"Chat history store: {chat_store.stats()}")
+    if job.response_cache is not None:
+        logger.info(f"Response cache: {job.response_cache.stats()}")
+        job.response_cache.close()
+    return 0 if summary["completed"] == summary["total"] else 1
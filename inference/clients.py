@@ -0,0 +1,58 @@
+import logging
+import os
+from typing import Any, List, Optional, Protocol
+
+logger = logging.getLogger(__name__)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Client Interface
+# ──────────────────────────────────────────────────────────────────────────────
+# The engine only touches `client.aio.models.generate_content` and
+# `client.aio.files.get`. Anything exposing that surface (the real `google.genai`
+# client, or `inference.fake_client.FakeGeminiClient`) can drive a run.
+
+class AsyncModelsAPI(Protocol):
+    async def generate_content(self, *, model: str, contents: List[Any], config: Any = None) -> Any: ...
+
+
+class AsyncFilesAPI(Protocol):
+    async def get(self, *, name: str) -> Any: ...
+
+
+class AsyncAPI(Protocol):
+    models: AsyncModelsAPI
+    files: AsyncFilesAPI
+
+
+class GenAIClient(Protocol):
+    aio: AsyncAPI
+
+
+def create_genai_client(use_vertex: bool, project_id: Optional[str] = None,
+                        location: Optional[str] = None, api_key: Optional[str] = None) -> GenAIClient:
+    """
+    Creates a `google.genai` client for the selected backend.
+
+    Args:
+        use_vertex (bool): True for the Vertex AI backend (ADC auth), False for the Gemini API.
+        project_id (str, optional): GCP project, required for Vertex AI.
+        location (str, optional): GCP region, required for Vertex AI.
+        api_key (str, optional): Gemini API key. Falls back to the GOOGLE_API_KEY env var.
+
+    Returns:
+        GenAIClient: An initialized client.
+    """
+    import google.genai as genai
+
+    if use_vertex:
+        if not project_id or not location:
+            raise ValueError("PROJECT_ID/LOCATION invalid for Vertex AI.")
+        logger.info(f"Initializing Vertex AI client (Project: {project_id}, Loc: {location})")
+        return genai.Client(vertexai=True, project=project_id, location=location)
+
+    effective_api_key = api_key or os.environ.get("GOOGLE_API_KEY")
+    if not effective_api_key:
+        raise ValueError("Gemini API Key required but not found.")
+    logger.info("Initializing Gemini API client (using API Key)")
+    return genai.Client(api_key=effective_api_key, vertexai=False)
@@ -0,0 +1,208 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_TTL_SEC = 900.0
+TTL_REFRESH_MARGIN_SEC = 120.0    # Extend a cache that is still in use this close to expiry
+
+
+def is_cache_unusable_error(exc: BaseException) -> bool:
+    """Errors meaning "this cache cannot be used" (unsupported model, prefix too small, expired cache)."""
+    code = getattr(exc, "code", None)
+    return code in (400, 403, 404) or type(exc).__name__ in ("NotFound", "InvalidArgument", "NotFoundError")
+
+
+@dataclass
+class _CacheEntry:
+    name: Optional[str]            # None once creation failed -> uncached fallback
+    expires_at: float
+    refs: int = 0
+    remaining_uses: Optional[int] = None
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Per-Video Context Cache
+# ──────────────────────────────────────────────────────────────────────────────
+# The system prompt, the video and (CoCoT) the generated Q&A chat are identical
+# for every question of a video. They are stored once as a cached-content entry,
+# and each question sends only its own prompt with `config.cached_content`.
+
+class ContextCacheManager:
+    """
+    Creates and reuses one cached-content entry per key (video), with a refcount and TTL lifecycle.
+
+    * `plan(key, uses)` records how many requests will use a key; the entry is deleted
+      as soon as the last one finishes, instead of being billed for storage until its TTL.
+    * Entries still in use close to expiry get their TTL extended.
+    * When creation fails (model without caching support, prefix below the minimum token
+      count, ...) the key is marked uncacheable and callers fall back to full requests.
+      After `max_failures` failures, caching is disabled for the rest of the run.
+
+    Args:
+        client: Client exposing `client.aio.caches`.
+        model_name (str): Model the caches are created for.
+        config: The job's `GenerateContentConfig`; its `system_instruction` moves into the cache.
+        ttl_sec (float): TTL of new entries.
+        min_uses (int): Planned keys with fewer uses are not cached (a cache costs a create call plus storage).
+        max_failures (int): Creation failures tolerated before caching is disabled.
+    """
+    def __init__(self, client: Any, model_name: str, config: Any = None,
+                 ttl_sec: float = DEFAULT_CACHE_TTL_SEC, min_uses: int = 2, max_failures: int = 3):
+        self.client = client
+        self.model_name = model_name
+        self.config = config
+        self.ttl_sec = ttl_sec
+        self.min_uses = min_uses
+        self.max_failures = max_failures
+        self.enabled = True
+        self._entries: Dict[str, _CacheEntry] = {}
+        self._creating: Dict[str, asyncio.Task] = {}
+        self._planned: Dict[str, int] = {}
+        self.created = 0
+        self.reused = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.deleted = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    # --- Planning ---
+    def plan(self, key: str, uses: int = 1):
+        """Adds `uses` expected requests for `key`."""
+        self._planned[key] = self._planned.get(key, 0) + uses
+
+    def plan_items(self, items: Iterable[Dict], key_field: str = "video_id"):
+        for item in items:
+            self.plan(item.get(key_field, ""))
+
+    # --- Request Config ---
+    def config_for(self, cache_name: str) -> "types.GenerateContentConfig":
+        """The job config pointing at a cache; the system instruction already lives in the cache."""
+        from google.genai import types
+
+        if self.config is None:
+            return types.GenerateContentConfig(cached_content=cache_name)
+        return self.config.model_copy(update={"cached_content": cache_name, "system_instruction": None})
+
+    # --- Lifecycle ---
+    async def _create(self, key: str, prefix: List[Any]) -> _CacheEntry:
+        from google.genai import types
+
+        try:
+            cache = await self.client.aio.caches.create(
+                model=self.model_name,
+                config=types.CreateCachedContentConfig(
+                    contents=prefix,
+                    system_instruction=getattr(self.config, "system_instruction", None),
+                    ttl=f"{int(self.ttl_sec)}s",
+                    display_name=f"prefix-{key}"[:128],
+                ),
+            )
+            self.created += 1
+            logger.debug(f"Created context cache {cache.name} for {key}.")
+            return _CacheEntry(cache.name, time.time() + self.ttl_sec)
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Context caching unavailable for {key} ({type(e).__name__}: {e}). Using full requests.")
+            if self.failures >= self.max_failures and self.enabled:
+                self.enabled = False
+                logger.warning(f"Disabling context caching after {self.failures} failures.")
+            return _CacheEntry(None, float("inf"))
+
+    async def _refresh(self, entry: _CacheEntry):
+        from google.genai import types
+
+        try:
+            await self.client.aio.caches.update(name=entry.name,
+                                                config=types.UpdateCachedContentConfig(ttl=f"{int(self.ttl_sec)}s"))
+            entry.expires_at = time.time() + self.ttl_sec
+        except Exception as e:
+            logger.warning(f"Could not extend context cache {entry.name}: {e}")
+
+    async def acquire(self, key: str, prefix: List[Any]) -> Optional[str]:
+        """
+        Returns the cache name for `key`, creating the cache on first use, or None to send the full request.
+
+        Every call that returns a name must be paired with `release(key)`.
+        """
+        planned = self._planned.get(key)
+        if not self.enabled or (planned is not None and planned < self.min_uses):
+            self.fallbacks += 1
+            return None
+        entry = old = self._entries.get(key)
+        if entry is None or (entry.name is not None and entry.expires_at <= time.time()):
+            task = self._creating.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._create(key, prefix))
+                self._creating[key] = task
+                task.add_done_callback(lambda _t, k=key: self._creating.pop(k, None))
+            else:
+                self.reused += 1 # Another request is already creating it
+            entry = await asyncio.shield(task)
+            if self._entries.get(key) is not entry:
+                entry.remaining_uses = old.remaining_uses if old is not None and old.name else planned
+                self._entries[key] = entry
+        else:
+            self.reused += 1
+        if entry.name is None:
+            self.fallbacks += 1
+            return None
+        if entry.expires_at - time.time() < TTL_REFRESH_MARGIN_SEC:
+            await self._refresh(entry)
+        entry.refs += 1
+        return entry.name
+
+    async def release(self, key: str):
+        """Drops one reference; deletes the cache once every planned use has finished."""
+        entry = self._entries.get(key)
+        if entry is None or entry.name is None:
+            return
+        entry.refs -= 1
+        if entry.remaining_uses is not None:
+            entry.remaining_uses -= 1
+            if entry.remaining_uses <= 0 and entry.refs <= 0:
+                await self._delete(key, entry)
+
+    def invalidate(self, key: str):
+        """Forgets a cache the API rejected (e.g. expired); the next `acquire` recreates it."""
+        entry = self._entries.get(key)
+        if entry is not None and entry.name is not None:
+            entry.expires_at = 0.0 # Treated as expired; the replacement inherits the remaining uses
+            logger.info(f"Context cache for {key} was rejected, recreating on next use.")
+
+    async def _delete(self, key: str, entry: _CacheEntry):
+        self._entries.pop(key, None)
+        try:
+            await self.client.aio.caches.delete(name=entry.name)
+            self.deleted += 1
+        except Exception as e:
+            logger.debug(f"Could not delete context cache {entry.name}: {e}")
+
+    async def close(self):
+        """Deletes every cache still alive (the rest expire on their own)."""
+        for key, entry in list(self._entries.items()):
+            if entry.name is not None:
+                await self._delete(key, entry)
+
+    # --- Accounting ---
+    def record_usage(self, response: Any):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_token_count", None) or 0
+        self.cached_tokens += getattr(usage, "cached_content_token_count", None) or 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "created": self.created, "reused": self.reused, "deleted": self.deleted,
+            "fallbacks": self.fallbacks, "failures": self.failures,
+            "prompt_tokens": self.prompt_tokens, "cached_tokens": self.cached_tokens,
+            "cached_share": round(self.cached_tokens / self.prompt_tokens, 3) if self.prompt_tokens else 0.0,
+        }
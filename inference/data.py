@@ -0,0 +1,118 @@
+import ast
+import logging
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Set
+
+from .dataset_store import DatasetStore, is_dataset_store
+
+logger = logging.getLogger(__name__)
+
+
+def resource_column(use_vertex: bool) -> str:
+    """Name of the metadata column holding the uploaded video handle."""
+    return 'gcs_uri' if use_vertex else 'file_api_name'
+
+
+# --- Resume Helpers ---
+def load_processed_qids(filename: str, key_field: str = 'qid') -> Set[str]:
+    """Returns the set of keys (qids or video_ids) already present in a results CSV."""
+    processed = set()
+    if Path(filename).is_file():
+        try:
+            import pandas as pd
+            df = pd.read_csv(filename, usecols=[key_field], dtype={key_field: str}, on_bad_lines='warn')
+            processed = set(df[key_field].dropna().unique())
+            logger.info(f"Loaded {len(processed)} processed {key_field}s from {filename}")
+        except Exception as e:
+            logger.warning(f"Could not read {key_field}s from {filename}: {e}. Assuming zero processed.")
+    return processed
+
+
+def group_by_video(items: List[Dict]) -> List[Dict]:
+    """Stable reorder so all questions of a video are adjacent (first-seen video order)."""
+    groups: Dict[str, List[Dict]] = defaultdict(list)
+    for item in items:
+        groups[item.get('video_id', '')].append(item)
+    return [item for group in groups.values() for item in group]
+
+
+# --- Metadata Loading ---
+def load_metadata_for_inference(metadata_file: str, use_vertex: bool) -> Dict[str, List[Dict]]:
+    """Loads per-question metadata grouped by video. Returns Dict[video_id, List[question_dict]]."""
+    required_col = resource_column(use_vertex)
+    if is_dataset_store(metadata_file):
+        video_questions = DatasetStore(metadata_file).load_for_inference(required_col)
+        if not video_questions:
+            logger.warning(f"No videos found with '{required_col}' in {metadata_file}. Check Step 4.")
+        logger.info(f"Loaded {len(video_questions)} videos ({video_questions.num_questions()} questions) from dataset store.")
+        return video_questions
+    if not Path(metadata_file).is_file(): return {}
+    video_questions = defaultdict(list)
+    try:
+        import pandas as pd # Imported on first use; dataset stores and `--help` never need it
+        df = pd.read_csv(metadata_file, dtype=str).fillna('')
+        if 'video_id' not in df.columns or required_col not in df.columns:
+            logger.error(f"Metadata missing 'video_id' or '{required_col}'.")
+            return {}
+        valid_df = df[df['video_id'].astype(bool) & df[required_col].astype(bool)]
+        if len(valid_df) == 0:
+            logger.warning(f"No videos found with '{required_col}' in {metadata_file}. Check Step 4.")
+            return {}
+        for video_id, group in valid_df.groupby('video_id'):
+            video_questions[video_id] = group.to_dict('records')
+        logger.info(f"Loaded {len(video_questions)} videos ({len(valid_df)} questions) with valid IDs for inference.")
+        return dict(video_questions)
+    except Exception as e:
+        logger.error(f"Error loading metadata for inference: {e}", exc_info=True)
+        return {}
+
+
+def load_metadata_questions_generation(metadata_file: str, use_vertex: bool) -> Dict[str, Dict]:
+    """Loads video metadata where each video_id is unique. Returns Dict[video_id, metadata_dict]."""
+    required_col = resource_column(use_vertex)
+    if is_dataset_store(metadata_file):
+        video_metadata = DatasetStore(metadata_file).load_for_questions_generation(required_col)
+        logger.info(f"Loaded {len(video_metadata)} unique videos from dataset store.")
+        return video_metadata
+    if not Path(metadata_file).is_file(): return {}
+    try:
+        import pandas as pd
+        df = pd.read_csv(metadata_file, dtype=str).fillna('')
+        if 'video_id' not in df.columns or required_col not in df.columns:
+            logger.error(f"Metadata missing 'video_id' or '{required_col}'.")
+            return {}
+        valid_df = df[df['video_id'].astype(bool) & df[required_col].astype(bool)]
+        if len(valid_df) == 0:
+            logger.warning(f"No videos found with '{required_col}' in {metadata_file}. Check Step 4.")
+            return {}
+        unique_df = valid_df.drop_duplicates(subset='video_id', keep='first')
+        video_metadata = {row['video_id']: row for row in unique_df.to_dict('records')}
+        logger.info(f"Loaded {len(video_metadata)} unique videos for inference.")
+        return video_metadata
+    except Exception as e:
+        logger.error(f"Error loading metadata for inference: {e}", exc_info=True)
+        return {}
+
+
+def get_questions_for_video(questions_file: str) -> Dict[str, List[str]]:
+    """Loads generated guideline questions (questions.csv) per video."""
+    if not Path(questions_file).is_file(): return {}
+    video_questions = {}
+    try:
+        import pandas as pd
+        df = pd.read_csv(questions_file, dtype=str).fillna('')
+        if 'video_id' not in df.columns or 'questions' not in df.columns:
+            logger.error("Questions file missing 'video_id' or 'questions'.")
+            return {}
+        valid_df = df[df['video_id'].astype(bool) & df['questions'].astype(bool)]
+        for video_id, question_str in valid_df.drop_duplicates(subset='video_id')[['video_id', 'questions']].itertuples(index=False):
+            try:
+                video_questions[video_id] = ast.literal_eval(question_str)
+            except (ValueError, SyntaxError):
+                logger.warning(f"Could not parse questions for video {video_id}.")
+        logger.info(f"Loaded generated questions for {len(video_questions)} videos from {questions_file}.")
+        return video_questions
+    except Exception as e:
+        logger.error(f"Error loading questions: {e}", exc_info=True)
+        return {}
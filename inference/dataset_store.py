@@ -0,0 +1,264 @@
+import argparse
+import csv
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterator, List, Mapping, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+DATASET_COMMAND = "build-dataset"
+QUESTIONS_FILE = "questions.arrow"
+INDEX_FILE = "video_index.arrow"
+VIDEOS_FILE = "videos.arrow"
+# Per-video columns, written by `prepare-videos` / `upload-videos`; everything else is per question
+VIDEO_COLUMNS = ('local_path', 'gcs_uri', 'file_api_name', 'status', 'content_sha256')
+CATEGORICAL_COLUMNS = ('question_type', 'capability') # Few distinct values -> dictionary encoded
+
+
+def is_dataset_store(path: str) -> bool:
+    """True for a directory written by `build_dataset_store` (instead of a METADATA_FILE CSV)."""
+    return bool(path) and (Path(path) / QUESTIONS_FILE).is_file()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Building the Store
+# ──────────────────────────────────────────────────────────────────────────────
+# Layout of the store directory (Arrow IPC files, memory-mapped when read):
+#   questions.arrow    one row per question, sorted by video_id (a video's questions are contiguous)
+#   video_index.arrow  video_id -> (offset, length) of its rows in questions.arrow
+#   videos.arrow       one row per video with VIDEO_COLUMNS; the only file rewritten by updates
+# Arrow IPC rather than Parquet: Parquet pages are compressed and must be decoded on
+# every load, while an IPC file is mapped and sliced without copying.
+
+def _write_table(path: Path, table: "pa.Table"):
+    import pyarrow as pa # Imported on first use; CSV metadata runs and `--help` never need it
+    import pyarrow.ipc as pa_ipc
+    tmp_path = path.with_name(path.name + ".tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa_ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+
+def _read_table(path: Path) -> "pa.Table":
+    """Zero-copy read: the columns point into the memory-mapped file."""
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    return pa_ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+
+def _read_csv_as_strings(csv_path: str) -> "pa.Table":
+    """Reads a CSV with every column as a non-null string (like `pd.read_csv(dtype=str).fillna('')`)."""
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        header = next(csv.reader(f), [])
+    return pa_csv.read_csv(csv_path, convert_options=pa_csv.ConvertOptions(
+        column_types={name: pa.string() for name in header}, strings_can_be_null=False))
+
+
+def _video_rows(table: "pa.Table") -> Dict[str, Dict[str, str]]:
+    """First non-empty value of each VIDEO_COLUMN per video."""
+    columns = [c for c in VIDEO_COLUMNS if c in table.column_names]
+    videos: Dict[str, Dict[str, str]] = {}
+    if not columns:
+        return videos
+    values = {c: table.column(c).to_pylist() for c in ["video_id", *columns]}
+    for i, video_id in enumerate(values["video_id"]):
+        if not video_id:
+            continue
+        row = videos.setdefault(video_id, {})
+        for c in columns:
+            if values[c][i] and not row.get(c):
+                row[c] = values[c][i]
+    return videos
+
+
+def _videos_table(videos: Dict[str, Dict[str, str]]) -> "pa.Table":
+    import pyarrow as pa
+    video_ids = sorted(videos)
+    data = {"video_id": video_ids}
+    data.update({c: [videos[v].get(c) or "" for v in video_ids] for c in VIDEO_COLUMNS})
+    return pa.table(data, schema=pa.schema([(name, pa.string()) for name in data]))
+
+
+def build_dataset_store(root: str, dataset: Union[str, "pa.Table"], metadata_file: Optional[str] = None) -> "DatasetStore":
+    """
+    Converts the dataset (CSV path, or a `pa.Table` such as `load_dataset(...).data.table`) into a store.
+
+    Video columns already present in `dataset` (i.e. it is a METADATA_FILE) or in an
+    existing `metadata_file` are carried over, so a run can switch to the store without
+    re-uploading anything.
+
+    Returns:
+        DatasetStore: The opened store.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    start = time.perf_counter()
+    table = _read_csv_as_strings(dataset) if isinstance(dataset, str) else dataset
+    if "video_id" not in table.column_names or "qid" not in table.column_names:
+        raise ValueError("The dataset needs 'qid' and 'video_id' columns.")
+    table = table.cast(pa.schema([(f.name, pa.string()) for f in table.schema])) # Same values as dtype=str
+    table = table.filter(pc.fill_null(pc.not_equal(table.column("video_id"), ""), False))
+
+    videos = _video_rows(table)
+    if metadata_file and Path(metadata_file).is_file():
+        for video_id, row in _video_rows(_read_csv_as_strings(metadata_file)).items():
+            videos.setdefault(video_id, {}).update(row)
+    for video_id in table.column("video_id").unique().to_pylist():
+        videos.setdefault(video_id, {}).setdefault("status", "pending")
+
+    # Questions: per-question columns only, grouped by video (stable, so qid order is kept)
+    table = table.drop_columns([c for c in VIDEO_COLUMNS if c in table.column_names])
+    table = table.take(pc.sort_indices(table, sort_keys=[("video_id", "ascending")]))
+    for name in CATEGORICAL_COLUMNS:
+        if name in table.column_names:
+            table = table.set_column(table.column_names.index(name), name, pc.dictionary_encode(table.column(name)))
+    table = table.combine_chunks()
+
+    video_ids, offsets, lengths = [], [], []
+    for offset, video_id in enumerate(table.column("video_id").to_pylist()):
+        if video_ids and video_ids[-1] == video_id:
+            lengths[-1] += 1
+        else:
+            video_ids.append(video_id)
+            offsets.append(offset)
+            lengths.append(1)
+
+    root_path = Path(root)
+    root_path.mkdir(parents=True, exist_ok=True)
+    _write_table(root_path / QUESTIONS_FILE, table)
+    _write_table(root_path / INDEX_FILE, pa.table({"video_id": pa.array(video_ids, pa.string()),
+                                                   "offset": pa.array(offsets, pa.int64()),
+                                                   "length": pa.array(lengths, pa.int32())}))
+    _write_table(root_path / VIDEOS_FILE, _videos_table(videos))
+    logger.info(f"Built dataset store {root}: {table.num_rows} questions, {len(video_ids)} videos "
+                f"in {time.perf_counter() - start:.2f}s.")
+    return DatasetStore(root)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Reading & Updating
+# ──────────────────────────────────────────────────────────────────────────────
+
+class DatasetStore:
+    """
+    Memory-mapped question table with a video_id index, plus a small mutable per-video table.
+
+    Opening the store maps the files and loads the index; question rows are only
+    converted to dicts for the videos that are actually read.
+
+    Args:
+        root (str): Store directory (see `build_dataset_store`).
+    """
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.questions = _read_table(self.root / QUESTIONS_FILE)
+        index = _read_table(self.root / INDEX_FILE)
+        self.index: Dict[str, Tuple[int, int]] = dict(zip(
+            index.column("video_id").to_pylist(),
+            zip(index.column("offset").to_pylist(), index.column("length").to_pylist())))
+        self.videos = self._load_videos()
+
+    def _load_videos(self) -> Dict[str, Dict[str, str]]:
+        path = self.root / VIDEOS_FILE
+        if not path.is_file():
+            return {}
+        return {row.pop("video_id"): row for row in _read_table(path).to_pylist()}
+
+    def __len__(self) -> int:
+        return self.questions.num_rows
+
+    def __contains__(self, video_id: str) -> bool:
+        return video_id in self.index
+
+    # --- Lookup ---
+    def questions_table(self, video_id: str) -> "pa.Table":
+        """The video's question rows as a zero-copy slice (empty for unknown videos)."""
+        offset, length = self.index.get(video_id, (0, 0))
+        return self.questions.slice(offset, length)
+
+    def questions_for_video(self, video_id: str) -> List[Dict[str, str]]:
+        """Question rows of one video merged with its video columns (the METADATA_FILE row shape)."""
+        video = {c: "" for c in VIDEO_COLUMNS}
+        video.update(self.videos.get(video_id, {}))
+        return [{**{k: "" if v is None else v for k, v in row.items()}, **video}
+                for row in self.questions_table(video_id).to_pylist()]
+
+    def ready_videos(self, required_col: str) -> List[str]:
+        """Videos with a non-empty `required_col` (e.g. an uploaded handle), in store order."""
+        return [v for v in self.index if self.videos.get(v, {}).get(required_col)]
+
+    def load_for_inference(self, required_col: str) -> "VideoQuestions":
+        """Dict[video_id, List[question_dict]] view of the ready videos (rows built on access)."""
+        return VideoQuestions(self, self.ready_videos(required_col))
+
+    def load_for_questions_generation(self, required_col: str) -> Dict[str, Dict[str, str]]:
+        """Dict[video_id, first question row] of the ready videos."""
+        video_metadata = {}
+        for video_id in self.ready_videos(required_col):
+            offset, _ = self.index[video_id]
+            row = {k: "" if v is None else v for k, v in self.questions.slice(offset, 1).to_pylist()[0].items()}
+            video_metadata[video_id] = {**row, **{c: "" for c in VIDEO_COLUMNS}, **self.videos.get(video_id, {})}
+        return video_metadata
+
+    # --- Updates ---
+    def update_videos(self, video_updates: Dict[str, Dict]):
+        """Applies per-video column updates; only the small videos table is rewritten."""
+        for video_id, update in video_updates.items():
+            row = self.videos.setdefault(video_id, {})
+            row.update({k: str(v) for k, v in update.items() if k in VIDEO_COLUMNS and v is not None})
+        _write_table(self.root / VIDEOS_FILE, _videos_table(self.videos))
+        logger.info(f"Dataset store '{self.root}' updated with {len(video_updates)} video records.")
+
+    def stats(self) -> Dict[str, int]:
+        return {"questions": len(self), "videos": len(self.index),
+                "mapped_mb": round(self.questions.nbytes / 2**20, 1)}
+
+
+class VideoQuestions(Mapping):
+    """Read-only mapping video_id -> question rows, materialized per video on access."""
+    def __init__(self, store: DatasetStore, video_ids: List[str]):
+        self._store = store
+        self._video_ids = video_ids
+        self._members = set(video_ids)
+
+    def __getitem__(self, video_id: str) -> List[Dict[str, str]]:
+        if video_id not in self._members:
+            raise KeyError(video_id)
+        return self._store.questions_for_video(video_id)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._video_ids)
+
+    def __len__(self) -> int:
+        return len(self._video_ids)
+
+    def num_questions(self) -> int:
+        return sum(self._store.index[v][1] for v in self._video_ids)
+
+
+# --- Command Line ---
+def dataset_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference build-dataset DATASET_CSV STORE_DIR`."""
+    parser = argparse.ArgumentParser(prog=f"python -m inference {DATASET_COMMAND}",
+                                     description="Convert the dataset (+ metadata) CSV into an indexed Arrow store.")
+    parser.add_argument("command", choices=(DATASET_COMMAND,))
+    parser.add_argument("dataset", help="DATASET_CSV, or a METADATA_FILE (its video columns are kept).")
+    parser.add_argument("output", help="Store directory, then usable as --metadata.")
+    parser.add_argument("--metadata", default=None, help="Existing METADATA_FILE whose video columns are merged in.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    if not Path(args.dataset).is_file():
+        parser.error(f"{args.dataset} does not exist.")
+    store = build_dataset_store(args.output, args.dataset, args.metadata)
+    logger.info(f"Dataset store: {store.stats()}")
+    return 0
@@ -0,0 +1,548 @@
+import asyncio
+import csv
+import logging
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from tqdm import tqdm
+
+from .batching import split_batch_answers
+from .context_cache import ContextCacheManager, is_cache_unusable_error
+from .jobs import InferenceJob
+from .metrics import DEFAULT_FLUSH_INTERVAL_SEC, DEFAULT_METRICS, flush_periodically
+from .rate_limiter import DEFAULT_QUOTAS, AsyncRateLimiter, QuotaManager
+from .response_cache import request_key, video_key_for
+from .results_store import PARTIAL_STATUS, ResultsStore, is_store_path
+from .retry import is_handle_error, is_retryable_error, is_throttle_error, retry_after_seconds
+from .scheduling import RequeueTap, TailScheduler
+from .streaming import RequestTimeout, StreamedResponse, stream_generate
+from .video_cache import VideoHandleCache, fetch_video_part
+
+logger = logging.getLogger(__name__)
+
+
+def finish_reason_of(response: Any) -> str:
+    candidates = getattr(response, "candidates", None)
+    if candidates and getattr(candidates[0], "finish_reason", None) is not None:
+        return candidates[0].finish_reason.name
+    return "UNKNOWN"
+
+
+def total_tokens_of(response: Any) -> Optional[int]:
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None) if usage is not None else None
+
+
+# --- Video Handle Resolution ---
+async def resolve_video_part(client: Any, item: Dict, use_vertex: bool,
+                             video_cache: Optional[VideoHandleCache] = None) -> Any:
+    """Resolves the video handle for a metadata row, through `video_cache` when given."""
+    if video_cache is not None:
+        return await video_cache.get_part(item)
+    return await fetch_video_part(client, item, use_vertex)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Producer: single request
+# ──────────────────────────────────────────────────────────────────────────────
+
+class RetriesExhausted(Exception):
+    """Raised by `generate_with_retries` when a retryable error outlasts the job's `RetryPolicy`."""
+    def __init__(self, last_error: BaseException):
+        super().__init__(f"Max Retries ({type(last_error).__name__}) - {last_error}")
+        self.last_error = last_error
+
+
+async def generate_with_retries(
+    client: Any,
+    job: InferenceJob,
+    contents: List[Any],
+    semaphore: asyncio.Semaphore,
+    rate_limiter: Optional[AsyncRateLimiter],
+    label: str = "",
+    config: Any = None,
+    on_text: Optional[Callable[[str], bool]] = None,
+) -> Any:
+    """
+    Sends one `generate_content` request (with `config`, default `job.config`), retrying quota / transient errors with backoff.
+
+    The semaphore is held only while the request is in flight, never during backoff,
+    so a throttled request does not block other work. Backoff follows `job.retry_policy`
+    (full jitter, server `retryDelay`, overall deadline), and every outcome is reported
+    back to the rate limiter so an adaptive limiter can track the real quota.
+    With `job.stream`, unstructured requests are streamed (see `streaming.stream_generate`,
+    which calls `on_text`), recording time to first token and output tokens/sec.
+    An attempt running past `job.request_timeout_sec` is cancelled and retried as a 504.
+    With `job.hedge_policy`, unstreamed attempts slower than its latency quantile are hedged.
+    """
+    policy = job.retry_policy
+    config = job.config if config is None else config
+    start_time = time.monotonic()
+    attempt = 0
+    metrics = DEFAULT_METRICS
+    while True:
+        charged = 0
+        try:
+            wait_start = time.perf_counter()
+            async with semaphore:
+                metrics.observe("semaphore_wait", time.perf_counter() - wait_start)
+                if rate_limiter:
+                    with metrics.timer("limiter_wait"):
+                        charged = await rate_limiter.acquire()
+                logger.debug(f"{label}: Attempt {attempt + 1} sending request...")
+                if job.stream and getattr(config, "response_schema", None) is None:
+                    request = stream_generate(client, job.model_name, contents, config, on_text)
+                elif job.hedge_policy is not None:
+                    request = job.hedge_policy.run(
+                        lambda: client.aio.models.generate_content(model=job.model_name, contents=contents, config=config),
+                        semaphore, rate_limiter, label)
+                else:
+                    request = client.aio.models.generate_content(model=job.model_name, contents=contents, config=config)
+                with metrics.timer("generate_content"):
+                    try:
+                        response = await asyncio.wait_for(request, timeout=job.request_timeout_sec)
+                    except asyncio.TimeoutError:
+                        raise RequestTimeout(f"No complete response within {job.request_timeout_sec:g}s.") from None
+        except Exception as e:
+            metrics.record_error(e)
+            if not is_retryable_error(e):
+                raise
+            if rate_limiter and is_throttle_error(e):
+                rate_limiter.record_throttle()
+            backoff = policy.backoff(attempt, retry_after_seconds(e))
+            if not policy.can_retry(attempt, time.monotonic() - start_time, backoff):
+                raise RetriesExhausted(e)
+            logger.warning(f"{label}: {type(e).__name__} on attempt {attempt + 1}, retrying in {backoff:.1f}s.")
+            metrics.observe("retry_backoff", backoff)
+            await asyncio.sleep(backoff)
+            attempt += 1
+            continue
+        metrics.record_response(response)
+        if isinstance(response, StreamedResponse):
+            if response.ttft_sec is not None:
+                metrics.observe("time_to_first_token", response.ttft_sec)
+            if response.tokens_per_sec is not None:
+                metrics.observe_value("output_tokens_per_sec", response.tokens_per_sec)
+            logger.debug(f"{label}: streamed, first token {response.ttft_sec or 0:.2f}s, "
+                         f"{response.tokens_per_sec or 0:.0f} tokens/s{' (cut off)' if response.cut_off else ''}.")
+        if rate_limiter:
+            rate_limiter.record_success(total_tokens_of(response), charged)
+        return response
+
+
+async def generate_with_context_cache(
+    client: Any,
+    job: InferenceJob,
+    key: str,
+    prefix: List[Any],
+    suffix: List[Any],
+    full_contents: List[Any],
+    semaphore: asyncio.Semaphore,
+    rate_limiter: Optional[AsyncRateLimiter],
+    label: str = "",
+    on_text: Optional[Callable[[str], bool]] = None,
+) -> Any:
+    """
+    Sends `suffix` against the cached `prefix` of `key` (see `ContextCacheManager`),
+    or `full_contents` when caching is unavailable or the cache is rejected.
+    """
+    cache: ContextCacheManager = job.context_cache
+    cache_name = await cache.acquire(key, prefix)
+    if cache_name is None:
+        return await generate_with_retries(client, job, full_contents, semaphore, rate_limiter, label, on_text=on_text)
+    try:
+        response = await generate_with_retries(client, job, suffix, semaphore, rate_limiter, label,
+                                               config=cache.config_for(cache_name), on_text=on_text)
+    except Exception as e:
+        if not is_cache_unusable_error(e):
+            raise
+        cache.invalidate(key)
+        logger.warning(f"{label}: Cached request rejected ({e}), retrying without the cache.")
+        response = await generate_with_retries(client, job, full_contents, semaphore, rate_limiter, label,
+                                               on_text=on_text)
+    finally:
+        await cache.release(key)
+    cache.record_usage(response)
+    return response
+
+
+async def generate_memoized(
+    job: InferenceJob,
+    item: Dict,
+    contents: List[Any],
+    send: Callable[[], Awaitable[Any]],
+    config: Any = None,
+) -> Any:
+    """
+    Serves the request from `job.response_cache` when it was answered before, otherwise awaits `send()` and stores the response.
+
+    The lookup happens before `send` takes a semaphore slot or a rate-limiter token,
+    so a memoized request costs neither. `contents` / `config` (default `job.config`)
+    describe the request as a whole; the video is keyed by `video_key_for(item)`.
+    """
+    cache = job.response_cache
+    if cache is None:
+        return await send()
+    config = job.config if config is None else config
+    key = request_key(job.model_name, config, contents, video_key_for(item))
+    cached = await asyncio.to_thread(cache.get, key, config)
+    if cached is not None:
+        return cached
+    response = await send()
+    await asyncio.to_thread(cache.put, key, response, job.model_name)
+    return response
+
+
+async def perform_inference_single_async(
+    item: Dict,
+    client: Any,
+    job: InferenceJob,
+    semaphore: asyncio.Semaphore,
+    rate_limiter: Optional[AsyncRateLimiter],
+    results_queue: asyncio.Queue,
+    use_vertex: bool = False,
+    video_cache: Optional[VideoHandleCache] = None,
+) -> None: # Return None as result is put in queue
+    """
+    Async inference for one item (question or video), putting the result into a queue.
+    """
+    key = item.get(job.key_field, "?")
+    label = f"{job.key_field} {key} (Async)"
+    start_time = time.time()
+
+    def make_result(output: Any, status: str, finish_reason: str = "N/A", duration: Optional[float] = None,
+                    error: Optional[BaseException] = None) -> Dict:
+        result = {job.key_field: key, job.output_field: output, "status": status, "finish_reason": finish_reason,
+                  "duration": time.time() - start_time if duration is None else duration}
+        if error is not None and is_handle_error(error):
+            result["handle_error"] = True # Not written; lets a requeue pass re-resolve the video
+        return result
+
+    # --- Prepare Inputs ---
+    try:
+        video_part = await resolve_video_part(client, item, use_vertex, video_cache)
+        if video_part is None: raise RuntimeError("Video part preparation failed.")
+        contents = job.build_contents(item, video_part)
+    except (ValueError, FileNotFoundError, RuntimeError) as e:
+        logger.error(f"{label}: Input Error - {e}")
+        await results_queue.put(make_result(f"ERROR: Input Fail - {e}", "Failed (Input)", duration=0, error=e))
+        return
+    except Exception as e:
+        logger.error(f"{label}: Unexpected Input Prep Error: {e}", exc_info=True)
+        await results_queue.put(make_result(f"ERROR: Input Prep Failed Unexpectedly - {e}", "Failed (Input Prep)", duration=0))
+        return
+
+    # --- Streaming: early cut-off and periodic partial rows ---
+    last_partial = time.monotonic()
+
+    def on_text(text: str) -> bool:
+        nonlocal last_partial
+        if job.partial_interval_sec is not None and time.monotonic() - last_partial >= job.partial_interval_sec:
+            last_partial = time.monotonic()
+            results_queue.put_nowait(make_result(text, PARTIAL_STATUS, "STREAMING", duration=-1))
+        return job.stream_cutoff is not None and job.stream_cutoff(item, text)
+
+    # --- Perform Inference with Retries, Semaphore, and Rate Limiting ---
+    try:
+        async def send() -> Any:
+            if job.context_cache is not None and job.split_contents is not None:
+                prefix, suffix = job.split_contents(item, video_part)
+                return await generate_with_context_cache(client, job, item.get("video_id", key), prefix, suffix,
+                                                         contents, semaphore, rate_limiter, label, on_text)
+            return await generate_with_retries(client, job, contents, semaphore, rate_limiter, label, on_text=on_text)
+
+        response = await generate_memoized(job, item, contents, send)
+    except RetriesExhausted as e:
+        await results_queue.put(make_result(f"ERROR: {e}", "Failed (Retries)"))
+        return
+    except Exception as e:
+        await results_queue.put(make_result(f"ERROR: - {e}", "Failed (Unexpected Error)", error=e))
+        return
+
+    # Process Response
+    status, reason = "Success", finish_reason_of(response)
+    try:
+        answer = job.parse_response(response)
+    except (ValueError, AttributeError) as ve:
+        status = "Blocked/Empty"
+        answer = f"ERROR: {status}. ValueError: {ve}. "
+
+    await results_queue.put(make_result(answer, status, reason))
+    logger.debug(f"{label}: {status} ({time.time()-start_time:.2f}s Total). Result queued.")
+
+
+async def perform_batch_inference_async(
+    item: Dict,
+    client: Any,
+    job: InferenceJob,
+    semaphore: asyncio.Semaphore,
+    rate_limiter: Optional[AsyncRateLimiter],
+    results_queue: asyncio.Queue,
+    use_vertex: bool = False,
+    video_cache: Optional[VideoHandleCache] = None,
+) -> None:
+    """
+    Answers all questions of one video (`item["batch"]`, see `batching.group_into_batches`) in one request.
+
+    Answers are split back out per qid; every question missing or malformed in the
+    response (or all of them, if the batched request fails) is answered with
+    `perform_inference_single_async`. A batched answer's `duration` is the request
+    time divided by the number of questions it answered.
+    """
+    questions = item["batch"]
+    run_single = lambda q: perform_inference_single_async(q, client, job, semaphore, rate_limiter,
+                                                          results_queue, use_vertex, video_cache)
+    if len(questions) == 1 or job.build_batch_contents is None:
+        await asyncio.gather(*(run_single(q) for q in questions))
+        return
+
+    qids = [q[job.key_field] for q in questions]
+    label = f"video_id {item.get('video_id', '?')} ({len(qids)} questions, batched)"
+    start_time = time.time()
+    answers: Dict[str, str] = {}
+    reason = "N/A"
+    try:
+        video_part = await resolve_video_part(client, item, use_vertex, video_cache)
+        if video_part is None: raise RuntimeError("Video part preparation failed.")
+        contents, config = job.build_batch_contents(questions, video_part)
+        response = await generate_memoized(
+            job, item, contents,
+            lambda: generate_with_retries(client, job, contents, semaphore, rate_limiter, label, config=config),
+            config=config)
+        answers = split_batch_answers(response, qids)
+        reason = finish_reason_of(response)
+    except Exception as e:
+        logger.warning(f"{label}: Batched request failed ({e}), answering the questions one by one.")
+
+    duration = (time.time() - start_time) / max(len(answers), 1)
+    for qid, answer in answers.items():
+        await results_queue.put({job.key_field: qid, job.output_field: answer, "status": "Success",
+                                 "finish_reason": reason, "duration": duration})
+
+    missing = [q for q in questions if q[job.key_field] not in answers]
+    if missing:
+        if answers:
+            logger.warning(f"{label}: {len(missing)} answers missing or malformed ({reason}), falling back to single calls.")
+        await asyncio.gather(*(run_single(q) for q in missing))
+    logger.debug(f"{label}: {len(answers)} batched, {len(missing)} single ({time.time()-start_time:.2f}s Total).")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Consumer: CSV / results store writer
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _append_rows(filename: str, fieldnames: List[str], rows: List[Dict], write_header: bool):
+    with open(filename, 'a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames, extrasaction='ignore')
+        if write_header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+async def results_writer_task(
+    queue: asyncio.Queue,
+    filename: str,
+    fieldnames: List[str],
+    write_batch_size: int = 20, # How many results to buffer before writing
+    write_interval_sec: float = 10.0, # Max time between writes
+    store: Optional[ResultsStore] = None,
+):
+    """
+    Gets results from queue and writes them in batches. A `None` item stops the writer.
+
+    Batches are appended to the CSV `filename`, or upserted into `store` (one
+    transaction per batch) when one is given.
+    """
+    def write_batch(rows: List[Dict], write_header: bool):
+        if store is not None:
+            store.write_many(rows)
+        else:
+            _append_rows(filename, fieldnames, rows, write_header)
+
+    results_buffer = []
+    last_write_time = time.monotonic()
+    file_exists = Path(filename).is_file()
+    logger.info(f"Writer task started. Writing results to {filename}")
+
+    while True:
+        try:
+            result = await asyncio.wait_for(queue.get(), timeout=write_interval_sec)
+            queue.task_done()
+            DEFAULT_METRICS.set_gauge("writer_queue_depth", queue.qsize())
+            if result is None: # Signal to terminate
+                logger.info("Writer task received termination signal.")
+                break
+            if isinstance(result, dict):
+                if result.get("status") == PARTIAL_STATUS and store is None:
+                    continue # An appended CSV row cannot be replaced later; partial text goes to stores only
+                duration = result.pop("duration", -1)
+                if duration >= 0:
+                    DEFAULT_METRICS.observe("item_total", duration)
+                result["duration_sec"] = round(duration, 2) if duration >= 0 else None
+                results_buffer.append(result)
+            else:
+                logger.warning(f"Writer task received non-dict item: {result}")
+        except asyncio.TimeoutError:
+            pass # Flush below if the interval elapsed
+
+        buffer_size = len(results_buffer)
+        time_since_last_write = time.monotonic() - last_write_time
+        if buffer_size > 0 and (buffer_size >= write_batch_size or time_since_last_write >= write_interval_sec):
+            logger.debug(f"Writing batch of {buffer_size} results to {filename}...")
+            try:
+                # File I/O happens off the event loop so producers keep running
+                with DEFAULT_METRICS.timer("writer_batch"):
+                    await asyncio.to_thread(write_batch, results_buffer, not file_exists)
+                file_exists = True
+                results_buffer = []
+                last_write_time = time.monotonic()
+            except OSError as e:
+                logger.error(f"IOError writing results batch to {filename}: {e}. Will retry on next flush.")
+
+    # --- Cleanup: Write any remaining items after receiving None signal ---
+    if results_buffer:
+        logger.info(f"Writing final remaining {len(results_buffer)} results...")
+        try:
+            await asyncio.to_thread(write_batch, results_buffer, not file_exists)
+        except Exception as e:
+            logger.error(f"Error writing final results batch: {e}")
+
+    logger.info("Writer task finished.")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Orchestration
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def run_bulk_inference_async(
+    items: List[Dict],
+    client: Any,
+    job: InferenceJob,
+    results_file: str,
+    use_vertex: bool = False,
+    show_progress: bool = True,
+    producer: Optional[Callable[..., Awaitable[None]]] = None,
+    video_cache: Optional[VideoHandleCache] = None,
+    quota_manager: Optional[QuotaManager] = None,
+    metrics_file: Optional[str] = None,
+    metrics_interval_sec: float = DEFAULT_FLUSH_INTERVAL_SEC,
+    scheduler: Optional[TailScheduler] = None,
+) -> Dict[str, Any]:
+    """
+    Runs the producer → semaphore → rate limiter → writer-queue pipeline over `items`.
+
+    `producer` defaults to `perform_inference_single_async`; multi-request flows such as
+    `chat_builder.build_chat_history_async` or `perform_batch_inference_async` (one
+    item per video) plug in with the same signature. A
+    `VideoHandleCache` is created when none is passed, so each video is resolved once.
+    The rate limiter comes from `quota_manager` (default: `DEFAULT_QUOTAS`), so runs of
+    the same model in one process share a single RPM/TPM budget. A `results_file`
+    ending in `.sqlite` / `.db` is written through `ResultsStore` instead of as CSV.
+    Context caches of `job.context_cache` still alive at the end are deleted.
+    Stage latencies, tokens and error counts go to `metrics.DEFAULT_METRICS`; with
+    `metrics_file` (`.prom` for Prometheus text, else JSON) they are flushed every
+    `metrics_interval_sec`, and an end-of-run report is always logged.
+    With a `scheduler` (`scheduling.TailScheduler`), items start longest-first, slow
+    requests are hedged, and retryable failures are held back from the results and run
+    again in up to `scheduler.requeue_passes` later passes (batches as single questions).
+
+    Returns:
+        dict: Run summary with `total`, `completed` and `duration_sec` (plus `scheduler` stats).
+    """
+    total_tasks = len(items)
+    if total_tasks == 0:
+        logger.info("No new items to process.")
+        return {"total": 0, "completed": 0, "duration_sec": 0.0}
+
+    # --- Setup Rate Limiter ---
+    quota_manager = quota_manager or DEFAULT_QUOTAS
+    rate_limiter = quota_manager.limiter_for(job.model_name, job.requests_per_minute,
+                                             job.tokens_per_minute, job.rate_limit_capacity)
+    if rate_limiter is not None:
+        logger.info(f"Rate limiting enabled: {job.requests_per_minute} RPM, {job.tokens_per_minute or 'unlimited'} TPM, "
+                    f"Capacity: {job.rate_limit_capacity} ({type(rate_limiter).__name__})")
+    else:
+        logger.info("Rate limiting disabled.")
+
+    Path(results_file).parent.mkdir(parents=True, exist_ok=True)
+    results_queue: asyncio.Queue = asyncio.Queue()
+    store = ResultsStore(results_file, job.key_field, job.output_field) if is_store_path(results_file) else None
+    writer_handle = asyncio.create_task(results_writer_task(results_queue, results_file, job.fieldnames, store=store))
+    metrics_handle = (asyncio.create_task(flush_periodically(DEFAULT_METRICS, metrics_file, metrics_interval_sec))
+                      if metrics_file else None)
+
+    logger.info(f"Starting async inference for {total_tasks} items (Concurrency: {job.max_async_workers})...")
+    semaphore = asyncio.Semaphore(job.max_async_workers)
+    start_bulk_time = time.time()
+    producer = producer or perform_inference_single_async
+    if video_cache is None:
+        video_cache = VideoHandleCache(client, use_vertex)
+    requeue_passes = 0
+    if scheduler is not None:
+        items = scheduler.order(items, job.key_field, job.max_async_workers)
+        job.hedge_policy = scheduler.hedge or job.hedge_policy
+        requeue_passes = scheduler.requeue_passes
+    items_by_key = {str(q[job.key_field]): q for item in items for q in item.get("batch", [item])}
+
+    completed_count = 0
+    tasks: List[asyncio.Task] = []
+    try:
+        with tqdm(total=total_tasks, desc="Async Inference", disable=not show_progress) as pbar:
+            pending, pass_producer = items, producer
+            for pass_index in range(requeue_passes + 1):
+                tap = RequeueTap(results_queue, job.key_field, hold=pass_index < requeue_passes)
+                tasks = [
+                    asyncio.create_task(pass_producer(item, client, job, semaphore, rate_limiter, tap, use_vertex, video_cache))
+                    for item in pending
+                ]
+                for future in asyncio.as_completed(tasks):
+                    try:
+                        await future
+                        if pass_index == 0:
+                            completed_count += 1
+                    except Exception as task_exc:
+                        logger.error(f"Error surfaced from an inference task: {task_exc}")
+                    finally:
+                        pbar.update(1)
+                if scheduler is None:
+                    break
+                pending = scheduler.requeue(tap, items_by_key, job.key_field, job.max_async_workers, video_cache)
+                if not pending:
+                    break
+                if pass_producer is perform_batch_inference_async:
+                    pass_producer = perform_inference_single_async # Requeued rows are single questions
+                pbar.total += len(pending)
+                pbar.refresh()
+    finally:
+        # Always stop the writer, even if the run is cancelled
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if job.hedge_policy is not None:
+            await job.hedge_policy.close()
+        await results_queue.put(None)
+        await writer_handle
+        if metrics_handle is not None:
+            metrics_handle.cancel()
+            await asyncio.gather(metrics_handle, return_exceptions=True)
+        video_cache.save()
+        if job.context_cache is not None:
+            await job.context_cache.close() # Stop paying storage for caches nobody will use
+        if store is not None:
+            logger.info(f"Results store: {store.summary()}")
+            store.close()
+
+    bulk_duration = time.time() - start_bulk_time
+    logger.info(f"Async inference finished in {bulk_duration:.2f} seconds. Completed: {completed_count}/{total_tasks}. See {results_file}.")
+    logger.info(f"Video handle cache: {video_cache.stats()}")
+    if rate_limiter is not None:
+        logger.info(f"Rate limiter: {rate_limiter.stats()}")
+    if job.context_cache is not None:
+        logger.info(f"Context cache: {job.context_cache.stats()}")
+    logger.info(f"Metrics{f' (written to {metrics_file})' if metrics_file else ''}:\n{DEFAULT_METRICS.report()}")
+    summary = {"total": total_tasks, "completed": completed_count, "duration_sec": bulk_duration}
+    if scheduler is not None:
+        logger.info(scheduler.report())
+        summary["scheduler"] = scheduler.stats()
+    return summary
@@ -0,0 +1,178 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, List
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Offline Fake Gemini Client
+# ──────────────────────────────────────────────────────────────────────────────
+# Mimics the parts of `google.genai.Client` the engine uses, so runs and
+# throughput benchmarks can execute without network access or quota.
+
+FAKE_VIDEO_TOKENS = 10_000 # Rough prompt size of a short clip
+FAKE_TEXT_TOKENS = 200
+DEFAULT_FAKE_LATENCY_SEC = 0.05 # --fake-latency of `run` and `pipeline`
+
+
+class FakeResponse:
+    """Minimal stand-in for `types.GenerateContentResponse`."""
+    def __init__(self, text: str, parsed: Any = None, finish_reason: str = "STOP", usage_metadata: Any = None):
+        self.text = text
+        self.parsed = parsed
+        self.candidates = [SimpleNamespace(finish_reason=SimpleNamespace(name=finish_reason))]
+        self.usage_metadata = usage_metadata
+
+
+def _fake_token_count(contents: List[Any]) -> int:
+    """Rough prompt size: a fixed cost per video part and per text message."""
+    tokens = 0
+    for item in contents or []:
+        parts = getattr(item, "parts", None)
+        if parts is not None:
+            tokens += _fake_token_count(parts)
+        elif getattr(item, "file_data", None) is not None or getattr(item, "uri", None) is not None:
+            tokens += FAKE_VIDEO_TOKENS
+        else:
+            tokens += FAKE_TEXT_TOKENS
+    return tokens
+
+
+class _FakeModels:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self._owner = owner
+
+    async def generate_content(self, *, model: str, contents: List[Any], config: Any = None) -> FakeResponse:
+        owner = self._owner
+        owner.calls += 1
+        if owner.latency_sec > 0:
+            await asyncio.sleep(owner.latency_sec)
+        usage = self._usage(contents, config)
+        schema = getattr(config, "response_schema", None)
+        if schema is not None and hasattr(schema, "model_fields"):
+            parsed = schema.model_validate(owner.structured_payload(schema))
+            return FakeResponse(text=parsed.model_dump_json(), parsed=parsed, usage_metadata=usage)
+        return FakeResponse(text=owner.response_text, usage_metadata=usage)
+
+    async def generate_content_stream(self, *, model: str, contents: List[Any], config: Any = None) -> AsyncIterator[FakeResponse]:
+        """`response_text` in `stream_chunks` pieces; the first after half the latency, the rest spread over the other half."""
+        owner = self._owner
+        owner.calls += 1
+        usage = self._usage(contents, config)
+        text = owner.response_text
+        size = max(1, -(-len(text) // owner.stream_chunks))
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+
+        async def chunks() -> AsyncIterator[FakeResponse]:
+            for i, piece in enumerate(pieces):
+                if owner.latency_sec > 0:
+                    await asyncio.sleep(owner.latency_sec / 2 if i == 0 else owner.latency_sec / 2 / max(1, len(pieces) - 1))
+                last = i == len(pieces) - 1
+                chunk = FakeResponse(text=piece, finish_reason="STOP" if last else None, usage_metadata=usage if last else None)
+                if not last:
+                    chunk.candidates = [SimpleNamespace(finish_reason=None)]
+                yield chunk
+
+        return chunks()
+
+    def _usage(self, contents: List[Any], config: Any) -> Any:
+        owner = self._owner
+        prompt_tokens = _fake_token_count(contents)
+        cached_tokens = 0
+        cache_name = getattr(config, "cached_content", None)
+        if cache_name:
+            if cache_name not in owner.caches:
+                raise FakeNotFound(404, f"Cached content {cache_name} not found.")
+            cached_tokens = owner.caches[cache_name].usage_metadata.total_token_count
+            prompt_tokens += cached_tokens
+        return SimpleNamespace(prompt_token_count=prompt_tokens, cached_content_token_count=cached_tokens or None,
+                               candidates_token_count=FAKE_TEXT_TOKENS, total_token_count=prompt_tokens + FAKE_TEXT_TOKENS)
+
+
+class FakeNotFound(Exception):
+    """Shaped like `google.genai.errors.ClientError` (404)."""
+    def __init__(self, code: int, message: str):
+        super().__init__(message)
+        self.code = code
+
+
+class _FakeFiles:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self._owner = owner
+
+    async def get(self, *, name: str) -> Any:
+        self._owner.file_gets += 1
+        if self._owner.files_latency_sec > 0:
+            await asyncio.sleep(self._owner.files_latency_sec)
+        return SimpleNamespace(name=name, uri=f"https://fake.local/{name}", mime_type="video/mp4")
+
+
+class _FakeCaches:
+    def __init__(self, owner: "FakeGeminiClient"):
+        self._owner = owner
+        self._counter = 0
+
+    async def create(self, *, model: str, config: Any = None) -> Any:
+        self._counter += 1
+        tokens = _fake_token_count(getattr(config, "contents", None) or [])
+        cache = SimpleNamespace(name=f"cachedContents/fake-{self._counter}", model=model,
+                                display_name=getattr(config, "display_name", None),
+                                usage_metadata=SimpleNamespace(total_token_count=tokens))
+        self._owner.caches[cache.name] = cache
+        return cache
+
+    async def update(self, *, name: str, config: Any = None) -> Any:
+        if name not in self._owner.caches:
+            raise FakeNotFound(404, f"Cached content {name} not found.")
+        return self._owner.caches[name]
+
+    async def delete(self, *, name: str) -> None:
+        self._owner.caches.pop(name, None)
+
+
+class FakeGeminiClient:
+    """
+    A local fake exposing `client.aio.models.generate_content` / `generate_content_stream`,
+    `client.aio.files.get` and `client.aio.caches` (create / update / delete).
+
+    Args:
+        latency_sec (float): Simulated latency of every generate_content call.
+        files_latency_sec (float): Simulated latency of every files.get call.
+        response_text (str): Text returned for unstructured requests.
+        stream_chunks (int): Chunks a streamed response is split into.
+    """
+    def __init__(self, latency_sec: float = 0.0, files_latency_sec: float = 0.0,
+                 response_text: str = "```thinking\n- Fake reasoning.\n```\nA.", stream_chunks: int = 8):
+        self.latency_sec = latency_sec
+        self.files_latency_sec = files_latency_sec
+        self.response_text = response_text
+        self.stream_chunks = stream_chunks
+        self.calls = 0
+        self.file_gets = 0
+        self.caches: dict = {}
+        self.aio = SimpleNamespace(models=_FakeModels(self), files=_FakeFiles(self), caches=_FakeCaches(self))
+
+    def structured_payload(self, schema: Any) -> dict:
+        """Builds a payload satisfying a structured-output schema (e.g. `QuestionResponse`)."""
+        json_schema = schema.model_json_schema()
+        return self._fake_object(json_schema, json_schema.get("$defs", {}))
+
+    def _fake_object(self, spec: dict, defs: dict, index: int = 0) -> dict:
+        payload = {}
+        for field, field_spec in spec.get("properties", {}).items():
+            if field_spec.get("type") == "array":
+                count = field_spec.get("minItems", 1)
+                item_ref = field_spec.get("items", {}).get("$ref")
+                if item_ref: # Nested objects, e.g. one {qid, answer} per batched question
+                    item_spec = defs[item_ref.rsplit("/", 1)[-1]]
+                    payload[field] = [self._fake_object(item_spec, defs, i) for i in range(count)]
+                else:
+                    payload[field] = [f"Fake {field} {i + 1}?" for i in range(count)]
+            elif "enum" in field_spec:
+                payload[field] = field_spec["enum"][index % len(field_spec["enum"])]
+            elif "const" in field_spec:
+                payload[field] = field_spec["const"]
+            elif field_spec.get("type") == "string" and field == "answer":
+                payload[field] = self.response_text
+            else:
+                payload[field] = f"Fake {field}."
+        return payload
@@ -0,0 +1,288 @@
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+from tqdm import tqdm
+
+from .metrics import DEFAULT_METRICS
+
+logger = logging.getLogger(__name__)
+
+VIDEO_ZIP_URL = "https://huggingface.co/datasets/lmms-lab/AISG_Challenge/resolve/main/Benchmark-AllVideos-HQ-Encoded-challenge.zip?download=true"
+DOWNLOAD_CHUNK_BYTES = 2**20
+EXTRACT_CHUNK_BYTES = 8 * 2**20
+CRC_CHUNK_BYTES = 8 * 2**20
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _is_skipped_member(name: str) -> bool:
+    """macOS metadata (`__MACOSX/`, `._*`, `.DS_Store`) and anything that is not a video."""
+    base = name.rsplit("/", 1)[-1]
+    return name.startswith("__MACOSX/") or base.startswith("._") or base == ".DS_Store" or not base.lower().endswith(".mp4")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Resumable Download
+# ──────────────────────────────────────────────────────────────────────────────
+# The archive is written to `<zip>.part`, next to a small `<zip>.part.json` holding
+# the validator (ETag / Last-Modified) it was started with. An interrupted download
+# continues with `Range: bytes=<size>-` plus `If-Range`, so a changed file on the
+# server restarts from zero instead of being spliced. The sha256 is computed while
+# writing (the existing prefix is hashed first when resuming) and checked against
+# `expected_sha256`, or the `X-Linked-ETag` Hugging Face sends for LFS files.
+
+def _linked_header(response: requests.Response, name: str) -> str:
+    """A header of the response or, failing that, of a redirect before it (HF `/resolve/` sends `X-Linked-*` on the 302)."""
+    for r in [response, *reversed(response.history)]:
+        if r.headers.get(name):
+            return r.headers[name]
+    return ""
+
+
+def _expected_digest(response: requests.Response, expected_sha256: Optional[str]) -> Optional[str]:
+    if expected_sha256:
+        return expected_sha256.lower()
+    linked = _linked_header(response, "X-Linked-ETag").strip('"').lower()
+    return linked if SHA256_PATTERN.match(linked) else None
+
+
+def _hash_prefix(path: Path) -> Any:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CRC_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h
+
+
+def download_resumable(url: str, destination: Path, expected_sha256: Optional[str] = None,
+                       max_retries: int = 5, session: Optional[requests.Session] = None,
+                       show_progress: bool = True) -> str:
+    """
+    Downloads `url` to `destination`, resuming partial downloads with HTTP Range requests.
+
+    An existing `destination` is kept when its recorded digest (`<destination>.sha256`)
+    matches `expected_sha256` (or no digest is expected). Connection errors are retried
+    from the current offset up to `max_retries` times.
+
+    Returns:
+        str: sha256 hex digest of the downloaded file.
+
+    Raises:
+        RuntimeError: Size mismatch (the partial file is kept for the next resume) or
+            checksum mismatch (it is discarded).
+    """
+    destination = Path(destination)
+    digest_file = destination.with_name(destination.name + ".sha256")
+    if destination.is_file() and digest_file.is_file():
+        recorded = digest_file.read_text().strip()
+        if not expected_sha256 or recorded == expected_sha256.lower():
+            logger.info(f"Skipping download: {destination} already verified (sha256 {recorded[:12]}...).")
+            return recorded
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    part = destination.with_name(destination.name + ".part")
+    state_file = destination.with_name(destination.name + ".part.json")
+    session = session or requests.Session()
+    attempt = 0
+    with DEFAULT_METRICS.timer("download"):
+        while True:
+            state = json.loads(state_file.read_text()) if state_file.is_file() and part.is_file() else {}
+            offset = part.stat().st_size if state else 0
+            headers = {}
+            if offset and state.get("validator"):
+                headers = {"Range": f"bytes={offset}-", "If-Range": state["validator"]}
+            try:
+                with session.get(url, stream=True, timeout=(30, 300), headers=headers) as response:
+                    if response.status_code == 416: # Nothing left to fetch
+                        response_total = offset
+                        hasher = _hash_prefix(part)
+                        expected = expected_sha256.lower() if expected_sha256 else state.get("expected_sha256")
+                    else:
+                        response.raise_for_status()
+                        resumed = response.status_code == 206
+                        if offset and not resumed:
+                            logger.info(f"Server ignored the range request (or the file changed); restarting {destination.name}.")
+                        offset = offset if resumed else 0
+                        linked_size = _linked_header(response, "X-Linked-Size")
+                        response_total = int(linked_size) if linked_size.isdigit() else (
+                            offset + int(response.headers.get("Content-Length", 0)))
+                        expected = _expected_digest(response, expected_sha256)
+                        if expected is None and resumed:
+                            expected = state.get("expected_sha256") # Same file as the first request
+                        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+                        state_file.write_text(json.dumps({"url": url, "validator": validator, "expected_sha256": expected}))
+                        hasher = _hash_prefix(part) if offset else hashlib.sha256()
+                        if offset:
+                            logger.info(f"Resuming {destination.name} at {offset / 2**20:.1f} MiB.")
+                        with open(part, "ab" if offset else "wb") as f, tqdm(
+                            desc=f"Downloading {destination.name}", total=response_total or None, initial=offset,
+                            unit="iB", unit_scale=True, unit_divisor=1024, disable=not show_progress,
+                        ) as bar:
+                            for data in response.iter_content(DOWNLOAD_CHUNK_BYTES):
+                                f.write(data)
+                                hasher.update(data)
+                                bar.update(len(data))
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                attempt += 1
+                DEFAULT_METRICS.record_error(e, "download")
+                if attempt > max_retries:
+                    raise
+                wait = min(60.0, 2.0 ** attempt)
+                logger.warning(f"Download interrupted ({type(e).__name__}: {e}); resuming in {wait:.0f}s "
+                               f"(attempt {attempt}/{max_retries}).")
+                time.sleep(wait)
+
+    size = part.stat().st_size
+    digest = hasher.hexdigest()
+    if not expected:
+        logger.warning(f"No expected sha256 for {destination.name} (no --sha256 and no X-Linked-ETag from the server); "
+                       f"the download is not verified.")
+    if response_total and size != response_total:
+        raise RuntimeError(f"Download size mismatch for {destination.name}: {size} != {response_total} bytes.")
+    if expected and digest != expected:
+        part.unlink(missing_ok=True)
+        state_file.unlink(missing_ok=True)
+        raise RuntimeError(f"Checksum mismatch for {destination.name}: sha256 {digest} != {expected}.")
+    os.replace(part, destination)
+    state_file.unlink(missing_ok=True)
+    digest_file.write_text(digest + "\n")
+    logger.info(f"Downloaded {destination} ({size / 2**20:.1f} MiB, sha256 {digest[:12]}..."
+                f"{', verified' if expected else ''}).")
+    return digest
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Parallel Flat Extraction
+# ──────────────────────────────────────────────────────────────────────────────
+# Each video member is streamed straight to `<dest_dir>/<basename>` (the flat layout
+# `move_videos_to_main_directory` used to produce with a second pass), through a
+# `.part` file so an interrupted run never leaves a truncated video. zlib releases
+# the GIL, so worker threads decompress in parallel; each has its own `ZipFile`.
+# Members whose destination already has the same size and CRC-32 are skipped.
+
+def file_crc32(path: Path) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CRC_CHUNK_BYTES), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def plan_flat_members(zip_path: Path) -> List[zipfile.ZipInfo]:
+    """Video members of the archive, one per basename (the first one wins on collisions)."""
+    with zipfile.ZipFile(zip_path) as zf:
+        members: Dict[str, zipfile.ZipInfo] = {}
+        for info in zf.infolist():
+            if info.is_dir() or _is_skipped_member(info.filename):
+                continue
+            base = info.filename.rsplit("/", 1)[-1]
+            if base in members:
+                logger.warning(f"Duplicate video name {base} ({info.filename}); keeping {members[base].filename}.")
+                continue
+            members[base] = info
+    return list(members.values())
+
+
+def extract_flat(zip_path: Path, dest_dir: Path, max_workers: Optional[int] = None,
+                 verify_existing: bool = True, show_progress: bool = True) -> Dict[str, Any]:
+    """
+    Extracts every video of `zip_path` directly into `dest_dir`, `max_workers` members at a time.
+
+    Args:
+        verify_existing (bool): Also compare the CRC-32 of existing files (size only when False).
+
+    Returns:
+        dict: Counts of extracted / skipped / error members and the wall time.
+    """
+    dest_dir = Path(dest_dir)
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    members = plan_flat_members(zip_path)
+    max_workers = max_workers or min(8, os.cpu_count() or 1)
+    local = threading.local() # One ZipFile (file handle + read position) per worker thread
+    opened: List[zipfile.ZipFile] = []
+
+    def extract_one(info: zipfile.ZipInfo) -> str:
+        out_path = dest_dir / info.filename.rsplit("/", 1)[-1]
+        if out_path.is_file() and out_path.stat().st_size == info.file_size and (
+                not verify_existing or file_crc32(out_path) == info.CRC):
+            return "skipped"
+        if not hasattr(local, "zf"):
+            local.zf = zipfile.ZipFile(zip_path)
+            opened.append(local.zf)
+        tmp_path = out_path.with_name(out_path.name + ".part")
+        try:
+            with DEFAULT_METRICS.timer("extract"), local.zf.open(info) as src, open(tmp_path, "wb") as dst:
+                for chunk in iter(lambda: src.read(EXTRACT_CHUNK_BYTES), b""):
+                    dst.write(chunk) # ZipExtFile checks the CRC-32 at the end of the member
+            os.replace(tmp_path, out_path)
+            return "extracted"
+        except Exception:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    start_time = time.perf_counter()
+    counts = {"extracted": 0, "skipped": 0, "error": 0}
+    logger.info(f"Extracting {len(members)} videos from {zip_path.name} to {dest_dir} with {max_workers} workers...")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool, tqdm(
+                total=len(members), desc=f"Extracting {zip_path.name}", unit="video", disable=not show_progress) as pbar:
+            futures = {pool.submit(extract_one, info): info for info in members}
+            for future in as_completed(futures):
+                try:
+                    counts[future.result()] += 1
+                except Exception as e:
+                    counts["error"] += 1
+                    DEFAULT_METRICS.record_error(e, "extract")
+                    logger.error(f"Error extracting {futures[future].filename}: {e}")
+                pbar.update(1)
+    finally:
+        for zf in opened:
+            zf.close()
+    counts.update(total=len(members), wall_sec=round(time.perf_counter() - start_time, 2))
+    logger.info(f"Extraction: {counts}")
+    return counts
+
+
+# --- Command Line ---
+INGEST_COMMAND = "ingest"
+
+
+def ingest_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference ingest`."""
+    parser = argparse.ArgumentParser(prog=f"python -m inference {INGEST_COMMAND}",
+                                     description="Download (resumable, checksummed) and extract the video archive.")
+    parser.add_argument("command", choices=(INGEST_COMMAND,))
+    parser.add_argument("--url", default=VIDEO_ZIP_URL, help="VIDEO_ZIP_URL.")
+    parser.add_argument("--zip", default="downloads/all_videos.zip", help="Where the archive is stored.")
+    parser.add_argument("--videos-dir", default="extracted_videos", help="EXTRACTED_VIDEOS_DIR (flat).")
+    parser.add_argument("--sha256", default=None, help="Expected archive sha256 (default: the server's X-Linked-ETag).")
+    parser.add_argument("--skip-download", action="store_true", help="Extract an existing archive only.")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel extraction threads.")
+    parser.add_argument("--size-only", action="store_true", help="Skip existing videos on size alone (no CRC check).")
+    parser.add_argument("--no-progress", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    zip_path = Path(args.zip)
+    if not args.skip_download:
+        download_resumable(args.url, zip_path, args.sha256, show_progress=not args.no_progress)
+    elif not zip_path.is_file():
+        parser.error(f"{zip_path} does not exist.")
+    summary = extract_flat(zip_path, Path(args.videos_dir), args.workers,
+                           verify_existing=not args.size_only, show_progress=not args.no_progress)
+    logger.info(f"Stage latencies:\n{DEFAULT_METRICS.report()}")
+    return 0 if summary["error"] == 0 else 1
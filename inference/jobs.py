@@ -0,0 +1,199 @@
+import logging
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from .batching import batch_config, build_batch_prompt
+from .chat_store import ChatHistoryStore
+from .retry import RetryPolicy
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+INITIAL_BACKOFF_SECONDS = 5.0
+MCQ_QUESTION_TYPE = "Multiple-choice Question with a Single Correct Answer"
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Job Definition
+# ──────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class InferenceJob:
+    """
+    Everything the engine needs to run one kind of bulk request.
+
+    `build_contents(item, video_part)` turns a metadata row plus the resolved video
+    handle into the request contents; `parse_response(response)` turns the SDK
+    response into the value stored under `output_field`.
+    """
+    model_name: str
+    config: Any
+    build_contents: Callable[[Dict, Any], List[Any]]
+    parse_response: Callable[[Any], Any]
+    requests_per_minute: Optional[int] = None
+    max_retries: int = 1
+    max_async_workers: int = 10
+    key_field: str = "qid"
+    output_field: str = "pred"
+    rate_limit_capacity: int = 10
+    initial_backoff_seconds: float = INITIAL_BACKOFF_SECONDS
+    tokens_per_minute: Optional[int] = None
+    retry_policy: Optional[RetryPolicy] = None
+    # Optional context caching: `split_contents(item, video_part)` -> (shared prefix, per-request suffix)
+    split_contents: Optional[Callable[[Dict, Any], Tuple[List[Any], List[Any]]]] = None
+    context_cache: Optional[Any] = None # `context_cache.ContextCacheManager`
+    # Optional video-level batching: `build_batch_contents(questions, video_part)` -> (contents, config)
+    build_batch_contents: Optional[Callable[[List[Dict], Any], Tuple[List[Any], Any]]] = None
+    response_cache: Optional[Any] = None # `response_cache.ResponseCache`, consulted before any request is sent
+    # Streaming: unstructured requests use `generate_content_stream`; `stream_cutoff(item, text_so_far)`
+    # may end a stream early, and partial text is queued every `partial_interval_sec` (results stores only)
+    stream: bool = False
+    stream_cutoff: Optional[Callable[[Dict, str], bool]] = None
+    partial_interval_sec: Optional[float] = None
+    request_timeout_sec: Optional[float] = None # Per-attempt deadline; frees the semaphore slot of stuck requests
+    hedge_policy: Optional[Any] = None # `scheduling.HedgePolicy`: duplicates unstreamed requests slower than its quantile
+
+    def __post_init__(self):
+        if self.retry_policy is None:
+            self.retry_policy = RetryPolicy(max_retries=self.max_retries,
+                                            initial_backoff_sec=self.initial_backoff_seconds)
+
+    @property
+    def fieldnames(self) -> List[str]:
+        return [self.key_field, self.output_field, "status", "duration_sec", "finish_reason"]
+
+
+# --- Prompt Building ---
+def build_prompt(question_info: dict, prompt_templates: Dict[str, str]) -> str:
+    question = question_info.get("question", "")
+    q_type = question_info.get("question_type", "default")
+    template = prompt_templates.get(q_type, prompt_templates["default"])
+    if q_type == MCQ_QUESTION_TYPE:
+        return template.format(question=question).strip() + "\n" + "E. None of the above"
+    return template.format(question=question).strip() + "\n" + (question_info.get("question_prompt") or "").strip()
+
+
+def text_response(response: Any) -> str:
+    return response.text.strip()
+
+
+def batch_message(questions: List[Dict], prompt_templates: Dict[str, str]) -> "types.Content":
+    """One user message asking all `questions` (see `batching.build_batch_prompt`)."""
+    from google.genai import types
+
+    prompts = {q["qid"]: build_prompt(q, prompt_templates) for q in questions}
+    return types.Content(role="user", parts=[types.Part.from_text(text=build_batch_prompt(prompts))])
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Job Factories
+# ──────────────────────────────────────────────────────────────────────────────
+# Each factory accepts a `models.registry.ModelConfig` or the tuple returned by the
+# matching `models/*` getter (a ModelConfig unpacks like that tuple).
+
+def make_answer_job(model_tuple: Tuple) -> InferenceJob:
+    """Single-turn question answering (`get_non_cot_model` / `get_cot_model`)."""
+    from google.genai import types
+
+    model_name, _system_prompt, prompt_templates, config, rpm, max_retries, max_workers = model_tuple
+
+    def build_contents(question_info: Dict, video_part: Any) -> List[Any]:
+        prompt_text = build_prompt(question_info, prompt_templates)
+        question_content = types.Content(role="user", parts=[types.Part.from_text(text=prompt_text)])
+        return [question_content, video_part]
+
+    def split_contents(question_info: Dict, video_part: Any) -> Tuple[List[Any], List[Any]]:
+        # A cached prefix must come first, so cached requests send the video before the question
+        prompt_text = build_prompt(question_info, prompt_templates)
+        return [video_part], [types.Content(role="user", parts=[types.Part.from_text(text=prompt_text)])]
+
+    def build_batch_contents(questions: List[Dict], video_part: Any) -> Tuple[List[Any], Any]:
+        return [batch_message(questions, prompt_templates), video_part], batch_config(config, [q["qid"] for q in questions])
+
+    return InferenceJob(
+        model_name=model_name, config=config, build_contents=build_contents,
+        parse_response=text_response, requests_per_minute=rpm,
+        max_retries=max_retries, max_async_workers=max_workers,
+        split_contents=split_contents, build_batch_contents=build_batch_contents,
+    )
+
+
+def make_cocot_job(model_tuple: Tuple, answers_dir: str, chat_store: Optional[ChatHistoryStore] = None) -> InferenceJob:
+    """
+    Final CoCoT inference using the chat history generated per video (`get_cot_model`).
+
+    Histories are read through `chat_store` (default: a new `ChatHistoryStore` over
+    `answers_dir`), so each video's history is parsed once for all of its questions.
+    """
+    from google.genai import types
+
+    model_name, _system_prompt, prompt_templates, config, rpm, max_retries, max_workers = model_tuple
+    chat_store = chat_store or ChatHistoryStore(answers_dir)
+
+    def build_contents(question_info: Dict, video_part: Any) -> List[Any]:
+        chat = chat_store.get(question_info.get("video_id", "?"))
+        prompt_text = build_prompt(question_info, prompt_templates)
+        user_msg = types.Content(role="user", parts=[types.Part.from_text(text=prompt_text)])
+        return [video_part, *chat, user_msg]
+
+    def split_contents(question_info: Dict, video_part: Any) -> Tuple[List[Any], List[Any]]:
+        contents = build_contents(question_info, video_part)
+        return contents[:-1], contents[-1:]
+
+    def build_batch_contents(questions: List[Dict], video_part: Any) -> Tuple[List[Any], Any]:
+        chat = chat_store.get(questions[0].get("video_id", "?"))
+        return ([video_part, *chat, batch_message(questions, prompt_templates)],
+                batch_config(config, [q["qid"] for q in questions]))
+
+    return InferenceJob(
+        model_name=model_name, config=config, build_contents=build_contents,
+        parse_response=text_response, requests_per_minute=rpm,
+        max_retries=max_retries, max_async_workers=max_workers,
+        split_contents=split_contents, build_batch_contents=build_batch_contents,
+    )
+
+
+def make_summary_job(summary_tuple: Tuple) -> InferenceJob:
+    """
+    Final-answer extraction from a CoCoT answer (`get_summary_model`), one text-only request per question.
+
+    Items are question rows carrying the CoCoT answer under `"pred"`; the video is not sent.
+    """
+    from google.genai import types
+
+    model_name, _system_prompt, config = summary_tuple
+
+    def build_contents(question_info: Dict, video_part: Any) -> List[Any]:
+        question = build_prompt(question_info, {"default": "{question}"})
+        return [types.Content(role="user", parts=[types.Part.from_text(text=question),
+                                                  types.Part.from_text(text=question_info.get("pred") or "")])]
+
+    return InferenceJob(
+        model_name=model_name, config=config, build_contents=build_contents,
+        parse_response=text_response,
+    )
+
+
+def make_question_generation_job(brainstorm_tuple: Tuple) -> InferenceJob:
+    """Guideline question brainstorming per video (`get_brainstorm_prompt`)."""
+    from google.genai import types
+
+    model_name, prompt, _schema, config, rpm, max_retries, max_workers = brainstorm_tuple
+
+    def build_contents(video_info: Dict, video_part: Any) -> List[Any]:
+        video_content = types.Content(role="user", parts=[types.Part.from_text(text=prompt)])
+        return [video_content, video_part]
+
+    def parse_questions(response: Any) -> List[str]:
+        if response.parsed is None:
+            raise ValueError("Structured response could not be parsed.")
+        return response.parsed.questions
+
+    return InferenceJob(
+        model_name=model_name, config=config, build_contents=build_contents,
+        parse_response=parse_questions, requests_per_minute=rpm,
+        max_retries=max_retries, max_async_workers=max_workers,
+        key_field="video_id", output_field="questions",
+    )
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRIC_PREFIX = "vqa"
+RESERVOIR_SIZE = 10_000          # Samples kept per histogram for exact-enough percentiles
+DEFAULT_FLUSH_INTERVAL_SEC = 15.0
+# Prometheus bucket bounds (seconds): 1 ms .. ~17 min, roughly x2.5 per step
+BUCKET_BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+                 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0)
+TOKEN_FIELDS = {
+    "prompt_token_count": "input",
+    "candidates_token_count": "output",
+    "thoughts_token_count": "thinking",
+    "cached_content_token_count": "cached",
+}
+COUNTER_LABELS = {"tokens": "kind", "finish_reason": "reason", "errors": "error"} # Prometheus label names
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Histograms & Registry
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else f"{value:g}"
+
+
+def _nearest_rank(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] if ordered else 0.0
+
+
+class Histogram:
+    """Latency histogram: Prometheus buckets plus a reservoir sample for p50/p95/p99."""
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKET_BOUNDS)
+        self._samples: List[float] = []
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        for i, bound in enumerate(BUCKET_BOUNDS):
+            if value <= bound:
+                self.buckets[i] += 1
+                break
+        if len(self._samples) < RESERVOIR_SIZE:
+            self._samples.append(value)
+        else: # Reservoir sampling keeps a uniform sample of the whole run
+            slot = random.randrange(self.count)
+            if slot < RESERVOIR_SIZE:
+                self._samples[slot] = value
+
+    def percentile(self, q: float) -> float:
+        return _nearest_rank(sorted(self._samples), q)
+
+    def summary(self) -> Dict[str, float]:
+        if not self.count:
+            return {"count": 0}
+        ordered = sorted(self._samples)
+        pick = lambda q: _nearest_rank(ordered, q)
+        return {"count": self.count, "mean": round(self.total / self.count, 4), "min": round(self.min, 4),
+                "p50": round(pick(0.50), 4), "p95": round(pick(0.95), 4), "p99": round(pick(0.99), 4),
+                "max": round(self.max, 4), "sum": round(self.total, 3)}
+
+
+class Metrics:
+    """
+    In-process metrics registry: latency histograms per stage, counters and gauges.
+
+    Counters take one optional label (`inc("finish_reason", "STOP")`). Everything is
+    thread-safe, since ffmpeg / upload / writer stages run in worker threads.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.histograms: Dict[str, Histogram] = {}
+        self.values: Dict[str, Histogram] = {} # Distributions that are not latencies (e.g. tokens/sec)
+        self.counters: Dict[Tuple[str, str], float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.gauge_peaks: Dict[str, float] = {}
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.histograms.clear()
+            self.values.clear()
+            self.counters.clear()
+            self.gauges.clear()
+            self.gauge_peaks.clear()
+
+    # --- Recording ---
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self.histograms.setdefault(stage, Histogram()).observe(seconds)
+
+    def observe_value(self, name: str, value: float):
+        """Records a non-latency sample; reported with percentiles, exported as a Prometheus summary."""
+        with self._lock:
+            self.values.setdefault(name, Histogram()).observe(value)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        """Times the block into the `stage` histogram (works around `await`s too)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name: str, label: str = "", value: float = 1):
+        with self._lock:
+            self.counters[(name, label)] = self.counters.get((name, label), 0) + value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self.gauges[name] = value
+            self.gauge_peaks[name] = max(self.gauge_peaks.get(name, value), value)
+
+    def record_response(self, response: Any):
+        """Token usage (`usage_metadata`) and finish reason of a successful response."""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            for field, kind in TOKEN_FIELDS.items():
+                tokens = getattr(usage, field, None)
+                if tokens:
+                    self.inc("tokens", kind, tokens)
+        candidates = getattr(response, "candidates", None)
+        reason = getattr(getattr(candidates[0], "finish_reason", None), "name", None) if candidates else None
+        self.inc("finish_reason", reason or "UNKNOWN")
+
+    def record_error(self, exc: BaseException, stage: str = "generate_content"):
+        self.inc("errors", f"{stage}:{type(exc).__name__}")
+
+    # --- Export ---
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters: Dict[str, Any] = {}
+            for (name, label), value in sorted(self.counters.items()):
+                if label:
+                    counters.setdefault(name, {})[label] = value
+                else:
+                    counters[name] = value
+            return {
+                "uptime_sec": round(time.time() - self.started_at, 2),
+                "latency_sec": {stage: h.summary() for stage, h in sorted(self.histograms.items())},
+                "values": {name: h.summary() for name, h in sorted(self.values.items())},
+                "counters": counters,
+                "gauges": dict(self.gauges),
+                "gauge_peaks": dict(self.gauge_peaks),
+            }
+
+    def to_prometheus(self) -> str:
+        """Prometheus text exposition format (for node_exporter's textfile collector)."""
+        lines = []
+        with self._lock:
+            if self.histograms:
+                name = f"{METRIC_PREFIX}_stage_latency_seconds"
+                lines += [f"# HELP {name} Latency per pipeline stage.", f"# TYPE {name} histogram"]
+                for stage, h in sorted(self.histograms.items()):
+                    cumulative = 0
+                    for bound, count in zip(BUCKET_BOUNDS, h.buckets):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {h.total:.6f}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {h.count}')
+            for value_name, h in sorted(self.values.items()):
+                name = f"{METRIC_PREFIX}_{value_name}"
+                lines.append(f"# TYPE {name} summary")
+                ordered = sorted(h._samples)
+                for q in (0.5, 0.95, 0.99):
+                    lines.append(f'{name}{{quantile="{q}"}} {_nearest_rank(ordered, q):.6f}')
+                lines += [f"{name}_sum {h.total:.6f}", f"{name}_count {h.count}"]
+            by_name: Dict[str, List[Tuple[str, float]]] = {}
+            for (counter, label), value in sorted(self.counters.items()):
+                by_name.setdefault(counter, []).append((label, value))
+            for counter, values in by_name.items():
+                name = f"{METRIC_PREFIX}_{counter}_total"
+                lines.append(f"# TYPE {name} counter")
+                label_name = COUNTER_LABELS.get(counter, "label")
+                for label, value in values:
+                    lines.append(f'{name}{{{label_name}="{label}"}} {_fmt(value)}' if label else f"{name} {_fmt(value)}")
+            for gauge, value in sorted(self.gauges.items()):
+                name = f"{METRIC_PREFIX}_{gauge}"
+                lines += [f"# TYPE {name} gauge", f"{name} {_fmt(value)}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Atomically writes a Prometheus text file (`.prom`) or a JSON snapshot (anything else)."""
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        text = self.to_prometheus() if path.endswith(".prom") else json.dumps(self.snapshot(), indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    def report(self) -> str:
+        """End-of-run table: per-stage percentiles, tokens, finish reasons and errors."""
+        snap = self.snapshot()
+        lines = [f"{'stage':<22}{'count':>8}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"]
+        for stage, s in [*snap["latency_sec"].items(), *snap["values"].items()]:
+            if s.get("count"):
+                lines.append(f"{stage:<22}{s['count']:>8}{s['mean']:>9.3f}{s['p50']:>9.3f}"
+                             f"{s['p95']:>9.3f}{s['p99']:>9.3f}{s['max']:>9.3f}")
+        for name, values in snap["counters"].items():
+            if isinstance(values, dict):
+                lines.append(f"{name}: " + ", ".join(f"{k}={_fmt(v)}" for k, v in values.items()))
+            else:
+                lines.append(f"{name}: {_fmt(values)}")
+        if snap["gauge_peaks"]:
+            lines.append("peaks: " + ", ".join(f"{k}={_fmt(v)}" for k, v in snap["gauge_peaks"].items()))
+        return "\n".join(lines)
+
+
+# Process-wide registry; the engine, video preparation and uploads all record here
+DEFAULT_METRICS = Metrics()
+
+
+async def flush_periodically(metrics: Metrics, path: str, interval_sec: float = DEFAULT_FLUSH_INTERVAL_SEC):
+    """Rewrites `path` every `interval_sec` until cancelled, then one last time."""
+    try:
+        while True:
+            await asyncio.sleep(interval_sec)
+            await asyncio.to_thread(metrics.write, path)
+    except asyncio.CancelledError:
+        metrics.write(path)
+        raise
@@ -0,0 +1,487 @@
+import argparse
+import ast
+import asyncio
+import csv
+import logging
+import os
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from tqdm import tqdm
+
+from .chat_builder import DEFAULT_NUM_TURNS, build_chat_history_async, list_answered_videos, make_chat_job
+from .chat_store import ChatHistoryStore
+from .data import get_questions_for_video, load_metadata_for_inference, load_processed_qids
+from .engine import perform_inference_single_async, results_writer_task
+from .fake_client import DEFAULT_FAKE_LATENCY_SEC
+from .jobs import InferenceJob, make_cocot_job, make_question_generation_job, make_summary_job
+from .metrics import DEFAULT_FLUSH_INTERVAL_SEC, DEFAULT_METRICS, flush_periodically
+from .rate_limiter import DEFAULT_QUOTAS, QuotaManager
+from .results_store import PARTIAL_STATUS, SUCCESS_STATUS, ResultsStore, is_store_path
+from .video_cache import VideoHandleCache, default_handle_cache_path
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_COMMAND = "pipeline"
+PIPELINE_STAGES = ("questions", "answers", "cocot", "summary")
+DEFAULT_QUEUE_SIZE = 8 # Videos waiting in front of a stage
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Stages
+# ──────────────────────────────────────────────────────────────────────────────
+# The CoCoT flow as one DAG per video: questions -> answers (chat history) ->
+# cocot (final answers, one request per question) -> summary (optional final-answer
+# extraction). A video moves to the next stage as soon as its current stage is done,
+# so all stages run at once and the run takes about as long as its slowest stage.
+# Each stage has its own bounded input queue, concurrency (videos in flight) and
+# semaphore; rate limits come from the shared `QuotaManager`, so stages on the same
+# model draw from that model's quota. A full queue blocks the stage in front of it
+# (backpressure), so a slow stage never accumulates an unbounded backlog.
+# Every stage checkpoints per video into its own results file / the answers dir,
+# and a rerun starts each video after the last stage it completed.
+
+@dataclass
+class PipelineStage:
+    """
+    One pipeline stage: the job it runs, where its results go and how much it may hold.
+
+    Args:
+        name (str): One of `PIPELINE_STAGES`.
+        job (InferenceJob): The stage's job (`ChatJob` for "answers").
+        results_file (str): Results CSV or `.sqlite` store of the stage (its checkpoint).
+        concurrency (int): Videos processed at once; requests are further bounded by `job.max_async_workers`.
+        queue_size (int): Videos allowed to wait for this stage.
+        write_batch_size (int): Rows buffered by the stage's writer; 1 checkpoints every video.
+    """
+    name: str
+    job: InferenceJob
+    results_file: str
+    concurrency: int
+    queue_size: int = DEFAULT_QUEUE_SIZE
+    write_batch_size: int = 20
+    videos_in: int = 0
+    videos_out: int = 0
+    videos_failed: int = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {"in": self.videos_in, "out": self.videos_out, "failed": self.videos_failed}
+
+
+@dataclass
+class VideoWork:
+    """A video travelling through the pipeline."""
+    video_id: str
+    rows: List[Dict]          # Metadata question rows; every row carries the video handle columns
+    stage: str                # Next stage to run
+    preds: Dict[str, str] = field(default_factory=dict) # qid -> CoCoT answer, for the summary stage
+
+
+def check_stages(names: List[str]):
+    """Raises ValueError unless `names` is a consecutive run of `PIPELINE_STAGES`."""
+    start = PIPELINE_STAGES.index(names[0]) if names and names[0] in PIPELINE_STAGES else -1
+    if start < 0 or list(PIPELINE_STAGES[start:start + len(names)]) != list(names):
+        raise ValueError(f"Stages must be consecutive, in the order {','.join(PIPELINE_STAGES)}: got {','.join(names)}.")
+
+
+class _ResultTap:
+    """Stands in for a producer's results queue: forwards rows to the stage writer and keeps the final ones."""
+    def __init__(self, writer_queue: asyncio.Queue):
+        self._writer_queue = writer_queue
+        self.rows: List[Dict] = []
+
+    def put_nowait(self, row: Dict):
+        if row.get("status") != PARTIAL_STATUS:
+            self.rows.append(row)
+        self._writer_queue.put_nowait(row)
+
+    async def put(self, row: Dict):
+        self.put_nowait(row) # The writer queue is unbounded
+
+    def successful(self) -> List[Dict]:
+        return [row for row in self.rows if row.get("status") == SUCCESS_STATUS]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Orchestration
+# ──────────────────────────────────────────────────────────────────────────────
+
+class VideoPipeline:
+    """
+    Runs videos through consecutive `PipelineStage`s, each video advancing on its own.
+
+    Args:
+        client: `google.genai` client (or `FakeGeminiClient`).
+        stages (List[PipelineStage]): Consecutive stages, in `PIPELINE_STAGES` order.
+        use_vertex (bool): Resolve videos by GCS URI instead of File API name.
+        video_cache (VideoHandleCache, optional): Shared by all stages, so each video is resolved once.
+        quota_manager (QuotaManager, optional): Source of the per-model rate limiters (default: `DEFAULT_QUOTAS`).
+        done_keys (Dict[str, Set[str]], optional): qids already answered per stage ("cocot" / "summary").
+        chat_store (ChatHistoryStore, optional): Store of the cocot stage; histories the answers stage
+            writes in this run are invalidated in it, so cocot never reads an older packed copy.
+    """
+    def __init__(self, client: Any, stages: List[PipelineStage], use_vertex: bool = False,
+                 video_cache: Optional[VideoHandleCache] = None, quota_manager: Optional[QuotaManager] = None,
+                 done_keys: Optional[Dict[str, Set[str]]] = None, chat_store: Optional[ChatHistoryStore] = None):
+        check_stages([stage.name for stage in stages])
+        self.client = client
+        self.stages = stages
+        self.use_vertex = use_vertex
+        self.video_cache = video_cache or VideoHandleCache(client, use_vertex)
+        self.quota_manager = quota_manager or DEFAULT_QUOTAS
+        self.done_keys = {name: set(keys) for name, keys in (done_keys or {}).items()}
+        self.chat_store = chat_store
+        self._by_name = {stage.name: stage for stage in stages}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._writer_queues: Dict[str, asyncio.Queue] = {}
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._limiters: Dict[str, Any] = {}
+        self._pbar: Optional[tqdm] = None
+        self.completed = 0
+
+    def _next_stage(self, name: str) -> Optional[str]:
+        index = [stage.name for stage in self.stages].index(name)
+        return self.stages[index + 1].name if index + 1 < len(self.stages) else None
+
+    # --- One Video, One Stage ---
+    async def _process(self, stage: PipelineStage, work: VideoWork) -> bool:
+        """Runs `stage` for one video; True when the video can move on."""
+        tap = _ResultTap(self._writer_queues[stage.name])
+
+        def run(item: Dict, producer=perform_inference_single_async):
+            return producer(item, self.client, stage.job, self._semaphores[stage.name], self._limiters[stage.name],
+                            tap, self.use_vertex, self.video_cache)
+
+        if stage.name == "questions":
+            await run(work.rows[0])
+            rows = tap.successful()
+            answers = self._by_name.get("answers")
+            if rows and answers is not None:
+                answers.job.generated_questions[work.video_id] = list(rows[0][stage.job.output_field])
+            return bool(rows)
+        if stage.name == "answers":
+            await run(work.rows[0], build_chat_history_async)
+            if self.chat_store is not None:
+                self.chat_store.invalidate(work.video_id)
+            return bool(tap.successful())
+
+        done = self.done_keys.get(stage.name, set())
+        if stage.name == "cocot":
+            items = [row for row in work.rows if row.get("qid") not in done]
+        else: # summary: questions with a CoCoT answer
+            items = [{**row, "pred": work.preds[row["qid"]]} for row in work.rows
+                     if row.get("qid") in work.preds and row["qid"] not in done]
+        await asyncio.gather(*(run(item) for item in items))
+        rows = tap.successful()
+        if stage.name == "cocot":
+            work.preds.update({row["qid"]: row[stage.job.output_field] for row in rows})
+            return bool(work.preds)
+        return bool(rows) or not items
+
+    async def _worker(self, stage: PipelineStage):
+        queue = self._queues[stage.name]
+        next_stage = self._next_stage(stage.name)
+        while True:
+            work = await queue.get()
+            if work is None:
+                return
+            DEFAULT_METRICS.set_gauge(f"pipeline_queue_depth_{stage.name}", queue.qsize())
+            stage.videos_in += 1
+            start = time.perf_counter()
+            try:
+                moved_on = await self._process(stage, work)
+            except Exception as e:
+                logger.error(f"{stage.name} stage, video_id {work.video_id}: Unexpected error - {e}", exc_info=True)
+                moved_on = False
+            DEFAULT_METRICS.observe(f"pipeline_{stage.name}", time.perf_counter() - start)
+            if not moved_on:
+                stage.videos_failed += 1
+                logger.warning(f"video_id {work.video_id}: {stage.name} stage failed; later stages skipped until a rerun.")
+            else:
+                stage.videos_out += 1
+            if moved_on and next_stage is not None:
+                work.stage = next_stage
+                await self._queues[next_stage].put(work) # Waits while the next stage is full
+                continue
+            self.completed += moved_on
+            if self._pbar is not None:
+                self._pbar.update(1)
+
+    # --- Whole Run ---
+    async def run(self, videos: List[VideoWork], show_progress: bool = True, metrics_file: Optional[str] = None,
+                  metrics_interval_sec: float = DEFAULT_FLUSH_INTERVAL_SEC) -> Dict[str, Any]:
+        """
+        Pushes every video into the queue of its `stage` and runs all stages until the queues drain.
+
+        Returns:
+            dict: Run summary with `total`, `completed` (videos through the last stage),
+            `duration_sec` and per-stage `stages` counts.
+        """
+        if not videos:
+            logger.info("No videos to process.")
+            return {"total": 0, "completed": 0, "duration_sec": 0.0, "stages": {}}
+
+        stores: Dict[str, ResultsStore] = {}
+        writers = []
+        for stage in self.stages:
+            job = stage.job
+            self._queues[stage.name] = asyncio.Queue(maxsize=stage.queue_size)
+            self._writer_queues[stage.name] = asyncio.Queue()
+            self._semaphores[stage.name] = asyncio.Semaphore(job.max_async_workers)
+            self._limiters[stage.name] = self.quota_manager.limiter_for(
+                job.model_name, job.requests_per_minute, job.tokens_per_minute, job.rate_limit_capacity)
+            Path(stage.results_file).parent.mkdir(parents=True, exist_ok=True)
+            if is_store_path(stage.results_file):
+                stores[stage.name] = ResultsStore(stage.results_file, job.key_field, job.output_field)
+            writers.append(asyncio.create_task(results_writer_task(
+                self._writer_queues[stage.name], stage.results_file, job.fieldnames,
+                write_batch_size=stage.write_batch_size, store=stores.get(stage.name))))
+            logger.info(f"Stage {stage.name}: {job.model_name}, {stage.concurrency} videos / "
+                        f"{job.max_async_workers} requests at once, queue {stage.queue_size} -> {stage.results_file}")
+        metrics_handle = (asyncio.create_task(flush_periodically(DEFAULT_METRICS, metrics_file, metrics_interval_sec))
+                          if metrics_file else None)
+
+        start_time = time.time()
+        workers = {stage.name: [asyncio.create_task(self._worker(stage)) for _ in range(stage.concurrency)]
+                   for stage in self.stages}
+        self._pbar = tqdm(total=len(videos), desc="Pipeline", unit="video", disable=not show_progress)
+        try:
+            for work in videos:
+                await self._queues[work.stage].put(work)
+            # A stage is closed once everything upstream of it has finished
+            for stage in self.stages:
+                for _ in workers[stage.name]:
+                    await self._queues[stage.name].put(None)
+                await asyncio.gather(*workers[stage.name])
+        finally:
+            self._pbar.close()
+            all_workers = [task for tasks in workers.values() for task in tasks]
+            for task in all_workers:
+                task.cancel()
+            await asyncio.gather(*all_workers, return_exceptions=True)
+            for queue in self._writer_queues.values():
+                await queue.put(None)
+            await asyncio.gather(*writers)
+            if metrics_handle is not None:
+                metrics_handle.cancel()
+                await asyncio.gather(metrics_handle, return_exceptions=True)
+            self.video_cache.save()
+            for name, store in stores.items():
+                logger.info(f"Stage {name} results store: {store.summary()}")
+                store.close()
+
+        duration = time.time() - start_time
+        stage_stats = {stage.name: stage.stats() for stage in self.stages}
+        logger.info(f"Pipeline finished in {duration:.2f} seconds. Completed: {self.completed}/{len(videos)} videos. "
+                    f"Stages: {stage_stats}")
+        logger.info(f"Video handle cache: {self.video_cache.stats()}")
+        logger.info(f"Rate limiters: {self.quota_manager.stats()}")
+        logger.info(f"Metrics{f' (written to {metrics_file})' if metrics_file else ''}:\n{DEFAULT_METRICS.report()}")
+        return {"total": len(videos), "completed": self.completed, "duration_sec": duration, "stages": stage_stats}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Resume
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _done_keys(results_file: str, key_field: str, output_field: str) -> Set[str]:
+    """Keys that need no more work, with the same rules as a single-task run."""
+    if is_store_path(results_file):
+        if not Path(results_file).is_file():
+            return set()
+        with ResultsStore(results_file, key_field, output_field) as store:
+            return store.done_keys()
+    return load_processed_qids(results_file, key_field)
+
+
+def load_successful_outputs(results_file: str, key_field: str, output_field: str) -> Dict[str, str]:
+    """key -> output of the successful rows of a results CSV or store."""
+    if not Path(results_file).is_file():
+        return {}
+    if is_store_path(results_file):
+        with ResultsStore(results_file, key_field, output_field) as store:
+            return {row[key_field]: row[output_field] for row in store.iter_rows(successful_only=True)}
+    csv.field_size_limit(sys.maxsize)
+    with open(results_file, newline="", encoding="utf-8") as f:
+        return {row[key_field]: row.get(output_field) or "" for row in csv.DictReader(f)
+                if row.get(key_field) and row.get("status") == SUCCESS_STATUS}
+
+
+def load_generated_questions(questions_file: str) -> Dict[str, List[str]]:
+    """Generated questions per video from questions.csv or a questions store."""
+    if not is_store_path(questions_file):
+        return get_questions_for_video(questions_file)
+    questions = {}
+    for video_id, value in load_successful_outputs(questions_file, "video_id", "questions").items():
+        try:
+            questions[video_id] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            logger.warning(f"Could not parse questions for video {video_id}.")
+    return questions
+
+
+def plan_videos(video_questions: Dict[str, List[Dict]], names: List[str],
+                generated_questions: Dict[str, List[str]], answered_videos: Set[str],
+                done_keys: Dict[str, Set[str]], cocot_outputs: Dict[str, str]) -> Tuple[List[VideoWork], Dict[str, int]]:
+    """
+    Places every video after the last stage it completed in an earlier run.
+
+    A video is complete for "summary" / "cocot" when all of its qids are done there,
+    for "answers" when its chat history exists, and for "questions" when its generated
+    questions are known. Videos whose next stage comes before the first selected stage
+    are skipped (their inputs are missing), as are videos past the last one.
+
+    Returns:
+        Tuple[List[VideoWork], Dict[str, int]]: Videos to run, and counts of where they start / why they are skipped.
+    """
+    first, last = PIPELINE_STAGES.index(names[0]), PIPELINE_STAGES.index(names[-1])
+    works: List[VideoWork] = []
+    counts: Dict[str, int] = {}
+    for video_id, rows in video_questions.items():
+        qids = {row["qid"] for row in rows if row.get("qid")}
+        if qids and qids <= done_keys.get("summary", set()):
+            next_stage = None
+        elif qids and qids <= done_keys.get("cocot", set()):
+            next_stage = "summary"
+        elif video_id in answered_videos:
+            next_stage = "cocot"
+        elif video_id in generated_questions:
+            next_stage = "answers"
+        else:
+            next_stage = "questions"
+
+        if next_stage is None or PIPELINE_STAGES.index(next_stage) > last:
+            outcome = "done"
+        elif PIPELINE_STAGES.index(next_stage) < first:
+            outcome = f"missing {PIPELINE_STAGES[first - 1]}"
+        else:
+            outcome = next_stage
+            preds = {qid: cocot_outputs[qid] for qid in qids if qid in cocot_outputs}
+            works.append(VideoWork(video_id, list(rows), next_stage, preds))
+        counts[outcome] = counts.get(outcome, 0) + 1
+    return works, counts
+
+
+# --- Command Line ---
+def _parse_concurrency(values: List[str]) -> Dict[str, int]:
+    concurrency = {}
+    for value in values:
+        name, _, number = value.partition("=")
+        if name not in PIPELINE_STAGES or not number.isdigit() or int(number) < 1:
+            raise ValueError(f"Expected STAGE=N with STAGE in {PIPELINE_STAGES}, got '{value}'.")
+        concurrency[name] = int(number)
+    return concurrency
+
+
+def pipeline_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference pipeline --model COT_MODEL [--summary-model ...] [...]`."""
+    parser = argparse.ArgumentParser(prog=f"python -m inference {PIPELINE_COMMAND}",
+                                     description="Run questions -> answers -> cocot (-> summary) per video, all stages at once.")
+    parser.add_argument("command", choices=(PIPELINE_COMMAND,))
+    parser.add_argument("--model", required=True, help="CoT model answering the generated questions and the final questions.")
+    parser.add_argument("--questions-model", default="gemini-2.0-flash", help="Model brainstorming the guideline questions.")
+    parser.add_argument("--summary-model", default=None, help="Summary model config (e.g. gemini-2.0-flash-ver1); adds the summary stage.")
+    parser.add_argument("--stages", default=None,
+                        help=f"Comma-separated consecutive stages of {','.join(PIPELINE_STAGES)} (default: all, summary only with --summary-model).")
+    parser.add_argument("--metadata", default=None, help="Video metadata CSV or dataset store (default: video_metadata_{vertex,non_vertex}.csv).")
+    parser.add_argument("--questions-results", default=None, help="Generated questions (default: generated_questions/QUESTIONS_MODEL/questions.csv).")
+    parser.add_argument("--answers-dir", default=None, help="Chat histories (default: generated_questions/QUESTIONS_MODEL/chat_history).")
+    parser.add_argument("--answers-results", default=None, help="Chat status file (default: generated_questions/QUESTIONS_MODEL/answers.csv).")
+    parser.add_argument("--results", default=None, help="Final CoCoT results, CSV or .sqlite (default: the notebook location).")
+    parser.add_argument("--summary-results", default=None, help="Summary results (default: results_ccot_summary.* next to --results).")
+    parser.add_argument("--num-questions", type=int, default=5, help="Guideline questions per video.")
+    parser.add_argument("--num-turns", type=int, default=DEFAULT_NUM_TURNS, help="Generated questions answered per video.")
+    parser.add_argument("--concurrency", action="append", default=[], metavar="STAGE=N",
+                        help="Videos in flight for a stage (repeatable; default: the model config's MAX_ASYNC_WORKERS).")
+    parser.add_argument("--queue-size", type=int, default=DEFAULT_QUEUE_SIZE, help="Videos waiting in front of each stage.")
+    parser.add_argument("--limit", type=int, default=None, help="Process at most N videos (testing).")
+    parser.add_argument("--vertex", action="store_true", help="Use the Vertex AI backend instead of the Gemini API.")
+    parser.add_argument("--project", default=os.environ.get("GOOGLE_CLOUD_PROJECT"), help="GCP project (Vertex).")
+    parser.add_argument("--location", default=os.environ.get("GOOGLE_CLOUD_LOCATION"), help="GCP region (Vertex).")
+    parser.add_argument("--handle-cache", default=None, help="Video handle cache file; 'none' disables persistence.")
+    parser.add_argument("--rpm", type=int, default=None, help="Override the requests-per-minute budget of every stage's model.")
+    parser.add_argument("--fixed-rate", action="store_true", help="Fixed token buckets instead of adaptive rate limiting.")
+    parser.add_argument("--metrics-file", default=None, help="Periodically write metrics here (.prom or JSON).")
+    parser.add_argument("--metrics-interval", type=float, default=DEFAULT_FLUSH_INTERVAL_SEC)
+    parser.add_argument("--no-progress", action="store_true", help="Disable the tqdm progress bar.")
+    parser.add_argument("--fake-client", action="store_true", help="Use the offline fake client.")
+    parser.add_argument("--fake-latency", type=float, default=DEFAULT_FAKE_LATENCY_SEC, help="Seconds per fake generate_content call.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    if args.stages:
+        names = [name.strip() for name in args.stages.split(",") if name.strip()]
+    else:
+        names = [name for name in PIPELINE_STAGES if name != "summary" or args.summary_model]
+    if "summary" in names and not args.summary_model:
+        parser.error("The summary stage needs --summary-model.")
+    try:
+        check_stages(names)
+        concurrency = _parse_concurrency(args.concurrency)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Imported here: the run CLI itself dispatches to this module
+    from models.registry import get_model_config
+    from .cli import default_results_file
+
+    questions_dir = f"generated_questions/{args.questions_model}"
+    questions_file = args.questions_results or os.path.join(questions_dir, "questions.csv")
+    answers_dir = args.answers_dir or os.path.join(questions_dir, "chat_history")
+    answers_file = args.answers_results or os.path.join(questions_dir, "answers.csv")
+    cot_model = get_model_config("cot", args.model)
+    results_file = args.results or default_results_file("cocot", cot_model.model_name, args.questions_model)
+    summary_file = args.summary_results or os.path.join(
+        os.path.dirname(results_file), "results_ccot_summary" + (Path(results_file).suffix or ".csv"))
+    metadata_file = args.metadata or ("video_metadata_vertex.csv" if args.vertex else "video_metadata_non_vertex.csv")
+
+    generated_questions = load_generated_questions(questions_file)
+    chat_store = ChatHistoryStore(answers_dir)
+    jobs: Dict[str, Tuple[InferenceJob, str]] = {
+        "questions": (make_question_generation_job(
+            get_model_config("brainstorm", args.questions_model, num_questions=args.num_questions)), questions_file),
+        "answers": (make_chat_job(cot_model, generated_questions, answers_dir, args.num_turns), answers_file),
+        "cocot": (make_cocot_job(cot_model, answers_dir, chat_store), results_file),
+    }
+    if args.summary_model:
+        jobs["summary"] = (make_summary_job(get_model_config("summary", args.summary_model)), summary_file)
+    stages = []
+    for name in names:
+        job, stage_file = jobs[name]
+        if args.rpm is not None:
+            job.requests_per_minute = args.rpm
+        stages.append(PipelineStage(name, job, stage_file, concurrency.get(name, job.max_async_workers),
+                                    queue_size=args.queue_size,
+                                    write_batch_size=1 if job.key_field == "video_id" else 20))
+
+    video_questions = load_metadata_for_inference(metadata_file, args.vertex)
+    done_keys = {name: _done_keys(jobs[name][1], "qid", jobs[name][0].output_field)
+                 for name in ("cocot", "summary") if name in jobs}
+    cocot_outputs = load_successful_outputs(results_file, "qid", "pred") if "summary" in names else {}
+    videos, counts = plan_videos(video_questions, names, generated_questions, list_answered_videos(answers_dir),
+                                 done_keys, cocot_outputs)
+    if args.limit is not None:
+        videos = videos[:args.limit]
+    logger.info(f"Prepared {len(videos)} videos for stages {','.join(names)}. Next stage per video: {counts}")
+    if not videos:
+        return 0
+
+    if args.fake_client:
+        from .fake_client import FakeGeminiClient
+        client = FakeGeminiClient(latency_sec=args.fake_latency)
+    else:
+        from .clients import create_genai_client
+        client = create_genai_client(args.vertex, args.project, args.location)
+    handle_cache_path = args.handle_cache or default_handle_cache_path(metadata_file)
+    video_cache = VideoHandleCache(client, args.vertex, persist_path=None if handle_cache_path == "none" else handle_cache_path)
+    pipeline = VideoPipeline(client, stages, args.vertex, video_cache, QuotaManager(adaptive=not args.fixed_rate),
+                             done_keys, chat_store)
+
+    summary = asyncio.run(pipeline.run(videos, show_progress=not args.no_progress,
+                                       metrics_file=args.metrics_file, metrics_interval_sec=args.metrics_interval))
+    logger.info(f"Chat history store: {chat_store.stats()}")
+    return 0 if summary["completed"] == summary["total"] else 1
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import collections
+import csv
+import logging
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from .engine import run_bulk_inference_async
+from .fake_client import FakeGeminiClient, FakeResponse
+from .jobs import InferenceJob, text_response
+from .rate_limiter import QuotaManager
+from .retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Simulated Quota
+# ──────────────────────────────────────────────────────────────────────────────
+# Offline harness for the rate limiter: a fake client that enforces a real
+# sliding-window RPM/TPM quota and answers 429 like the API does. A "minute"
+# is compressed to `minute_sec` so a run takes seconds, not hours.
+
+class ResourceExhausted(Exception):
+    """Same class name and `code` as the API's quota error, so the engine treats it identically."""
+    code = 429
+
+    def __init__(self, message: str, retry_delay_sec: float):
+        super().__init__(message)
+        self.details = {"retryDelay": f"{retry_delay_sec:.3f}s"}
+
+
+class _QuotaModels:
+    def __init__(self, owner: "SimulatedQuotaClient", inner: Any):
+        self._owner = owner
+        self._inner = inner
+
+    async def generate_content(self, *, model: str, contents: List[Any], config: Any = None) -> FakeResponse:
+        self._owner.check_quota()
+        response = await self._inner.generate_content(model=model, contents=contents, config=config)
+        response.usage_metadata = SimpleNamespace(total_token_count=self._owner.tokens_per_request)
+        return response
+
+
+class SimulatedQuotaClient(FakeGeminiClient):
+    """
+    `FakeGeminiClient` with a sliding-window quota.
+
+    Args:
+        requests_per_minute (int): Real RPM quota.
+        tokens_per_minute (int, optional): Real TPM quota.
+        tokens_per_request (int): Tokens reported in `usage_metadata` for every request.
+        minute_sec (float): Length of one quota "minute".
+        latency_sec (float): Simulated latency of every accepted request.
+    """
+    def __init__(self, requests_per_minute: int, tokens_per_minute: Optional[int] = None,
+                 tokens_per_request: int = 1000, minute_sec: float = 60.0, latency_sec: float = 0.0):
+        super().__init__(latency_sec=latency_sec)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.tokens_per_request = tokens_per_request
+        self.minute_sec = minute_sec
+        self.throttled = 0
+        self._window: Deque[Tuple[float, int]] = collections.deque()
+        self._window_tokens = 0
+        self.aio.models = _QuotaModels(self, self.aio.models)
+
+    def check_quota(self):
+        """Admits a request into the window or raises `ResourceExhausted`."""
+        now = time.monotonic()
+        while self._window and self._window[0][0] <= now - self.minute_sec:
+            self._window_tokens -= self._window.popleft()[1]
+        over_rpm = len(self._window) >= self.requests_per_minute
+        over_tpm = (self.tokens_per_minute is not None
+                    and self._window_tokens + self.tokens_per_request > self.tokens_per_minute)
+        if over_rpm or over_tpm:
+            self.throttled += 1
+            retry_delay = self._window[0][0] + self.minute_sec - now if self._window else 0.0
+            raise ResourceExhausted("429 RESOURCE_EXHAUSTED: quota exceeded.", max(retry_delay, 0.0))
+        self._window.append((now, self.tokens_per_request))
+        self._window_tokens += self.tokens_per_request
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Fixed vs Adaptive Comparison
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _count_statuses(results_file: str) -> collections.Counter:
+    with open(results_file, newline="", encoding="utf-8") as f:
+        return collections.Counter(row["status"] for row in csv.DictReader(f))
+
+
+async def simulate(adaptive: bool, num_requests: int = 300, configured_rpm: int = 120,
+                   quota_rpm: int = 60, quota_tpm: Optional[int] = None, configured_tpm: Optional[int] = None,
+                   tokens_per_request: int = 1000, minute_sec: float = 2.0, latency_sec: float = 0.02,
+                   max_retries: int = 5, max_async_workers: int = 20) -> Dict[str, Any]:
+    """
+    Runs `num_requests` fake questions through `run_bulk_inference_async` against a simulated quota.
+
+    `configured_rpm` plays the role of REQUESTS_PER_MINUTE in `models/*`; setting it above
+    `quota_rpm` reproduces a run whose configured limit is wrong (or shared with another job).
+    """
+    client = SimulatedQuotaClient(quota_rpm, quota_tpm, tokens_per_request, minute_sec, latency_sec)
+    job = InferenceJob(
+        model_name="simulated-model", config=None,
+        build_contents=lambda item, video_part: [video_part, item["question"]],
+        parse_response=text_response, requests_per_minute=configured_rpm,
+        max_async_workers=max_async_workers, tokens_per_minute=configured_tpm,
+        retry_policy=RetryPolicy(max_retries=max_retries, initial_backoff_sec=minute_sec / 12,
+                                 max_backoff_sec=minute_sec, deadline_sec=minute_sec * 10),
+    )
+    items = [{"qid": f"q{i}", "question": f"Question {i}?", "file_api_name": f"files/v{i // 4}"}
+             for i in range(num_requests)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        results_file = os.path.join(tmp_dir, "results.csv")
+        quotas = QuotaManager(adaptive=adaptive, minute_sec=minute_sec)
+        summary = await run_bulk_inference_async(items, client, job, results_file,
+                                                 show_progress=False, quota_manager=quotas)
+        statuses = await asyncio.to_thread(_count_statuses, results_file)
+
+    successes = statuses.get("Success", 0)
+    return {
+        "mode": "adaptive" if adaptive else "fixed",
+        "requests": num_requests,
+        "success": successes,
+        "failed": num_requests - successes,
+        "429s": client.throttled,
+        "duration_sec": round(summary["duration_sec"], 2),
+        "achieved_rpm": round(successes / summary["duration_sec"] * minute_sec, 1),
+        "limiter": quotas.stats().get(job.model_name, {}),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m inference.quota_sim",
+                                     description="Compare fixed and adaptive rate limiting against a simulated quota.")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--configured-rpm", type=int, default=120, help="REQUESTS_PER_MINUTE given to the limiter.")
+    parser.add_argument("--quota-rpm", type=int, default=60, help="Real RPM enforced by the simulated API.")
+    parser.add_argument("--configured-tpm", type=int, default=None, help="TPM budget given to the limiter.")
+    parser.add_argument("--quota-tpm", type=int, default=None, help="Real TPM enforced by the simulated API.")
+    parser.add_argument("--tokens-per-request", type=int, default=1000)
+    parser.add_argument("--minute-sec", type=float, default=2.0, help="Length of a simulated minute.")
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--log-level", default="ERROR")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper(), format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    for adaptive in (False, True):
+        result = asyncio.run(simulate(
+            adaptive, args.requests, args.configured_rpm, args.quota_rpm, args.quota_tpm, args.configured_tpm,
+            args.tokens_per_request, args.minute_sec, args.latency, args.max_retries,
+        ))
+        print(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Token Bucket Rate Limiter
+# ──────────────────────────────────────────────────────────────────────────────
+
+class AsyncRateLimiter:
+    """
+    An asyncio-compatible token bucket rate limiter.
+
+    The lock is created lazily on the running event loop, so the same limiter can be
+    reused across several `asyncio.run()` calls without `nest_asyncio`. Waiting happens
+    outside the lock, so a cancelled waiter never leaves the lock in a released state.
+
+    Args:
+        rate (int): The maximum number of requests allowed per period.
+        period (float): The time period in seconds (default: 60 for RPM).
+        capacity (int, optional): The maximum burst capacity. Defaults to `rate`.
+    """
+    def __init__(self, rate: int, period: float = 60.0, capacity: Optional[int] = None):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        if period <= 0:
+            raise ValueError("Period must be positive")
+
+        self.rate = rate
+        self.period = float(period)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self._tokens = self.capacity # Start full
+        self._last_refill_time = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_tokens_per_second(self) -> float:
+        return self.rate / self.period
+
+    def _get_lock(self) -> asyncio.Lock:
+        """Returns a lock bound to the currently running loop."""
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock_loop is not loop:
+            self._lock = asyncio.Lock()
+            self._lock_loop = loop
+        return self._lock
+
+    def _refill(self):
+        """Replenishes tokens based on elapsed time. Must be called under lock."""
+        now = time.monotonic()
+        elapsed = now - self._last_refill_time
+        if elapsed > 0:
+            tokens_to_add = elapsed * self._get_tokens_per_second()
+            self._tokens = min(self.capacity, self._tokens + tokens_to_add)
+            self._last_refill_time = now
+
+    async def acquire(self, estimated_tokens: Optional[int] = None) -> int:
+        """
+        Acquires a token, waiting if necessary.
+
+        Returns:
+            int: Model tokens charged against a TPM budget (always 0 here).
+        """
+        while True:
+            async with self._get_lock():
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1.0
+                    return 0
+                # Calculate how long to wait for 1 token
+                wait_time = (1.0 - self._tokens) / self._get_tokens_per_second()
+
+            logger.debug(f"Rate limit hit. Waiting for {wait_time:.3f}s for next token.")
+            await asyncio.sleep(wait_time)
+
+    def try_acquire(self) -> Optional[int]:
+        """Takes a token only if one is available right now (e.g. for a hedged request). Returns the charge, or None."""
+        self._refill() # No await in between, so this cannot interleave with `acquire`
+        if self._tokens < 1:
+            return None
+        self._tokens -= 1.0
+        return 0
+
+    # --- Feedback hooks (no-ops for the fixed limiter) ---
+    def record_success(self, tokens_used: Optional[int] = None, charged_tokens: int = 0):
+        pass
+
+    def record_throttle(self):
+        pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": self.rate, "period_sec": self.period}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Adaptive (AIMD) Limiter with Tokens-Per-Minute Budget
+# ──────────────────────────────────────────────────────────────────────────────
+
+class AdaptiveRateLimiter(AsyncRateLimiter):
+    """
+    A token bucket whose request rate adapts to quota feedback, AIMD style.
+
+    Every `ResourceExhausted` / 429 multiplies the rate by `decrease_factor` (at most
+    once per `cooldown_sec`, so a burst of concurrent 429s counts once) and empties
+    the bucket. Every success adds `increase_step / rate`, i.e. roughly `increase_step`
+    requests-per-period per period of clean traffic, up to `max_rate`.
+
+    When `tokens_per_period` is set, a second bucket limits model tokens. Requests are
+    charged a running estimate of their size up front, and the difference is settled
+    once `usage_metadata` reports the real count.
+
+    Args:
+        rate (int): Starting requests per period (e.g. REQUESTS_PER_MINUTE).
+        period (float): Period in seconds (default: 60).
+        capacity (int, optional): Burst capacity of the request bucket.
+        tokens_per_period (int, optional): Token budget per period (TPM), None to disable.
+        min_rate (float): Floor for the adapted rate.
+        max_rate (float, optional): Ceiling for the adapted rate. Defaults to `rate`.
+        increase_step (float, optional): Additive increase per period. Defaults to 5% of `max_rate`.
+        decrease_factor (float): Multiplicative decrease on throttle.
+        cooldown_sec (float, optional): Minimum time between two decreases. Defaults to `period / 2`.
+        initial_token_estimate (int): Token charge per request until usage has been observed.
+    """
+    def __init__(self, rate: int, period: float = 60.0, capacity: Optional[int] = None,
+                 tokens_per_period: Optional[int] = None, min_rate: float = 1.0,
+                 max_rate: Optional[float] = None, increase_step: Optional[float] = None,
+                 decrease_factor: float = 0.7, cooldown_sec: Optional[float] = None,
+                 initial_token_estimate: int = 1000):
+        super().__init__(rate, period, capacity)
+        if not 0 < decrease_factor < 1:
+            raise ValueError("decrease_factor must be between 0 and 1")
+        self.rate = float(rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate if max_rate is not None else rate)
+        self.increase_step = increase_step if increase_step is not None else max(1.0, 0.05 * self.max_rate)
+        self.decrease_factor = decrease_factor
+        self.cooldown_sec = cooldown_sec if cooldown_sec is not None else self.period / 2
+        self.tokens_per_period = tokens_per_period
+        self._model_tokens = float(tokens_per_period or 0)
+        self.token_estimate = float(initial_token_estimate)
+        self._last_decrease = -float("inf")
+        self.successes = 0
+        self.throttles = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill_time
+        if elapsed > 0 and self.tokens_per_period:
+            self._model_tokens = min(float(self.tokens_per_period),
+                                     self._model_tokens + elapsed * self.tokens_per_period / self.period)
+        super()._refill()
+
+    async def acquire(self, estimated_tokens: Optional[int] = None) -> int:
+        """
+        Acquires one request slot and, with a TPM budget, `estimated_tokens` model tokens.
+
+        Returns:
+            int: Model tokens charged, to pass back to `record_success`.
+        """
+        while True:
+            async with self._get_lock():
+                self._refill()
+                charge = 0
+                wait_time = 0.0
+                if self._tokens < 1:
+                    wait_time = (1.0 - self._tokens) / self._get_tokens_per_second()
+                if self.tokens_per_period:
+                    # A single oversized request may use the whole bucket, never more
+                    charge = int(min(estimated_tokens or self.token_estimate, self.tokens_per_period))
+                    if self._model_tokens < charge:
+                        token_rate = self.tokens_per_period / self.period
+                        wait_time = max(wait_time, (charge - self._model_tokens) / token_rate)
+                if wait_time <= 0:
+                    self._tokens -= 1.0
+                    self._model_tokens -= charge
+                    return charge
+
+            logger.debug(f"Adaptive limit hit ({self.rate:.1f}/period). Waiting {wait_time:.3f}s.")
+            await asyncio.sleep(wait_time)
+
+    def try_acquire(self) -> Optional[int]:
+        self._refill()
+        charge = int(min(self.token_estimate, self.tokens_per_period)) if self.tokens_per_period else 0
+        if self._tokens < 1 or self._model_tokens < charge:
+            return None
+        self._tokens -= 1.0
+        self._model_tokens -= charge
+        return charge
+
+    def record_success(self, tokens_used: Optional[int] = None, charged_tokens: int = 0):
+        self.successes += 1
+        self.rate = min(self.max_rate, self.rate + self.increase_step / max(self.rate, 1.0))
+        if tokens_used:
+            # Settle the up-front charge and track the typical request size
+            self._model_tokens -= tokens_used - charged_tokens
+            self.token_estimate = 0.8 * self.token_estimate + 0.2 * tokens_used
+
+    def record_throttle(self):
+        self.throttles += 1
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown_sec:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+        self._tokens = min(self._tokens, 0.0) # Pause new requests until the bucket refills
+        logger.warning(f"Quota exhausted, reducing rate to {self.rate:.1f} per {self.period:.0f}s.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {"rate": round(self.rate, 2), "period_sec": self.period, "successes": self.successes,
+                "throttles": self.throttles, "token_estimate": round(self.token_estimate)}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Shared Budgets
+# ──────────────────────────────────────────────────────────────────────────────
+
+class QuotaManager:
+    """
+    Hands out one limiter per model, so every stage using a model in this process
+    (question generation, CoCoT answers, summaries, ...) draws from the same quota.
+
+    Args:
+        adaptive (bool): Hand out `AdaptiveRateLimiter`s instead of fixed token buckets.
+        minute_sec (float): Length of one quota "minute". Only shortened by simulations.
+    """
+    def __init__(self, adaptive: bool = True, minute_sec: float = 60.0):
+        self.adaptive = adaptive
+        self.minute_sec = minute_sec
+        self._limiters: Dict[str, AsyncRateLimiter] = {}
+
+    def limiter_for(self, model_name: str, requests_per_minute: Optional[int],
+                    tokens_per_minute: Optional[int] = None, capacity: Optional[int] = None,
+                    max_requests_per_minute: Optional[int] = None) -> Optional[AsyncRateLimiter]:
+        """Returns the shared limiter for `model_name`, creating it on first use. None disables limiting."""
+        if model_name in self._limiters:
+            return self._limiters[model_name]
+        if not requests_per_minute or requests_per_minute <= 0:
+            return None
+        if self.adaptive:
+            limiter = AdaptiveRateLimiter(
+                rate=requests_per_minute, period=self.minute_sec, capacity=capacity,
+                tokens_per_period=tokens_per_minute,
+                max_rate=max_requests_per_minute or requests_per_minute,
+            )
+        else:
+            limiter = AsyncRateLimiter(rate=requests_per_minute, period=self.minute_sec, capacity=capacity)
+        self._limiters[model_name] = limiter
+        return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {name: limiter.stats() for name, limiter in self._limiters.items()}
+
+
+DEFAULT_QUOTAS = QuotaManager()
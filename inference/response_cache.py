@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESPONSE_CACHE = "response_cache.sqlite"
+DEFAULT_MAX_ENTRIES = 200_000
+KEY_VERSION = 1                      # Bump when the key layout changes
+CACHEABLE_FINISH_REASONS = ("STOP",) # Truncated / blocked responses are always re-requested
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Request Fingerprints
+# ──────────────────────────────────────────────────────────────────────────────
+# A response is reused only for the exact same request: model, full config (system
+# instruction, thinking budget, schema, ...), every prompt / chat message and the
+# video *content*. Video handles expire and change on re-upload, so videos are
+# keyed by the `content_sha256` written by `upload-videos` when available.
+
+def video_key_for(item: Dict) -> str:
+    """Stable identity of a metadata row's video: content digest, else its handle."""
+    for column in ("content_sha256", "gcs_uri", "file_api_name", "video_id"):
+        if item.get(column):
+            return f"{column}:{item[column]}"
+    return ""
+
+
+def _is_video(obj: Any) -> bool:
+    from google.genai import types
+
+    return isinstance(obj, types.File) or getattr(obj, "file_data", None) is not None or (
+        not isinstance(obj, (types.Content, types.Part, str)) and getattr(obj, "uri", None) is not None)
+
+
+def _video_uri(obj: Any) -> str:
+    file_data = getattr(obj, "file_data", None)
+    return getattr(file_data, "file_uri", None) or getattr(obj, "uri", None) or str(obj)
+
+
+def _canonical_part(part: Any, video_key: Optional[str]) -> Any:
+    if _is_video(part):
+        return {"video": video_key or _video_uri(part)}
+    if isinstance(part, str):
+        return {"text": part}
+    if getattr(part, "text", None) is not None:
+        return {"text": part.text}
+    if hasattr(part, "model_dump"):
+        return part.model_dump(mode="json", exclude_none=True)
+    return str(part)
+
+
+def _canonical_contents(contents: List[Any], video_key: Optional[str]) -> List[Any]:
+    from google.genai import types
+
+    canonical = []
+    for item in contents:
+        parts = getattr(item, "parts", None)
+        if isinstance(item, types.Content) or parts is not None:
+            canonical.append({"role": getattr(item, "role", None),
+                              "parts": [_canonical_part(p, video_key) for p in parts or []]})
+        else:
+            canonical.append(_canonical_part(item, video_key))
+    return canonical
+
+
+def _canonical_config(config: Any) -> Any:
+    if config is None:
+        return None
+    if not hasattr(config, "model_dump"):
+        return str(config)
+    dumped = config.model_dump(mode="json", exclude_none=True,
+                               exclude={"response_schema", "http_options", "cached_content"})
+    schema = getattr(config, "response_schema", None)
+    if isinstance(schema, type) and hasattr(schema, "model_json_schema"):
+        dumped["response_schema"] = schema.model_json_schema()
+    elif schema is not None:
+        dumped["response_schema"] = schema.model_dump(mode="json", exclude_none=True) if hasattr(schema, "model_dump") else str(schema)
+    return dumped
+
+
+def request_key(model_name: str, config: Any, contents: List[Any], video_key: Optional[str] = None) -> str:
+    """sha256 of the canonical request (model, config, contents; video parts replaced by `video_key`)."""
+    payload = {"v": KEY_VERSION, "model": model_name, "config": _canonical_config(config),
+               "contents": _canonical_contents(contents, video_key)}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str).encode()).hexdigest()
+
+
+class CachedResponse:
+    """Replayed response, shaped like `types.GenerateContentResponse` for the parsers."""
+    def __init__(self, text: str, finish_reason: str = "STOP", parsed: Any = None):
+        self.text = text
+        self.parsed = parsed
+        self.candidates = [SimpleNamespace(finish_reason=SimpleNamespace(name=finish_reason))]
+        self.usage_metadata = None # Nothing was spent
+        self.from_cache = True
+
+    def __str__(self) -> str:
+        return self.text
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Disk-Backed Response Cache
+# ──────────────────────────────────────────────────────────────────────────────
+
+class ResponseCache:
+    """
+    Memoizes `generate_content` responses on disk (SQLite), keyed by `request_key`.
+
+    Changing a prompt, the config or the model changes the key, so only the affected
+    requests are sent again; rerunning under a new results file costs nothing.
+    The cache keeps at most `max_entries` responses, evicting the least recently used.
+
+    Args:
+        path (str): SQLite file.
+        max_entries (int): LRU bound.
+        read_only (bool): Serve hits but never write (reproducible submissions). The file must exist.
+    """
+    def __init__(self, path: str = DEFAULT_RESPONSE_CACHE, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 read_only: bool = False):
+        self.path = path
+        self.max_entries = max_entries
+        self.read_only = read_only
+        self._lock = threading.Lock() # Used from `asyncio.to_thread` workers and the sync UI
+        if read_only:
+            self._conn = sqlite3.connect(f"file:{Path(path).resolve()}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY, model TEXT, text TEXT NOT NULL, finish_reason TEXT,"
+                " created_at REAL, last_used REAL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+            self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self) -> "ResponseCache":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    # --- Lookup ---
+    def get(self, key: str, config: Any = None) -> Optional[CachedResponse]:
+        """Returns the cached response for `key`; `config.response_schema` re-creates `parsed`."""
+        with self._lock:
+            row = self._conn.execute("SELECT text, finish_reason FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if not self.read_only:
+                with self._conn:
+                    self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+        text, finish_reason = row
+        parsed = None
+        schema = getattr(config, "response_schema", None)
+        if isinstance(schema, type) and hasattr(schema, "model_validate_json"):
+            try:
+                parsed = schema.model_validate_json(text)
+            except ValueError:
+                pass # Same as an unparsable live response
+        return CachedResponse(text, finish_reason or "STOP", parsed)
+
+    # --- Storing ---
+    def put(self, key: str, response: Any, model_name: str = "") -> bool:
+        """Stores a complete response (finish reason STOP, non-empty text). Returns whether it was stored."""
+        if self.read_only or getattr(response, "from_cache", False):
+            return False
+        candidates = getattr(response, "candidates", None) or []
+        finish_reason = getattr(getattr(candidates[0], "finish_reason", None), "name", None) if candidates else None
+        try:
+            text = response.text
+        except (ValueError, AttributeError):
+            return False
+        if not text or finish_reason not in CACHEABLE_FINISH_REASONS:
+            return False
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone() is not None
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, text, finish_reason, created_at, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)", (key, model_name, text, finish_reason, now, now))
+            self._count += 0 if exists else 1
+            self.writes += 1
+            if self._count > self.max_entries:
+                self._evict(self._count - self.max_entries)
+        return True
+
+    def _evict(self, count: int):
+        with self._conn:
+            self._conn.execute("DELETE FROM responses WHERE key IN"
+                               " (SELECT key FROM responses ORDER BY last_used LIMIT ?)", (count,))
+        self._count -= count
+        self.evictions += count
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {"entries": self._count, "hits": self.hits, "misses": self.misses, "writes": self.writes,
+                "evictions": self.evictions, "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "read_only": self.read_only}
+
+
+def generate_content_cached(cache: Optional[ResponseCache], client: Any, model: str, contents: List[Any],
+                            config: Any = None, video_key: Optional[str] = None) -> Any:
+    """Sync `client.models.generate_content` through `cache` (the notebooks' interactive UI)."""
+    if cache is None:
+        return client.models.generate_content(model=model, contents=contents, config=config)
+    key = request_key(model, config, contents, video_key)
+    cached = cache.get(key, config)
+    if cached is not None:
+        return cached
+    response = client.models.generate_content(model=model, contents=contents, config=config)
+    cache.put(key, response, model)
+    return response
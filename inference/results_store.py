@@ -0,0 +1,192 @@
+import argparse
+import csv
+import logging
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+STORE_SUFFIXES = (".sqlite", ".db")
+SUCCESS_STATUS = "Success"
+PARTIAL_STATUS = "Partial" # Text so far of a response still streaming; replaced by the final row
+
+
+def is_store_path(filename: str) -> bool:
+    """Results files ending in `.sqlite` / `.db` use `ResultsStore` instead of an appended CSV."""
+    return Path(filename).suffix.lower() in STORE_SUFFIXES
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SQLite (WAL) Results Store
+# ──────────────────────────────────────────────────────────────────────────────
+# One row per key (qid or video_id), upserted as results arrive. The primary key
+# is the resume index, so resuming reads keys only and never the prediction text.
+# A successful row is never overwritten by a later failure, while a failed row is
+# replaced by the next attempt, so reruns retry failures without any cleanup pass.
+
+class ResultsStore:
+    """
+    Append/upsert store for inference results, backed by SQLite in WAL mode.
+
+    Each `write_many` call is one transaction, so a crash loses at most the batch in
+    flight (which resume simply redoes) and never leaves a half-written row behind.
+
+    Args:
+        path (str): Database file (e.g. `results_noncot_full_inference.sqlite`).
+        key_field (str): Name of the key column in rows and exports ("qid" / "video_id").
+        output_field (str): Name of the output column in rows and exports ("pred" / "questions").
+    """
+    def __init__(self, path: str, key_field: str = "qid", output_field: str = "pred"):
+        self.path = path
+        self.key_field = key_field
+        self.output_field = output_field
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        # Writes come from `asyncio.to_thread` workers, one batch at a time
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            " key TEXT PRIMARY KEY, output TEXT, status TEXT, duration_sec REAL,"
+            " finish_reason TEXT, attempts INTEGER NOT NULL DEFAULT 1, updated_at REAL)"
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self) -> "ResultsStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # --- Writing ---
+    def _to_record(self, row: Dict, now: float) -> Tuple:
+        output = row.get(self.output_field)
+        duration = row.get("duration_sec", row.get("duration"))
+        return (str(row[self.key_field]), None if output is None else str(output), row.get("status"),
+                None if duration in (None, "") else float(duration), row.get("finish_reason"), now)
+
+    def write_many(self, rows: Iterable[Dict]) -> int:
+        """Upserts a batch of result rows in one transaction. Returns the number of rows given."""
+        now = time.time()
+        records = [self._to_record(row, now) for row in rows if row.get(self.key_field) not in (None, "")]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO results (key, output, status, duration_sec, finish_reason, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(key) DO UPDATE SET output=excluded.output, status=excluded.status,"
+                " duration_sec=excluded.duration_sec, finish_reason=excluded.finish_reason,"
+                f" attempts=results.attempts + (results.status IS NOT '{PARTIAL_STATUS}'), updated_at=excluded.updated_at"
+                f" WHERE results.status IS NOT '{SUCCESS_STATUS}'",
+                records,
+            )
+        return len(records)
+
+    # --- Resume ---
+    def done_keys(self, successful_only: bool = True) -> Set[str]:
+        """Keys that need no further work. With `successful_only`, failed keys are retried."""
+        query = "SELECT key FROM results"
+        if successful_only:
+            query += " WHERE status = ?"
+            return {key for (key,) in self._conn.execute(query, (SUCCESS_STATUS,))}
+        return {key for (key,) in self._conn.execute(query)}
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    # --- Reporting & Export ---
+    def summary(self) -> Dict[str, Any]:
+        """Status counts and average duration, computed inside SQLite."""
+        counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM results GROUP BY status"))
+        avg_duration = self._conn.execute(
+            "SELECT AVG(duration_sec) FROM results WHERE status = ?", (SUCCESS_STATUS,)).fetchone()[0]
+        success = counts.get(SUCCESS_STATUS, 0)
+        return {"total": sum(counts.values()), "success": success, "failed": sum(counts.values()) - success,
+                "by_status": counts, "avg_success_duration_sec": avg_duration}
+
+    def iter_rows(self, successful_only: bool = False, failed_only: bool = False) -> Iterator[Dict]:
+        """Streams rows ordered by key, one at a time."""
+        query = "SELECT key, output, status, duration_sec, finish_reason FROM results"
+        params: Tuple = ()
+        if successful_only:
+            query, params = query + " WHERE status = ?", (SUCCESS_STATUS,)
+        elif failed_only:
+            query, params = query + " WHERE status IS NOT ?", (SUCCESS_STATUS,)
+        for key, output, status, duration, finish_reason in self._conn.execute(query + " ORDER BY key", params):
+            yield {self.key_field: key, self.output_field: output, "status": status,
+                   "duration_sec": duration, "finish_reason": finish_reason}
+
+    def export_csv(self, csv_path: str, columns: Optional[List[str]] = None,
+                   successful_only: bool = False, failed_only: bool = False) -> int:
+        """
+        Streams rows into a CSV (default columns: `qid,pred`, i.e. the submission format).
+
+        Returns:
+            int: Number of rows written.
+        """
+        columns = columns or [self.key_field, self.output_field]
+        count = 0
+        tmp_path = csv_path + ".tmp"
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+            for row in self.iter_rows(successful_only, failed_only):
+                writer.writerow(row)
+                count += 1
+        os.replace(tmp_path, csv_path)
+        logger.info(f"Exported {count} rows from {self.path} to {csv_path}.")
+        return count
+
+    def import_csv(self, csv_path: str, batch_size: int = 1000) -> int:
+        """Streams an existing results CSV (e.g. from the notebooks) into the store."""
+        csv.field_size_limit(sys.maxsize) # CoT predictions can exceed the default 128 KB
+        imported = 0
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    imported += self.write_many(batch)
+                    batch = []
+            if batch:
+                imported += self.write_many(batch)
+        logger.info(f"Imported {imported} rows from {csv_path} into {self.path}.")
+        return imported
+
+
+STORE_COMMANDS = ("summary", "export", "export-failed", "import")
+
+
+def store_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference {summary,export,export-failed,import} STORE [CSV]`."""
+    parser = argparse.ArgumentParser(prog="python -m inference",
+                                     description="Report on, export or import a results store.")
+    parser.add_argument("command", choices=STORE_COMMANDS)
+    parser.add_argument("store", help="Results store (.sqlite / .db).")
+    parser.add_argument("csv", nargs="?", help="CSV to export to / import from.")
+    parser.add_argument("--key-field", default="qid")
+    parser.add_argument("--output-field", default="pred")
+    parser.add_argument("--successful-only", action="store_true", help="Export only successful rows.")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    if args.command != "summary" and not args.csv:
+        parser.error(f"'{args.command}' needs a CSV path.")
+    with ResultsStore(args.store, args.key_field, args.output_field) as store:
+        if args.command == "summary":
+            print(store.summary())
+        elif args.command == "export":
+            store.export_csv(args.csv, successful_only=args.successful_only)
+        elif args.command == "export-failed":
+            store.export_csv(args.csv, columns=[args.key_field, args.output_field, "status", "finish_reason"],
+                             failed_only=True)
+        else:
+            store.import_csv(args.csv)
+    return 0
@@ -0,0 +1,66 @@
+import random
+import re
+from dataclasses import dataclass
+from typing import Any, Optional
+
+RETRYABLE_STATUS_CODES = {429, 500, 503, 504}
+RETRYABLE_ERROR_NAMES = {"ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded", "TooManyRequests"}
+THROTTLE_ERROR_NAMES = {"ResourceExhausted", "TooManyRequests"}
+HANDLE_ERROR_CODES = {403, 404} # generate_content on a File API handle that expired or was deleted
+
+
+def is_retryable_error(exc: BaseException) -> bool:
+    """True for quota / transient server errors from either `google.genai` or `google.api_core`."""
+    if type(exc).__name__ in RETRYABLE_ERROR_NAMES:
+        return True
+    return getattr(exc, "code", None) in RETRYABLE_STATUS_CODES
+
+
+def is_throttle_error(exc: BaseException) -> bool:
+    """True only for quota signals (429 / ResourceExhausted), which should slow the limiter down."""
+    return type(exc).__name__ in THROTTLE_ERROR_NAMES or getattr(exc, "code", None) == 429
+
+
+def is_handle_error(exc: BaseException) -> bool:
+    """True when the video handle is gone: `files.get` found nothing (FileNotFoundError) or the API answered 403/404."""
+    return isinstance(exc, FileNotFoundError) or getattr(exc, "code", None) in HANDLE_ERROR_CODES
+
+
+def retry_after_seconds(exc: BaseException) -> Optional[float]:
+    """Extracts the server-suggested delay (`RetryInfo.retryDelay`, e.g. "17s") from an API error."""
+    details: Any = getattr(exc, "details", None)
+    match = re.search(r"retryDelay['\"]?\s*[:=]\s*['\"]?(\d+(?:\.\d+)?)s", str(details) if details else str(exc))
+    return float(match.group(1)) if match else None
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Retry Policy
+# ──────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter and an overall per-request deadline.
+
+    Args:
+        max_retries (int): Retries after the first attempt.
+        initial_backoff_sec (float): Backoff ceiling for the first retry.
+        max_backoff_sec (float): Upper bound for any single backoff.
+        deadline_sec (float, optional): Give up once this much time has passed since the first attempt.
+    """
+    max_retries: int = 1
+    initial_backoff_sec: float = 5.0
+    max_backoff_sec: float = 120.0
+    deadline_sec: Optional[float] = 600.0
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        ceiling = min(self.max_backoff_sec, self.initial_backoff_sec * (2 ** attempt))
+        delay = random.uniform(0, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def can_retry(self, attempt: int, elapsed_sec: float, next_delay: float) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return self.deadline_sec is None or elapsed_sec + next_delay < self.deadline_sec
@@ -0,0 +1,416 @@
+import asyncio
+import csv
+import heapq
+import json
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from .data import resource_column
+from .metrics import DEFAULT_METRICS, Histogram
+from .results_store import PARTIAL_STATUS, ResultsStore, is_store_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEDGE_QUANTILE = 0.95
+DEFAULT_HEDGE_BUDGET = 0.05      # At most this fraction of requests get a hedged duplicate
+HEDGE_MIN_SAMPLES = 20           # Latencies observed before the first hedge
+DEFAULT_REQUEUE_PASSES = 1
+REQUEUE_STATUSES = ("Failed (Retries)", "Blocked/Empty")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Cost Prediction
+# ──────────────────────────────────────────────────────────────────────────────
+
+def load_past_latencies(results_file: str, key_field: str) -> Dict[str, float]:
+    """`duration_sec` per key from an earlier run's results CSV or store (failed attempts included)."""
+    latencies: Dict[str, float] = {}
+    if not Path(results_file).is_file():
+        return latencies
+    try:
+        if is_store_path(results_file):
+            with ResultsStore(results_file, key_field) as store:
+                rows: Iterable[Dict] = list(store.iter_rows())
+        else:
+            with open(results_file, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+        for row in rows:
+            duration = row.get("duration_sec")
+            if row.get(key_field) and duration not in (None, "") and float(duration) > 0:
+                latencies[str(row[key_field])] = float(duration)
+    except (OSError, ValueError, csv.Error) as e:
+        logger.warning(f"Could not read past latencies from {results_file}: {e}")
+    return latencies
+
+
+def load_video_durations(paths: Iterable[str]) -> Dict[str, float]:
+    """
+    Video length (seconds) per video_id, from `prepare-videos` ffprobe output:
+    `probe_cache.json` (keyed by path) or `prep_report.csv` (`video`, `duration_sec`).
+    """
+    durations: Dict[str, float] = {}
+    for path in paths:
+        if not Path(path).is_file():
+            continue
+        try:
+            if path.endswith(".json"):
+                with open(path, encoding="utf-8") as f:
+                    for key, info in json.load(f).items():
+                        if info.get("duration_sec"):
+                            durations[Path(key.split("|", 1)[0]).stem] = float(info["duration_sec"])
+            else:
+                with open(path, newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        if row.get("video") and row.get("duration_sec"):
+                            durations[Path(row["video"]).stem] = float(row["duration_sec"])
+        except (OSError, ValueError, csv.Error) as e:
+            logger.warning(f"Ignoring unreadable video durations {path}: {e}")
+    return durations
+
+
+class CostModel:
+    """
+    Predicted request time per item, from (in order of preference) the key's own past
+    latency, the mean past latency of its video, its video length from ffprobe scaled
+    by the observed seconds-of-latency per second-of-video, or the typical latency.
+
+    Args:
+        video_of (dict): key → video_id for every known key (including finished ones).
+        past_latencies (dict): key → duration_sec of earlier attempts.
+        video_durations (dict): video_id → video length in seconds.
+    """
+    def __init__(self, video_of: Dict[str, str], past_latencies: Optional[Dict[str, float]] = None,
+                 video_durations: Optional[Dict[str, float]] = None):
+        self.past_latencies = dict(past_latencies or {})
+        self.video_durations = dict(video_durations or {})
+        by_video: Dict[str, List[float]] = defaultdict(list)
+        for key, latency in self.past_latencies.items():
+            if key in video_of:
+                by_video[video_of[key]].append(latency)
+        self.video_latency = {video: sum(values) / len(values) for video, values in by_video.items()}
+        scaled = [(latency, self.video_durations[video]) for video, latency in self.video_latency.items()
+                  if self.video_durations.get(video)]
+        # Without any latency history, video length itself is the (relative) cost
+        self.sec_per_video_sec = sum(l for l, _ in scaled) / sum(d for _, d in scaled) if scaled else None
+        if self.past_latencies:
+            ordered = sorted(self.past_latencies.values())
+            self.default_cost = ordered[len(ordered) // 2]
+        elif self.video_durations:
+            self.default_cost = sum(self.video_durations.values()) / len(self.video_durations)
+        else:
+            self.default_cost = 1.0
+        self.sources: Dict[str, int] = defaultdict(int)
+
+    def observe(self, key: str, duration: float):
+        """Latency of an attempt in this run, so requeued items are ordered by it."""
+        if duration > 0:
+            self.past_latencies[key] = duration
+
+    def predict(self, item: Dict, key_field: str) -> float:
+        if "batch" in item: # One request answering several questions
+            return sum(self.predict(q, key_field) for q in item["batch"])
+        key, video = str(item.get(key_field, "")), item.get("video_id", "")
+        if key in self.past_latencies:
+            source, cost = "history", self.past_latencies[key]
+        elif video in self.video_latency:
+            source, cost = "video_history", self.video_latency[video]
+        elif self.video_durations.get(video):
+            source, cost = "video_length", self.video_durations[video] * (self.sec_per_video_sec or 1.0)
+        else:
+            source, cost = "default", self.default_cost
+        self.sources[source] += 1
+        return cost
+
+
+def predicted_makespan(costs: List[float], workers: int) -> float:
+    """Finish time of `costs` started in list order on `workers` parallel slots."""
+    slots = [0.0] * max(workers, 1)
+    for cost in costs:
+        heapq.heappush(slots, heapq.heappop(slots) + cost)
+    return max(slots)
+
+
+def order_longest_first(items: List[Dict], costs: List[float]) -> List[Dict]:
+    """
+    Longest-job-first order that keeps each video's items adjacent: videos by their
+    most expensive item, items of a video by cost (both descending, stable).
+    """
+    groups: Dict[str, List[tuple]] = defaultdict(list)
+    for item, cost in zip(items, costs):
+        groups[item.get("video_id", "")].append((cost, item))
+    ordered_groups = sorted(groups.values(), key=lambda group: max(cost for cost, _ in group), reverse=True)
+    return [item for group in ordered_groups
+            for _, item in sorted(group, key=lambda pair: pair[0], reverse=True)]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Hedged Requests
+# ──────────────────────────────────────────────────────────────────────────────
+
+class HedgePolicy:
+    """
+    Sends a duplicate of any request still running past the `quantile` of observed
+    latencies, and returns whichever answers first.
+
+    A hedge is only sent while the budget allows: at most `budget` hedges per request
+    sent, a free worker slot and a rate-limiter token available right away. Without
+    budget the check is repeated, so the stragglers left once the queue drains are the
+    ones that get hedged. When the hedge wins, the original request keeps running in the background until it answers
+    (or the run ends), so its real latency is known and `TailScheduler.report` can
+    compare the tail with and without hedging. The slot reserved for the hedge is held
+    until the last of the two requests finishes, so requests in flight never exceed
+    the semaphore.
+
+    Args:
+        quantile (float): Latency quantile after which a request is hedged.
+        budget (float): Maximum hedges per request.
+        min_samples (int): Latencies to observe before the first hedge.
+    """
+    def __init__(self, quantile: float = DEFAULT_HEDGE_QUANTILE, budget: float = DEFAULT_HEDGE_BUDGET,
+                 min_samples: int = HEDGE_MIN_SAMPLES):
+        self.quantile = quantile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.served = Histogram()    # Latency the caller saw
+        self.unhedged = Histogram()  # Latency of the original request (a lower bound if it never answered)
+        self._threshold: Optional[float] = None
+        self._stragglers: Set[asyncio.Future] = set()
+
+    def threshold(self) -> Optional[float]:
+        """Current hedging delay; re-read from the latency sample every 10 observations."""
+        count = self.unhedged.count
+        if count < self.min_samples:
+            return None
+        if self._threshold is None or count % 10 == 0:
+            self._threshold = self.unhedged.percentile(self.quantile)
+        return self._threshold
+
+    async def _reserve(self, semaphore: asyncio.Semaphore, rate_limiter: Any) -> bool:
+        if self.hedged >= self.budget * self.requests or semaphore.locked():
+            return False
+        await semaphore.acquire() # Free slot: returns without waiting
+        if rate_limiter is not None and rate_limiter.try_acquire() is None:
+            semaphore.release()
+            return False
+        return True
+
+    def _track_straggler(self, primary: asyncio.Future, start: float):
+        def done(task: asyncio.Future):
+            self._stragglers.discard(task)
+            if not task.cancelled():
+                task.exception() # Retrieved here; its answer is no longer needed
+            self.unhedged.observe(time.perf_counter() - start)
+        self._stragglers.add(primary)
+        primary.add_done_callback(done)
+
+    async def run(self, send: Callable[[], Awaitable[Any]], semaphore: asyncio.Semaphore,
+                  rate_limiter: Any = None, label: str = "") -> Any:
+        """Awaits `send()`, hedging it with a second `send()` once it runs past the threshold."""
+        self.requests += 1
+        start = time.perf_counter()
+        threshold = self.threshold()
+        primary = asyncio.ensure_future(send())
+        hedge: Optional[asyncio.Future] = None
+        try:
+            reserved, delay = False, threshold
+            while delay is not None and not reserved:
+                await asyncio.wait({primary}, timeout=delay)
+                if primary.done():
+                    break
+                reserved = await self._reserve(semaphore, rate_limiter)
+                delay = threshold / 4 # No budget yet: slots free up as the run drains
+            if not reserved:
+                response = await primary
+                self.served.observe(time.perf_counter() - start)
+                self.unhedged.observe(time.perf_counter() - start)
+                return response
+
+            self.hedged += 1
+            DEFAULT_METRICS.inc("hedged_requests")
+            logger.debug(f"{label}: No response after {time.perf_counter() - start:.1f}s "
+                         f"(p{self.quantile * 100:g}: {threshold:.1f}s), sending a hedged request.")
+            hedge = asyncio.ensure_future(send())
+            slot_owner = hedge # The reserved slot goes with whichever request outlives the race
+            done, _ = await asyncio.wait({primary, hedge}, return_when=asyncio.FIRST_COMPLETED)
+            winner = primary if primary in done else hedge
+            if winner.exception() is not None: # First answer was an error: wait for the other one
+                loser = hedge if winner is primary else primary
+                await asyncio.wait({loser})
+                if loser.exception() is not None:
+                    raise primary.exception()
+                winner = loser
+            self.served.observe(time.perf_counter() - start)
+            if winner is hedge:
+                self.hedge_wins += 1
+                DEFAULT_METRICS.inc("hedge_wins")
+            if primary.done():
+                self.unhedged.observe(time.perf_counter() - start)
+            else:
+                # The caller releases its own slot on return; the losing original keeps the reserved one
+                slot_owner = primary
+                self._track_straggler(primary, start)
+            return winner.result()
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done() and task not in self._stragglers:
+                    task.cancel()
+            if hedge is not None:
+                slot_owner.add_done_callback(lambda _t: semaphore.release())
+
+    async def close(self):
+        """Cancels originals still running after their hedge won; their elapsed time counts as a lower bound."""
+        stragglers = list(self._stragglers)
+        for task in stragglers:
+            task.cancel()
+        await asyncio.gather(*stragglers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        served, unhedged = self.served.summary(), self.unhedged.summary()
+        return {"requests": self.requests, "hedged": self.hedged, "hedge_wins": self.hedge_wins,
+                "threshold_sec": round(self._threshold, 3) if self._threshold is not None else None,
+                "p95_sec": served.get("p95"), "p99_sec": served.get("p99"), "max_sec": served.get("max"),
+                "unhedged_p95_sec": unhedged.get("p95"), "unhedged_p99_sec": unhedged.get("p99"),
+                "unhedged_max_sec": unhedged.get("max")}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Requeue of Retryable Failures
+# ──────────────────────────────────────────────────────────────────────────────
+
+def is_requeueable(row: Dict) -> bool:
+    """
+    Retries exhausted, a blocked / empty answer, or a failure caused by an expired or
+    missing File API handle (flagged `handle_error` by the producer, see `retry.is_handle_error`).
+    """
+    return row.get("status") in REQUEUE_STATUSES or bool(row.get("handle_error"))
+
+
+class RequeueTap:
+    """
+    Stands in for the results queue of one pass: forwards rows to the writer, except
+    retryable failures when `hold` is set, which wait for the next pass instead (so an
+    appended CSV never gets a failed row that a later pass replaces).
+    """
+    def __init__(self, writer_queue: asyncio.Queue, key_field: str, hold: bool):
+        self._writer_queue = writer_queue
+        self.key_field = key_field
+        self.hold = hold
+        self.held: Dict[str, Dict] = {}
+        self.succeeded: Set[str] = set()
+        self.durations: Dict[str, float] = {}
+
+    def put_nowait(self, row: Dict):
+        if row.get("status") != PARTIAL_STATUS:
+            key = str(row.get(self.key_field))
+            self.durations[key] = row.get("duration", -1)
+            if row.get("status") == "Success":
+                self.succeeded.add(key)
+            elif self.hold and is_requeueable(row):
+                self.held[key] = row
+                return
+        self._writer_queue.put_nowait(row)
+
+    async def put(self, row: Dict):
+        self.put_nowait(row) # The writer queue is unbounded
+
+    def release(self, row: Dict):
+        self._writer_queue.put_nowait(row)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Tail Scheduler
+# ──────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class TailScheduler:
+    """
+    Run-level policies against a long tail (see `engine.run_bulk_inference_async`):
+    longest-job-first ordering by `cost_model`, `hedge`d requests, and up to
+    `requeue_passes` extra passes over retryable failures within the same run.
+    `report()` says how much each of them shortened the tail.
+    """
+    cost_model: Optional[CostModel] = None
+    hedge: Optional[HedgePolicy] = None
+    requeue_passes: int = DEFAULT_REQUEUE_PASSES
+    makespan_input_sec: Optional[float] = None
+    makespan_ordered_sec: Optional[float] = None
+    requeued: List[int] = field(default_factory=list)
+    recovered: int = 0
+    _requeued_keys: Set[str] = field(default_factory=set, repr=False)
+
+    def order(self, items: List[Dict], key_field: str, workers: int) -> List[Dict]:
+        """Longest-first order of `items`, recording the predicted makespan before and after."""
+        if self.cost_model is None:
+            return items
+        costs = [self.cost_model.predict(item, key_field) for item in items]
+        ordered = order_longest_first(items, costs)
+        cost_of = {id(item): cost for item, cost in zip(items, costs)}
+        if self.makespan_input_sec is None:
+            self.makespan_input_sec = predicted_makespan(costs, workers)
+            self.makespan_ordered_sec = predicted_makespan([cost_of[id(item)] for item in ordered], workers)
+            logger.info(f"Longest-first order: predicted makespan {self.makespan_input_sec:.1f}s → "
+                        f"{self.makespan_ordered_sec:.1f}s (costs from {dict(self.cost_model.sources)}).")
+        return ordered
+
+    def requeue(self, tap: RequeueTap, items_by_key: Dict[str, Dict], key_field: str, workers: int,
+                video_cache: Any = None) -> List[Dict]:
+        """
+        Closes one pass: counts requeued keys that succeeded in it and returns the items
+        held back by `tap` for the next pass, dropping expired handles from `video_cache`.
+        """
+        self.recovered += len(self._requeued_keys & tap.succeeded)
+        self._requeued_keys = set()
+        items = []
+        by_status: Dict[str, int] = defaultdict(int)
+        for key, row in tap.held.items():
+            item = items_by_key.get(key)
+            if item is None:
+                tap.release(row)
+                continue
+            if video_cache is not None and row.get("handle_error"):
+                video_cache.invalidate(item.get(resource_column(video_cache.use_vertex)))
+            if self.cost_model is not None:
+                self.cost_model.observe(key, tap.durations.get(key, -1))
+            by_status[row["status"]] += 1
+            items.append(item)
+            self._requeued_keys.add(key)
+        if items:
+            self.requeued.append(len(items))
+            logger.info(f"Requeue pass {len(self.requeued)}: {len(items)} retryable failures {dict(by_status)}.")
+        return self.order(items, key_field, workers)
+
+    def stats(self) -> Dict[str, Any]:
+        stats: Dict[str, Any] = {"requeued": sum(self.requeued), "requeue_passes_run": len(self.requeued),
+                                 "recovered": self.recovered}
+        if self.makespan_input_sec is not None:
+            stats.update(predicted_makespan_input_sec=round(self.makespan_input_sec, 2),
+                         predicted_makespan_ordered_sec=round(self.makespan_ordered_sec, 2))
+        if self.hedge is not None:
+            stats["hedge"] = self.hedge.stats()
+        return stats
+
+    def report(self) -> str:
+        lines = []
+        if self.makespan_input_sec is not None:
+            saved = self.makespan_input_sec - self.makespan_ordered_sec
+            lines.append(f"  longest-first: predicted makespan {self.makespan_input_sec:.1f}s in input order → "
+                         f"{self.makespan_ordered_sec:.1f}s ({saved:.1f}s shorter)")
+        if self.hedge is not None:
+            h = self.hedge.stats()
+            if h["hedged"]:
+                lines.append(f"  hedging: {h['hedged']}/{h['requests']} requests hedged after {h['threshold_sec']:.2f}s, "
+                             f"{h['hedge_wins']} won; p99 {h['unhedged_p99_sec']:.2f}s → {h['p99_sec']:.2f}s, "
+                             f"max {h['unhedged_max_sec']:.2f}s → {h['max_sec']:.2f}s")
+            else:
+                lines.append(f"  hedging: no request hedged ({h['requests']} requests, threshold {h['threshold_sec']})")
+        if self.requeue_passes:
+            lines.append(f"  requeue: {sum(self.requeued)} retryable failures over {len(self.requeued)} extra passes, "
+                         f"{self.recovered} recovered without a manual re-run")
+        return "Tail scheduling:\n" + "\n".join(lines) if lines else ""
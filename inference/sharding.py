@@ -0,0 +1,367 @@
+import argparse
+import csv
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .results_store import SUCCESS_STATUS, ResultsStore, is_store_path
+
+logger = logging.getLogger(__name__)
+
+SHARD_COMMAND = "shard"
+DEFAULT_POLL_INTERVAL_SEC = 5.0
+DEFAULT_STALL_TIMEOUT_SEC = 600.0 # A shard without new results for this long is restarted
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Partitioning
+# ──────────────────────────────────────────────────────────────────────────────
+# Items are partitioned by a stable hash of their video_id, so all questions of a
+# video (shared handle, context cache, chat history) land in the same process and
+# every shard count always assigns a video to the same shard.
+
+def shard_of(video_id: str, num_shards: int) -> int:
+    """Shard index of a video (stable across processes and runs, unlike `hash()`)."""
+    digest = hashlib.sha1(str(video_id).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % num_shards
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """`"K/N"` -> (K, N), with 0 <= K < N."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Shard must look like K/N, got '{spec}'.")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Shard index must be in [0, {count}), got {index}.")
+    return index, count
+
+
+def segment_path(shard_dir: str, index: int, num_shards: int) -> str:
+    return str(Path(shard_dir) / f"shard-{index}-of-{num_shards}.sqlite")
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Deterministic Merge
+# ──────────────────────────────────────────────────────────────────────────────
+# Every segment is a `ResultsStore`, which streams its rows ordered by key. A k-way
+# merge of those streams yields the combined results in key order with one row in
+# memory per segment, so the submission is the same byte for byte however the
+# work was split and in whatever order it finished.
+
+def _prefer_success(rows: Iterable[Dict], key_field: str) -> Iterator[Dict]:
+    """One row per key from key-ordered `rows`: the successful one if any, else the first."""
+    for _, group in itertools.groupby(rows, key=lambda row: row[key_field]):
+        candidates = list(group)
+        yield next((r for r in candidates if r["status"] == SUCCESS_STATUS), candidates[0])
+
+
+def merge_segments(segments: Iterable[str], output_file: str, key_field: str = "qid", output_field: str = "pred",
+                   columns: Optional[List[str]] = None) -> int:
+    """
+    Merges result segments into `output_file` (CSV, or a `.sqlite` results store), ordered by key.
+
+    A key present in several segments keeps its successful row, else the first one.
+
+    Returns:
+        int: Number of rows written.
+    """
+    stores = [ResultsStore(path, key_field, output_field) for path in segments if Path(path).is_file()]
+    columns = columns or [key_field, output_field, "status", "duration_sec", "finish_reason"]
+    merged = heapq.merge(*(store.iter_rows() for store in stores), key=lambda row: row[key_field])
+    rows = _prefer_success(merged, key_field)
+    count = 0
+    try:
+        Path(output_file).parent.mkdir(parents=True, exist_ok=True)
+        if is_store_path(output_file):
+            with ResultsStore(output_file, key_field, output_field) as out:
+                for batch in iter(lambda: list(itertools.islice(rows, 1000)), []):
+                    count += out.write_many(batch)
+        else:
+            tmp_path = output_file + ".tmp"
+            with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+                writer.writeheader()
+                for row in rows:
+                    writer.writerow(row)
+                    count += 1
+            os.replace(tmp_path, output_file)
+    finally:
+        for store in stores:
+            store.close()
+    logger.info(f"Merged {len(stores)} segments into {output_file} ({count} rows).")
+    return count
+
+
+def seed_segments(results_file: str, shard_dir: str, num_shards: int, video_of: Dict[str, str],
+                  key_field: str = "qid", output_field: str = "pred") -> int:
+    """
+    Splits an existing (unsharded) results file into the shard segments, so a sharded
+    run resumes from it instead of redoing finished keys. Keys are routed by their video.
+    """
+    if is_store_path(results_file):
+        source = ResultsStore(results_file, key_field, output_field)
+        rows: Iterable[Dict] = source.iter_rows()
+    else:
+        csv.field_size_limit(sys.maxsize)
+        source = open(results_file, newline="", encoding="utf-8")
+        rows = csv.DictReader(source)
+    segments = [ResultsStore(segment_path(shard_dir, i, num_shards), key_field, output_field) for i in range(num_shards)]
+    batches: List[List[Dict]] = [[] for _ in range(num_shards)]
+    seeded = 0
+    try:
+        for row in rows:
+            key = row.get(key_field)
+            if not key:
+                continue
+            shard = shard_of(video_of.get(key, key), num_shards)
+            batches[shard].append(row)
+            if len(batches[shard]) >= 1000:
+                seeded += segments[shard].write_many(batches[shard])
+                batches[shard] = []
+        for segment, batch in zip(segments, batches):
+            seeded += segment.write_many(batch)
+    finally:
+        source.close()
+        for segment in segments:
+            segment.close()
+    logger.info(f"Seeded {num_shards} segments with {seeded} rows from {results_file}.")
+    return seeded
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Coordinator
+# ──────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class ShardState:
+    index: int
+    segment: str
+    expected: int
+    done: int = 0
+    attempts: int = 0
+    process: Optional[subprocess.Popen] = None
+    last_progress_at: float = 0.0
+    finished: bool = False
+    failed: bool = False
+    history: List[str] = field(default_factory=list)
+
+
+def load_credentials(path: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Reads per-shard credentials: a JSON list of objects with optional `env` (extra
+    environment, e.g. `GOOGLE_API_KEY` / `GOOGLE_APPLICATION_CREDENTIALS`), `project`,
+    `location`, `rpm` and a `name` for the logs. Shard K on attempt A uses entry (K + A) % len(list).
+    """
+    if not path:
+        return [{}]
+    with open(path, encoding="utf-8") as f:
+        credentials = json.load(f)
+    if not isinstance(credentials, list) or not credentials:
+        raise ValueError(f"{path} must hold a non-empty JSON list of credential objects.")
+    return credentials
+
+
+class ShardCoordinator:
+    """
+    Runs one `python -m inference` process per shard and supervises them.
+
+    Each process gets its own credentials / project and RPM budget, handles only the
+    videos hashed to its shard and writes its own results segment (`ResultsStore`),
+    so processes share no state. A shard that exits with failures is restarted (it
+    resumes from its segment, retrying failed keys); one that stops producing results
+    for `stall_timeout_sec` is killed and restarted, on the next credentials entry.
+
+    Args:
+        run_argv (List[str]): The run command line (task first) shared by every shard.
+        num_shards (int): Number of partitions.
+        shard_dir (str): Directory for segments and per-shard logs.
+        expected (Dict[int, int]): Pending items per shard (progress reporting).
+        credentials (List[Dict]): See `load_credentials`.
+        parallel (int): Shards running at once.
+        handle_cache (bool): Give each shard its own video handle cache file (shards share no videos).
+    """
+    def __init__(self, run_argv: List[str], num_shards: int, shard_dir: str, expected: Dict[int, int],
+                 credentials: Optional[List[Dict[str, Any]]] = None, parallel: Optional[int] = None,
+                 stall_timeout_sec: float = DEFAULT_STALL_TIMEOUT_SEC, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 poll_interval_sec: float = DEFAULT_POLL_INTERVAL_SEC, handle_cache: bool = True):
+        self.run_argv = run_argv
+        self.num_shards = num_shards
+        self.shard_dir = shard_dir
+        self.credentials = credentials or [{}]
+        self.parallel = parallel or num_shards
+        self.stall_timeout_sec = stall_timeout_sec
+        self.max_attempts = max_attempts
+        self.poll_interval_sec = poll_interval_sec
+        self.handle_cache = handle_cache
+        self.shards = [ShardState(i, segment_path(shard_dir, i, num_shards), expected.get(i, 0))
+                       for i in range(num_shards)]
+
+    # --- Launching ---
+    def _command(self, shard: ShardState, credential: Dict[str, Any]) -> List[str]:
+        command = [sys.executable, "-m", "inference", *self.run_argv,
+                   "--shard", f"{shard.index}/{self.num_shards}", "--results", shard.segment, "--no-progress"]
+        if self.handle_cache:
+            command += ["--handle-cache", str(Path(self.shard_dir) / f"shard-{shard.index}.handles.json")]
+        for option in ("project", "location", "rpm"):
+            if credential.get(option) is not None:
+                command += [f"--{option}", str(credential[option])]
+        return command
+
+    def _launch(self, shard: ShardState):
+        credential = self.credentials[(shard.index + shard.attempts) % len(self.credentials)]
+        shard.attempts += 1
+        env = {**os.environ, **{k: str(v) for k, v in credential.get("env", {}).items()}}
+        log_path = Path(self.shard_dir) / f"shard-{shard.index}-of-{self.num_shards}.log"
+        with open(log_path, "a", encoding="utf-8") as log_file: # The child keeps its own descriptor
+            shard.process = subprocess.Popen(self._command(shard, credential), env=env, stdout=log_file,
+                                             stderr=subprocess.STDOUT)
+        shard.last_progress_at = time.monotonic()
+        label = credential.get("name") or credential.get("project") or f"credentials #{self.credentials.index(credential)}"
+        shard.history.append(f"attempt {shard.attempts} ({label})")
+        logger.info(f"Shard {shard.index}: started attempt {shard.attempts} (pid {shard.process.pid}, {label}).")
+
+    # --- Supervision ---
+    def _poll_progress(self, shard: ShardState):
+        if not Path(shard.segment).is_file():
+            return
+        try:
+            with ResultsStore(shard.segment) as store:
+                done = store.summary()["success"]
+        except Exception as e: # The child may be creating the file
+            logger.debug(f"Could not read {shard.segment}: {e}")
+            return
+        if done != shard.done:
+            shard.done = done
+            shard.last_progress_at = time.monotonic()
+
+    def _check(self, shard: ShardState):
+        self._poll_progress(shard)
+        returncode = shard.process.poll()
+        if returncode is None:
+            if time.monotonic() - shard.last_progress_at > self.stall_timeout_sec:
+                logger.warning(f"Shard {shard.index}: no progress for {self.stall_timeout_sec:.0f}s, restarting.")
+                shard.process.kill()
+                shard.process.wait()
+                self._retry_or_fail(shard, "stalled")
+            return
+        shard.process = None
+        if returncode == 0:
+            shard.finished = True
+            logger.info(f"Shard {shard.index}: finished ({shard.done} successful).")
+        else:
+            self._retry_or_fail(shard, f"exit code {returncode}")
+
+    def _retry_or_fail(self, shard: ShardState, reason: str):
+        shard.process = None
+        shard.history[-1] += f": {reason}"
+        if shard.attempts >= self.max_attempts:
+            shard.failed = True
+            logger.error(f"Shard {shard.index}: giving up after {shard.attempts} attempts ({reason}).")
+        else:
+            logger.warning(f"Shard {shard.index}: {reason}, will be reassigned.")
+
+    def run(self) -> bool:
+        """Runs every shard to completion (or `max_attempts`). Returns True when all shards succeeded."""
+        Path(self.shard_dir).mkdir(parents=True, exist_ok=True)
+        last_report = 0.0
+        try:
+            while True:
+                running = [s for s in self.shards if s.process is not None]
+                for shard in running:
+                    self._check(shard)
+                waiting = [s for s in self.shards if s.process is None and not s.finished and not s.failed]
+                free_slots = self.parallel - sum(1 for s in self.shards if s.process is not None)
+                for shard in waiting[:max(0, free_slots)]:
+                    self._launch(shard)
+                if all(s.finished or s.failed for s in self.shards):
+                    break
+                if time.monotonic() - last_report >= max(self.poll_interval_sec, 30.0):
+                    last_report = time.monotonic()
+                    logger.info("Progress: " + ", ".join(f"{s.index}:{s.done}/{s.expected}" for s in self.shards))
+                time.sleep(self.poll_interval_sec)
+        finally:
+            for shard in self.shards:
+                if shard.process is not None and shard.process.poll() is None:
+                    shard.process.terminate()
+                    shard.process.wait()
+        for shard in self.shards:
+            logger.info(f"Shard {shard.index}: {shard.done}/{shard.expected} successful, {'; '.join(shard.history)}")
+        return all(s.finished for s in self.shards)
+
+    @property
+    def segments(self) -> List[str]:
+        return [s.segment for s in self.shards]
+
+
+# --- Command Line ---
+def shard_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference shard --shards N [...] TASK --model ... [run options]`."""
+    parser = argparse.ArgumentParser(prog=f"python -m inference {SHARD_COMMAND}",
+                                     description="Run a task as N processes partitioned by video_id, then merge the results. "
+                                                 "Options after the coordinator options are passed to every shard.")
+    parser.add_argument("command", choices=(SHARD_COMMAND,))
+    parser.add_argument("--shards", type=int, required=True, help="Number of partitions (video_id hash).")
+    parser.add_argument("--parallel", type=int, default=None, help="Shards running at once (default: all).")
+    parser.add_argument("--credentials", default=None,
+                        help="JSON list of per-shard {env, project, location, rpm} objects (see README).")
+    parser.add_argument("--shard-dir", default=None, help="Segments and logs (default: <results>.shards/).")
+    parser.add_argument("--submission", default=None, help="Also write a key,output-only CSV here.")
+    parser.add_argument("--stall-timeout", type=float, default=DEFAULT_STALL_TIMEOUT_SEC,
+                        help="Restart a shard without new results for this many seconds.")
+    parser.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS, help="Launches per shard.")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL_SEC)
+    args, run_argv = parser.parse_known_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    if args.shards < 1:
+        parser.error("--shards must be at least 1.")
+
+    # Imported here: the run CLI itself dispatches to this module
+    from .chat_store import ChatHistoryStore
+    from .cli import answers_dir_for, build_job, default_results_file, load_metadata_rows, parse_args
+
+    run_args = parse_args(run_argv)
+    if run_args.shard is not None:
+        parser.error("--shard is set by the coordinator.")
+    job = build_job(run_args, ChatHistoryStore(answers_dir_for(run_args)) if run_args.task == "cocot" else None)
+    metadata_file = run_args.metadata or ("video_metadata_vertex.csv" if run_args.vertex else "video_metadata_non_vertex.csv")
+    results_file = run_args.results or default_results_file(run_args.task, job.model_name, run_args.questions_model)
+    shard_dir = args.shard_dir or str(Path(results_file).with_suffix("")) + ".shards"
+    Path(shard_dir).mkdir(parents=True, exist_ok=True)
+
+    rows = load_metadata_rows(job, metadata_file, run_args.vertex)
+    video_of = {row[job.key_field]: row["video_id"] for row in rows if row.get(job.key_field)}
+    if Path(results_file).is_file() and not any(Path(segment_path(shard_dir, i, args.shards)).is_file()
+                                                for i in range(args.shards)):
+        seed_segments(results_file, shard_dir, args.shards, video_of, job.key_field, job.output_field)
+
+    expected: Dict[int, int] = {}
+    for i in range(args.shards):
+        path = segment_path(shard_dir, i, args.shards)
+        with ResultsStore(path, job.key_field, job.output_field) as store:
+            done = store.done_keys()
+        pending = sum(1 for key, video_id in video_of.items() if shard_of(video_id, args.shards) == i and key not in done)
+        expected[i] = len(done) + pending
+    logger.info(f"Sharding {len(video_of)} {job.key_field}s over {args.shards} shards: {expected}")
+
+    # Shard options are appended, so they override the same options in `run_argv` (argparse: last one wins)
+    coordinator = ShardCoordinator(
+        run_argv, args.shards, shard_dir, expected, load_credentials(args.credentials), args.parallel,
+        args.stall_timeout, args.max_attempts, args.poll_interval, handle_cache=run_args.handle_cache is None)
+    ok = coordinator.run()
+    merge_segments(coordinator.segments, results_file, job.key_field, job.output_field, job.fieldnames)
+    if args.submission:
+        merge_segments(coordinator.segments, args.submission, job.key_field, job.output_field,
+                       [job.key_field, job.output_field])
+    return 0 if ok else 1
@@ -0,0 +1,110 @@
+import re
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from .jobs import MCQ_QUESTION_TYPE
+
+EARLY_STOP_REASON = "EARLY_STOP"   # finish_reason of a stream cut off after its final answer
+# The CoT prompts ask for a ```thinking (or '''thinking) block before the answer
+THINKING_BLOCK = re.compile(r"(?:```|''')thinking\b.*?(?:```|''')", re.S)
+# An option letter alone on its line, after an optional "Answer:" / "**Final Answer:**" label:
+# "A.", "(B)", "**C.** ...", "Answer: D", "**Final Answer:** E". The line must have ended, so a
+# letter still being streamed ("A. The red") is never cut in the middle of its explanation.
+MCQ_ANSWER_LINE = re.compile(r"^[ \t]*\**(?i:(?:final[ \t]+)?answer[ \t]*\**:\**[ \t]*)?\(?[A-E](?:[.):][^\n]*|\**)[ \t]*\n", re.M)
+
+
+class RequestTimeout(Exception):
+    """A request outlived the job's per-request deadline. Retryable, like a server-side 504."""
+    code = 504
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Streamed Responses
+# ──────────────────────────────────────────────────────────────────────────────
+
+class StreamedResponse:
+    """
+    The chunks of a streamed response joined into one object shaped like
+    `types.GenerateContentResponse` (text, candidates[0].finish_reason, usage_metadata),
+    plus the timings of the stream.
+    """
+    def __init__(self, text: str, finish_reason: Optional[str], usage_metadata: Any,
+                 ttft_sec: Optional[float], duration_sec: float, cut_off: bool = False):
+        self.text = text
+        self.parsed = None # Structured requests are never streamed
+        self.candidates = [SimpleNamespace(finish_reason=SimpleNamespace(name=finish_reason or "UNKNOWN"))]
+        self.usage_metadata = usage_metadata
+        self.ttft_sec = ttft_sec
+        self.duration_sec = duration_sec
+        self.cut_off = cut_off
+
+    @property
+    def tokens_per_sec(self) -> Optional[float]:
+        """Output tokens per second after the first token (~4 characters per token when usage is missing)."""
+        tokens = getattr(self.usage_metadata, "candidates_token_count", None) or len(self.text) / 4
+        decode_sec = self.duration_sec - (self.ttft_sec or 0.0)
+        return tokens / decode_sec if decode_sec > 0 and tokens else None
+
+    def __str__(self) -> str:
+        return self.text
+
+
+def _chunk_text(chunk: Any) -> str:
+    try:
+        return chunk.text or ""
+    except (ValueError, AttributeError): # Chunks with no text parts (e.g. only a finish reason)
+        return ""
+
+
+async def stream_generate(client: Any, model: str, contents: List[Any], config: Any = None,
+                          on_text: Optional[Callable[[str], bool]] = None) -> StreamedResponse:
+    """
+    Sends one request with `generate_content_stream` and joins the chunks.
+
+    `on_text(text_so_far)` is called after every chunk with text; when it returns True
+    the stream is closed right away and the response is marked `EARLY_STOP`.
+    """
+    start = time.perf_counter()
+    ttft = None
+    pieces: List[str] = []
+    usage = None
+    finish_reason = None
+    cut_off = False
+    stream = await client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+    try:
+        async for chunk in stream:
+            text = _chunk_text(chunk)
+            usage = getattr(chunk, "usage_metadata", None) or usage
+            candidates = getattr(chunk, "candidates", None)
+            reason = getattr(candidates[0], "finish_reason", None) if candidates else None
+            if reason is not None:
+                finish_reason = getattr(reason, "name", str(reason))
+            if not text:
+                continue
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            pieces.append(text)
+            if on_text is not None and on_text("".join(pieces)):
+                cut_off = True
+                finish_reason = EARLY_STOP_REASON
+                break
+    finally:
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose() # Stops the download of the rest of the response
+    return StreamedResponse("".join(pieces), finish_reason, usage, ttft, time.perf_counter() - start, cut_off)
+
+
+# --- Early Cut-Off ---
+def answer_section_complete(item: Dict, text: str) -> bool:
+    """
+    True once a multiple-choice answer is final: the thinking block is closed and the
+    option letter line after it has ended. Open-ended answers always run to completion.
+    """
+    if item.get("question_type") != MCQ_QUESTION_TYPE:
+        return False
+    thinking = THINKING_BLOCK.search(text)
+    if thinking is None:
+        return False
+    return MCQ_ANSWER_LINE.search(text, thinking.end()) is not None
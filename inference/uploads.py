@@ -0,0 +1,407 @@
+import argparse
+import asyncio
+import csv
+import hashlib
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from tqdm import tqdm
+
+from .data import resource_column
+from .dataset_store import VIDEO_COLUMNS, DatasetStore, is_dataset_store
+from .metrics import DEFAULT_METRICS
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_BYTES = 8 * 2**20
+UPLOAD_CHUNK_BYTES = 8 * 2**20       # GCS resumable upload chunk size (multiple of 256 KB)
+FILE_API_TTL_SEC = 47 * 3600.0       # File API objects expire after 48h
+FILE_API_EXPIRY_MARGIN_SEC = 3600.0  # Stop reusing an object this long before it expires
+INDEX_NAME = "upload_index.jsonl"
+METADATA_UPDATE_COLS = list(VIDEO_COLUMNS)
+
+
+# --- Content Addressing ---
+def content_digest(path: Path, speed_factor: float) -> str:
+    """sha256 of the prepared video bytes plus the speed factor that produced them."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    h.update(f"|speed={float(speed_factor)}".encode())
+    return h.hexdigest()
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Upload Index (append-only JSONL)
+# ──────────────────────────────────────────────────────────────────────────────
+# Two kinds of records, last one wins on load:
+#   {"kind": "hash", "key": "<path>|<size>|<mtime_ns>|<speed>", "digest": ...}
+#   {"kind": "object", "backend": "gcs:<bucket>" | "file_api", "digest": ..., "resource_id": ..., "expires_at": ...}
+# Appending one line per event keeps the index crash-safe and never rewrites it.
+
+class UploadIndex:
+    """Content digest → uploaded resource index, plus a cache of file digests."""
+    def __init__(self, path: str):
+        self.path = path
+        self._hashes: Dict[str, str] = {}
+        self._objects: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._write_lock = threading.Lock() # Digests are computed in worker threads
+        if os.path.isfile(path):
+            self._load()
+
+    @staticmethod
+    def _file_key(path: Path, speed_factor: float) -> str:
+        st = path.stat()
+        return f"{path.resolve()}|{st.st_size}|{st.st_mtime_ns}|{float(speed_factor)}"
+
+    def _load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue # A torn last line after a crash
+                if record.get("kind") == "hash":
+                    self._hashes[record["key"]] = record["digest"]
+                elif record.get("kind") == "object":
+                    self._objects.setdefault(record["backend"], {})[record["digest"]] = record
+        logger.info(f"Loaded upload index {self.path}: {len(self._hashes)} digests, "
+                    f"{sum(len(v) for v in self._objects.values())} uploaded objects.")
+
+    def _append(self, record: Dict[str, Any]):
+        with self._write_lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def digest_for(self, path: Path, speed_factor: float) -> str:
+        """Returns the content digest, hashing the file only if it changed since the last run."""
+        key = self._file_key(path, speed_factor)
+        digest = self._hashes.get(key)
+        if digest is None:
+            digest = content_digest(path, speed_factor)
+            self._hashes[key] = digest
+            self._append({"kind": "hash", "key": key, "digest": digest})
+        return digest
+
+    def lookup(self, backend: str, digest: str) -> Optional[str]:
+        record = self._objects.get(backend, {}).get(digest)
+        if record is None:
+            return None
+        expires_at = record.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return record["resource_id"]
+
+    def record_object(self, backend: str, digest: str, resource_id: str, expires_at: Optional[float] = None):
+        record = {"kind": "object", "backend": backend, "digest": digest,
+                  "resource_id": resource_id, "expires_at": expires_at}
+        self._objects.setdefault(backend, {})[digest] = record
+        self._append(record)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Backends
+# ──────────────────────────────────────────────────────────────────────────────
+# Objects are named after their digest, so an object uploaded from another machine
+# (or by an earlier run whose index was lost) is found with one existence check.
+
+class GcsUploader:
+    """Uploads to `gs://<bucket>/<prefix>/<digest>.mp4` with resumable, chunked transfers."""
+    def __init__(self, storage_client: Any, bucket_name: str, prefix: str = "videos/by-hash"):
+        self.bucket = storage_client.bucket(bucket_name)
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.backend = f"gcs:{bucket_name}"
+
+    def _blob(self, digest: str) -> Any:
+        # Setting chunk_size makes the client use a resumable session, retried per chunk
+        return self.bucket.blob(f"{self.prefix}/{digest}.mp4", chunk_size=UPLOAD_CHUNK_BYTES)
+
+    def find_existing(self, digest: str) -> Optional[str]:
+        blob = self._blob(digest)
+        return f"gs://{self.bucket_name}/{blob.name}" if blob.exists() else None
+
+    def upload(self, path: Path, digest: str, video_id: str) -> str:
+        blob = self._blob(digest)
+        blob.upload_from_filename(str(path), content_type="video/mp4")
+        return f"gs://{self.bucket_name}/{blob.name}"
+
+    def expires_at(self, resource_id: Optional[str] = None) -> Optional[float]:
+        return None
+
+
+class FileApiUploader:
+    """Uploads through the Gemini File API (`client.files`), using the digest as `display_name`."""
+    backend = "file_api"
+
+    def __init__(self, files_client: Any):
+        self.files = files_client
+        self._remote: Optional[Dict[str, str]] = None
+        self._remote_expiry: Dict[str, float] = {} # name -> usable until (real expiry minus the margin)
+        self._list_lock = threading.Lock()
+
+    @staticmethod
+    def _usable_until(f: Any) -> float:
+        expiration_time = getattr(f, "expiration_time", None)
+        if expiration_time is not None:
+            return expiration_time.timestamp() - FILE_API_EXPIRY_MARGIN_SEC
+        create_time = getattr(f, "create_time", None)
+        if create_time is not None:
+            return create_time.timestamp() + FILE_API_TTL_SEC
+        return time.time() + FILE_API_TTL_SEC
+
+    def _remote_objects(self) -> Dict[str, str]:
+        # One listing per run instead of one `files.get` per video
+        with self._list_lock:
+            if self._remote is None:
+                remote = {}
+                now = time.time()
+                for f in self.files.list(config={"page_size": 100}):
+                    if not f.display_name or getattr(f.state, "name", "ACTIVE") == "FAILED":
+                        continue
+                    usable_until = self._usable_until(f)
+                    if usable_until <= now: # About to expire: upload a fresh copy instead
+                        continue
+                    remote[f.display_name] = f.name
+                    self._remote_expiry[f.name] = usable_until
+                self._remote = remote
+        return self._remote
+
+    def find_existing(self, digest: str) -> Optional[str]:
+        return self._remote_objects().get(digest)
+
+    def upload(self, path: Path, digest: str, video_id: str) -> str:
+        # The SDK uploads with the resumable protocol
+        uploaded = self.files.upload(file=path, config={"display_name": digest, "mime_type": "video/mp4"})
+        return uploaded.name
+
+    def expires_at(self, resource_id: Optional[str] = None) -> Optional[float]:
+        """When `resource_id` stops being usable: its listed expiry if found remotely, else 47h from now (fresh upload)."""
+        return self._remote_expiry.get(resource_id, time.time() + FILE_API_TTL_SEC)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Upload Manager
+# ──────────────────────────────────────────────────────────────────────────────
+
+@dataclass
+class UploadResult:
+    video_id: str
+    status: str
+    local_path: Optional[str] = None
+    resource_id: Optional[str] = None
+    digest: Optional[str] = None
+    source: str = "" # "index", "remote", "upload" or ""
+
+
+class UploadManager:
+    """
+    Uploads only the prepared videos whose content is not already stored remotely.
+
+    Hashing and (blocking SDK) uploads run in worker threads, at most `max_workers`
+    at a time. Failed uploads are retried with jittered exponential backoff.
+
+    Args:
+        uploader: `GcsUploader` or `FileApiUploader`.
+        index (UploadIndex): Digest → resource index shared across speed factors and runs.
+        max_workers (int): Concurrent uploads.
+        max_retries (int): Retries per upload after the first attempt.
+    """
+    def __init__(self, uploader: Any, index: UploadIndex, max_workers: int = 4, max_retries: int = 3,
+                 initial_backoff_sec: float = 2.0):
+        self.uploader = uploader
+        self.index = index
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.initial_backoff_sec = initial_backoff_sec
+        self._digest_locks: Dict[str, asyncio.Lock] = {}
+
+    @property
+    def uploaded_status(self) -> str:
+        return "uploaded_file_api" if self.uploader.backend == "file_api" else "uploaded_gcs"
+
+    @property
+    def failed_status(self) -> str:
+        return "file_api_upload_failed" if self.uploader.backend == "file_api" else "gcs_upload_failed"
+
+    async def _upload_with_retries(self, path: Path, digest: str, video_id: str) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                with DEFAULT_METRICS.timer("upload"):
+                    return await asyncio.to_thread(self.uploader.upload, path, digest, video_id)
+            except Exception as e:
+                DEFAULT_METRICS.record_error(e, "upload")
+                if attempt >= self.max_retries:
+                    raise
+                backoff = random.uniform(0, self.initial_backoff_sec * (2 ** attempt))
+                logger.warning(f"Upload of {video_id} failed ({e}), retrying in {backoff:.1f}s.")
+                await asyncio.sleep(backoff)
+
+    async def ensure_uploaded(self, video_id: str, path: Path, speed_factor: float,
+                              semaphore: asyncio.Semaphore) -> UploadResult:
+        if not path.is_file():
+            logger.warning(f"Local file missing: {path}")
+            return UploadResult(video_id, "local_missing")
+
+        async with semaphore:
+            backend = self.uploader.backend
+            try:
+                digest = await asyncio.to_thread(self.index.digest_for, path, speed_factor)
+                # Identical files (same digest) are uploaded once, even when processed concurrently
+                async with self._digest_locks.setdefault(digest, asyncio.Lock()):
+                    resource_id = self.index.lookup(backend, digest)
+                    if resource_id:
+                        return UploadResult(video_id, self.uploaded_status, str(path), resource_id, digest, "index")
+
+                    resource_id = await asyncio.to_thread(self.uploader.find_existing, digest)
+                    source = "remote"
+                    if not resource_id:
+                        resource_id = await self._upload_with_retries(path, digest, video_id)
+                        source = "upload"
+                    self.index.record_object(backend, digest, resource_id, self.uploader.expires_at(resource_id))
+                return UploadResult(video_id, self.uploaded_status, str(path), resource_id, digest, source)
+            except Exception as e:
+                logger.error(f"Upload Fail: {path}. Error: {e}")
+                return UploadResult(video_id, self.failed_status, str(path))
+
+    async def upload_all(self, videos: Dict[str, Path], speed_factor: float, metadata_file: Optional[str] = None,
+                         flush_every: int = 20, show_progress: bool = True) -> List[UploadResult]:
+        """
+        Ensures every video in `videos` (video_id → prepared mp4) is uploaded.
+
+        When `metadata_file` is given, it is updated every `flush_every` finished videos
+        and once at the end, so an interrupted run keeps the handles it already has.
+        """
+        semaphore = asyncio.Semaphore(self.max_workers)
+        tasks = [asyncio.create_task(self.ensure_uploaded(vid, path, speed_factor, semaphore))
+                 for vid, path in videos.items()]
+        results: List[UploadResult] = []
+        pending_updates: Dict[str, Dict] = {}
+        id_col = resource_column(self.uploader.backend != "file_api")
+
+        async def flush():
+            if metadata_file and pending_updates:
+                updates = dict(pending_updates)
+                pending_updates.clear()
+                await asyncio.to_thread(update_metadata_rows, metadata_file, updates)
+
+        with tqdm(total=len(tasks), desc=f"Uploading ({self.uploader.backend})", disable=not show_progress) as pbar:
+            for future in asyncio.as_completed(tasks):
+                result = await future
+                results.append(result)
+                update = {"local_path": result.local_path, "status": result.status, "content_sha256": result.digest}
+                if result.resource_id:
+                    update[id_col] = result.resource_id
+                pending_updates[result.video_id] = update
+                if len(pending_updates) >= flush_every:
+                    await flush()
+                pbar.update(1)
+        await flush()
+
+        sources = [r.source for r in results]
+        logger.info(f"Upload finished: {sources.count('upload')} uploaded, {sources.count('index')} from index, "
+                    f"{sources.count('remote')} found remotely, "
+                    f"{sum(r.status.endswith('failed') for r in results)} failed, "
+                    f"{sum(r.status == 'local_missing' for r in results)} missing locally.")
+        return results
+
+
+# --- Incremental Metadata Update ---
+def update_metadata_rows(metadata_file: str, video_updates: Dict[str, Dict],
+                         seed_rows: Optional[Iterable[Dict]] = None):
+    """
+    Applies per-video column updates to METADATA_FILE in one streaming pass.
+
+    Rows (one per question) are copied through unchanged except for the update
+    columns of the listed videos. `seed_rows` (e.g. the dataset CSV rows) creates
+    the file when it does not exist yet. A dataset store directory is updated in place.
+    """
+    if is_dataset_store(metadata_file):
+        DatasetStore(metadata_file).update_videos(video_updates)
+        return
+    if not Path(metadata_file).is_file():
+        if seed_rows is None:
+            raise FileNotFoundError(f"Metadata file {metadata_file} missing and no seed rows given.")
+        source_rows: Iterable[Dict] = seed_rows
+        fieldnames: Optional[List[str]] = None
+        src = None
+    else:
+        src = open(metadata_file, newline="", encoding="utf-8")
+        reader = csv.DictReader(src)
+        source_rows, fieldnames = reader, list(reader.fieldnames or [])
+
+    tmp_path = metadata_file + ".tmp"
+    try:
+        with open(tmp_path, "w", newline="", encoding="utf-8") as dst:
+            writer = None
+            for row in source_rows:
+                if writer is None:
+                    fieldnames = list(fieldnames or row.keys())
+                    fieldnames += [c for c in METADATA_UPDATE_COLS if c not in fieldnames]
+                    writer = csv.DictWriter(dst, fieldnames=fieldnames, extrasaction="ignore")
+                    writer.writeheader()
+                row.setdefault("status", "pending")
+                update = video_updates.get(row.get("video_id"))
+                if update:
+                    row.update({k: v for k, v in update.items() if v is not None})
+                writer.writerow(row)
+    finally:
+        if src is not None:
+            src.close()
+    os.replace(tmp_path, metadata_file)
+    logger.info(f"Metadata file '{metadata_file}' updated with {len(video_updates)} video records.")
+
+
+UPLOAD_COMMAND = "upload-videos"
+
+
+def upload_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference upload-videos`."""
+    parser = argparse.ArgumentParser(prog=f"python -m inference {UPLOAD_COMMAND}",
+                                     description="Upload prepared videos (content-addressed, deduplicated).")
+    parser.add_argument("command", choices=(UPLOAD_COMMAND,))
+    parser.add_argument("--speed", type=float, default=0.5, help="VIDEO_SPEED_FACTOR of speed_videos/<speed>.")
+    parser.add_argument("--speed-videos-root", default="speed_videos")
+    parser.add_argument("--dataset", default="dataset.csv", help="DATASET_CSV, used to create the metadata file.")
+    parser.add_argument("--metadata", default=None, help="METADATA_FILE (default: video_metadata_{vertex,non_vertex}.csv).")
+    parser.add_argument("--vertex", action="store_true", help="Upload to GCS for Vertex AI instead of the File API.")
+    parser.add_argument("--bucket", default=os.environ.get("GCS_BUCKET"), help="GCS bucket (Vertex).")
+    parser.add_argument("--project", default=os.environ.get("GOOGLE_CLOUD_PROJECT"))
+    parser.add_argument("--location", default=os.environ.get("GOOGLE_CLOUD_LOCATION"))
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent uploads.")
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--limit", type=int, default=None, help="MAX_VIDEOS_TO_PROCESS.")
+    parser.add_argument("--no-progress", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    metadata_file = args.metadata or ("video_metadata_vertex.csv" if args.vertex else "video_metadata_non_vertex.csv")
+    with open(args.dataset, newline="", encoding="utf-8") as f:
+        dataset_rows = list(csv.DictReader(f))
+    video_ids = sorted({row["video_id"] for row in dataset_rows if row.get("video_id")})[:args.limit]
+    speed_videos_path = Path(args.speed_videos_root) / str(args.speed)
+    videos = {vid: speed_videos_path / f"{vid}.mp4" for vid in video_ids}
+
+    if args.vertex:
+        if not args.bucket: parser.error("--bucket (or GCS_BUCKET) is required with --vertex.")
+        from google.cloud import storage
+        uploader: Any = GcsUploader(storage.Client(project=args.project), args.bucket)
+    else:
+        from .clients import create_genai_client
+        uploader = FileApiUploader(create_genai_client(False, args.project, args.location).files)
+
+    if not Path(metadata_file).is_file():
+        update_metadata_rows(metadata_file, {}, seed_rows=dataset_rows)
+    index = UploadIndex(str(Path(args.speed_videos_root) / INDEX_NAME))
+    manager = UploadManager(uploader, index, args.workers, args.max_retries)
+    results = asyncio.run(manager.upload_all(videos, args.speed, metadata_file, show_progress=not args.no_progress))
+    return 0 if all(r.status.startswith("uploaded") for r in results) else 1
@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from .data import resource_column
+from .metrics import DEFAULT_METRICS
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_SEC = 3600.0          # Re-verify a handle at least this often
+EXPIRY_MARGIN_SEC = 600.0         # Stop using File API handles this long before they expire
+
+
+# --- Uncached Lookup ---
+async def fetch_video_part(client: Any, item: Dict, use_vertex: bool) -> Any:
+    """Returns the video `Part` (Vertex) or File API object (Gemini API) for a metadata row."""
+    if use_vertex:
+        from google.genai import types
+
+        gcs_uri = item.get("gcs_uri")
+        if not gcs_uri: raise ValueError("Missing GCS URI.")
+        return types.Part.from_uri(mime_type='video/mp4', file_uri=gcs_uri)
+
+    file_api_name = item.get("file_api_name")
+    if not file_api_name: raise ValueError("Missing File API name.")
+    try:
+        with DEFAULT_METRICS.timer("files_get"):
+            return await client.aio.files.get(name=file_api_name)
+    except Exception as e:
+        DEFAULT_METRICS.record_error(e, "files_get")
+        if type(e).__name__ == "NotFoundError" or getattr(e, "code", None) == 404:
+            raise FileNotFoundError(f"File API '{file_api_name}' not found.")
+        raise RuntimeError(f"Failed get File API obj: {e}")
+
+
+def default_handle_cache_path(metadata_file: str) -> str:
+    """Persistence file stored next to METADATA_FILE (e.g. video_metadata_non_vertex.handles.json)."""
+    path = Path(metadata_file)
+    return str(path.with_name(path.stem + ".handles.json"))
+
+
+@dataclass
+class _HandleEntry:
+    file_uri: str
+    mime_type: str
+    expires_at: float # time.time() based, so it survives restarts
+    part: Optional["types.Part"] = None
+
+    def to_part(self) -> "types.Part":
+        if self.part is None:
+            from google.genai import types
+
+            self.part = types.Part.from_uri(file_uri=self.file_uri, mime_type=self.mime_type)
+        return self.part
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Per-Video Handle Cache
+# ──────────────────────────────────────────────────────────────────────────────
+
+class VideoHandleCache:
+    """
+    In-process cache of resolved video handles, keyed by `file_api_name` / `gcs_uri`.
+
+    Every question of a video reuses one `types.Part`. Entries expire after `ttl_sec`
+    or `expiry_margin_sec` before the File API `expiration_time`, whichever is sooner.
+    Concurrent lookups of the same handle share a single `files.get` call.
+
+    Args:
+        client: Client exposing `client.aio.files.get`.
+        use_vertex (bool): Resolve `gcs_uri` (no network) instead of `file_api_name`.
+        ttl_sec (float): Maximum age of an entry.
+        expiry_margin_sec (float): Safety margin before File API expiry.
+        persist_path (str, optional): JSON file used to reuse handles across runs.
+    """
+    def __init__(self, client: Any, use_vertex: bool, ttl_sec: float = DEFAULT_TTL_SEC,
+                 expiry_margin_sec: float = EXPIRY_MARGIN_SEC, persist_path: Optional[str] = None):
+        self.client = client
+        self.use_vertex = use_vertex
+        self.ttl_sec = ttl_sec
+        self.expiry_margin_sec = expiry_margin_sec
+        self.persist_path = persist_path
+        self._entries: Dict[str, _HandleEntry] = {}
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if persist_path:
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _expires_at(self, resource: Any) -> float:
+        expires_at = time.time() + self.ttl_sec
+        expiration_time = getattr(resource, "expiration_time", None)
+        if expiration_time is not None:
+            expires_at = min(expires_at, expiration_time.timestamp() - self.expiry_margin_sec)
+        return expires_at
+
+    async def _resolve(self, key: str, item: Dict) -> _HandleEntry:
+        from google.genai import types
+
+        resource = await fetch_video_part(self.client, item, self.use_vertex)
+        if isinstance(resource, types.Part):
+            entry = _HandleEntry(resource.file_data.file_uri, resource.file_data.mime_type,
+                                 time.time() + self.ttl_sec, resource)
+        else:
+            entry = _HandleEntry(resource.uri, resource.mime_type or "video/mp4", self._expires_at(resource))
+        self._entries[key] = entry
+        self._dirty = True
+        return entry
+
+    async def get_part(self, item: Dict) -> "types.Part":
+        """Returns the shared `types.Part` for the video referenced by a metadata row."""
+        key = item.get(resource_column(self.use_vertex))
+        if not key:
+            # Let the uncached path raise the usual "Missing ..." input error
+            return await fetch_video_part(self.client, item, self.use_vertex)
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.time():
+            self.hits += 1
+            return entry.to_part()
+        self._entries.pop(key, None)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._resolve(key, item))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        else:
+            self.hits += 1
+        # Shield so one cancelled waiter does not cancel the lookup for everyone else
+        entry = await asyncio.shield(task)
+        return entry.to_part()
+
+    def invalidate(self, key: str):
+        """Drops a handle, e.g. after the API reports it expired or missing."""
+        if self._entries.pop(key, None) is not None:
+            self._dirty = True
+
+    # --- Persistence ---
+    def _load(self):
+        if not self.persist_path or not os.path.isfile(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable handle cache {self.persist_path}: {e}")
+            return
+        now = time.time()
+        for key, value in raw.items():
+            if value.get("expires_at", 0) > now:
+                self._entries[key] = _HandleEntry(value["file_uri"], value["mime_type"], value["expires_at"])
+        logger.info(f"Loaded {len(self._entries)} unexpired video handles from {self.persist_path}")
+
+    def save(self):
+        """Writes unexpired handles to `persist_path` (atomic replace). No-op without changes."""
+        if not self.persist_path or not self._dirty:
+            return
+        now = time.time()
+        raw = {key: {"file_uri": e.file_uri, "mime_type": e.mime_type, "expires_at": e.expires_at}
+               for key, e in self._entries.items() if e.expires_at > now}
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(raw, f)
+        os.replace(tmp_path, self.persist_path)
+        self._dirty = False
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
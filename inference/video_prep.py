@@ -0,0 +1,268 @@
+import argparse
+import asyncio
+import csv
+import fractions
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from tqdm import tqdm
+
+from .metrics import DEFAULT_METRICS
+
+logger = logging.getLogger(__name__)
+
+AUDIO_BITRATE = "128k"
+PROBE_CACHE_NAME = "probe_cache.json"
+REPORT_NAME = "prep_report.csv"
+REPORT_FIELDS = ["video", "status", "seconds", "input_mb", "output_mb", "duration_sec", "realtime_x", "error"]
+
+
+def default_max_workers() -> int:
+    """One ffmpeg process per CPU core. The video stream is copied, so each process is mostly I/O plus audio encode."""
+    return max(1, os.cpu_count() or 1)
+
+
+async def run_subprocess(cmd: List[str], check: bool = True, capture_output: bool = False) -> Tuple[bytes, bytes, int]:
+    """Helper function to run subprocess asynchronously."""
+    stdout_pipe = asyncio.subprocess.PIPE if capture_output else asyncio.subprocess.DEVNULL
+    stderr_pipe = asyncio.subprocess.PIPE if check or capture_output else asyncio.subprocess.DEVNULL
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=stdout_pipe, stderr=stderr_pipe)
+    stdout, stderr = await process.communicate()
+    if check and process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, output=stdout, stderr=stderr)
+    return stdout, stderr, process.returncode
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Single-Pass Speed Change
+# ──────────────────────────────────────────────────────────────────────────────
+# The notebooks used ffprobe + three ffmpeg runs per clip (atempo audio to a temp
+# file, h264 annexb extract to a temp file, remux with `-r new_fps`). Here one
+# ffmpeg process does it all: `-itsscale:v` rescales the copied video timestamps
+# by 1/speed (same effect as the `-r` remux, still no video re-encode) while
+# `atempo` retimes the audio in the same pass. The only file written is the output.
+
+def atempo_chain(speed: float) -> List[str]:
+    """Splits `speed` into `atempo` steps, each within the filter's [0.5, 2.0] range."""
+    factor = speed
+    filter_parts = []
+    while factor > 2.0:
+        filter_parts.append("atempo=2.0")
+        factor /= 2.0
+    while factor < 0.5:
+        filter_parts.append("atempo=0.5")
+        factor /= 0.5
+    if abs(factor - 1.0) > 1e-6:
+        filter_parts.append(f"atempo={factor:.6f}")
+    return filter_parts
+
+
+def build_speed_command(src: str, dst: str, speed: float, has_audio: bool = True) -> List[str]:
+    """ffmpeg command changing playback speed in one pass (video copied, audio pitch kept)."""
+    cmd = ["ffmpeg", "-y", "-v", "error", "-itsscale:v", f"{1.0 / speed:.6f}", "-i", src, "-map", "0:v:0", "-c:v", "copy"]
+    filter_parts = atempo_chain(speed)
+    if has_audio:
+        cmd += ["-map", "0:a:0?"]
+        cmd += ["-filter:a", ",".join(filter_parts), "-c:a", "aac", "-b:a", AUDIO_BITRATE] if filter_parts else ["-c:a", "copy"]
+    cmd += ["-movflags", "+faststart", "-f", "mp4", dst]
+    return cmd
+
+
+# --- Probe Cache ---
+@dataclass
+class ProbeInfo:
+    fps: float
+    duration_sec: float
+    has_audio: bool
+
+
+class ProbeCache:
+    """
+    ffprobe results keyed by path, size and mtime, persisted as JSON.
+
+    Re-running preparation (or another `VIDEO_SPEED_FACTOR`) over the same source
+    videos skips every ffprobe launch.
+    """
+    def __init__(self, persist_path: Optional[str] = None):
+        self.persist_path = persist_path
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        if persist_path and os.path.isfile(persist_path):
+            try:
+                with open(persist_path, encoding="utf-8") as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable probe cache {persist_path}: {e}")
+
+    @staticmethod
+    def _key(video_path: Path) -> str:
+        st = video_path.stat()
+        return f"{video_path.resolve()}|{st.st_size}|{st.st_mtime_ns}"
+
+    async def probe(self, video_path: Path) -> ProbeInfo:
+        key = self._key(video_path)
+        cached = self._entries.get(key)
+        if cached is not None:
+            self.hits += 1
+            return ProbeInfo(**cached)
+
+        self.misses += 1
+        cmd = ["ffprobe", "-v", "error", "-of", "json", "-show_entries",
+               "stream=codec_type,r_frame_rate:format=duration", str(video_path)]
+        with DEFAULT_METRICS.timer("ffprobe"):
+            stdout, _, _ = await run_subprocess(cmd, check=True, capture_output=True)
+        raw = json.loads(stdout.decode() or "{}")
+        streams = raw.get("streams", [])
+        video = next((s for s in streams if s.get("codec_type") == "video"), None)
+        if video is None:
+            raise ValueError(f"No video stream in {video_path.name}")
+        info = ProbeInfo(
+            fps=float(fractions.Fraction(video.get("r_frame_rate", "0/1"))),
+            duration_sec=float(raw.get("format", {}).get("duration") or 0.0),
+            has_audio=any(s.get("codec_type") == "audio" for s in streams),
+        )
+        self._entries[key] = asdict(info)
+        self._dirty = True
+        return info
+
+    def save(self):
+        if not self.persist_path or not self._dirty:
+            return
+        tmp_path = self.persist_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.persist_path)
+        self._dirty = False
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Preparation Engine
+# ──────────────────────────────────────────────────────────────────────────────
+
+async def process_single_video(vid_path: Path, speed_videos_path: Path, speed: float,
+                               semaphore: asyncio.Semaphore, probe_cache: ProbeCache) -> Dict[str, Any]:
+    """Changes the speed of one video. Returns a timing record with `status` processed / skipped / error."""
+    out_path = speed_videos_path / vid_path.name
+    record: Dict[str, Any] = {"video": vid_path.name, "status": "skipped", "seconds": 0.0,
+                              "input_mb": round(vid_path.stat().st_size / 2**20, 2)}
+    if out_path.is_file():
+        return record
+
+    async with semaphore: # One slot per ffmpeg process
+        start_time = time.perf_counter()
+        tmp_path = out_path.with_name(out_path.name + ".part")
+        try:
+            if speed == 1.0:
+                await asyncio.to_thread(shutil.copy, vid_path, tmp_path)
+            else:
+                info = await probe_cache.probe(vid_path)
+                record["duration_sec"] = round(info.duration_sec, 2)
+                with DEFAULT_METRICS.timer("ffmpeg"):
+                    await run_subprocess(build_speed_command(str(vid_path), str(tmp_path), speed, info.has_audio))
+            os.replace(tmp_path, out_path) # Never leave a partial output under the final name
+            record["status"] = "processed"
+        except Exception as e:
+            err_msg = f"Error processing {vid_path.name}: {e}"
+            if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+                err_msg += f"\nFFmpeg/FFprobe Stderr:\n{e.stderr.decode(errors='ignore')}"
+            logger.error(err_msg)
+            DEFAULT_METRICS.record_error(e, "prepare")
+            record.update(status="error", error=str(e))
+            tmp_path.unlink(missing_ok=True)
+        finally:
+            record["seconds"] = round(time.perf_counter() - start_time, 3)
+
+    if record["status"] == "processed":
+        record["output_mb"] = round(out_path.stat().st_size / 2**20, 2)
+        if record.get("duration_sec") and record["seconds"] > 0:
+            record["realtime_x"] = round(record["duration_sec"] / record["seconds"], 1)
+    return record
+
+
+def _write_report(report_file: str, records: List[Dict[str, Any]]):
+    with open(report_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(sorted(records, key=lambda r: r["video"]))
+
+
+async def prepare_videos(vid_paths: List[Path], speed_videos_path: Path, speed: float,
+                         max_workers: Optional[int] = None, report_file: Optional[str] = None,
+                         show_progress: bool = True) -> Dict[str, Any]:
+    """
+    Changes the speed of every video in `vid_paths`, at most `max_workers` ffmpeg processes at once.
+
+    ffprobe results are cached in `<speed_videos_path>/../probe_cache.json` (shared by all
+    speed factors), and per-video timings are written to `report_file`
+    (default: `<speed_videos_path>/prep_report.csv`).
+
+    Returns:
+        dict: Counts per status plus total and per-video wall time.
+    """
+    speed_videos_path.mkdir(parents=True, exist_ok=True)
+    max_workers = max_workers or default_max_workers()
+    semaphore = asyncio.Semaphore(max_workers)
+    probe_cache = ProbeCache(str(speed_videos_path.parent / PROBE_CACHE_NAME))
+    logger.info(f"Transforming {len(vid_paths)} videos at speed {speed} with {max_workers} workers...")
+
+    start_time = time.perf_counter()
+    tasks = [asyncio.create_task(process_single_video(p, speed_videos_path, speed, semaphore, probe_cache))
+             for p in vid_paths]
+    records = []
+    try:
+        with tqdm(total=len(tasks), desc="Transforming Videos", unit="video", disable=not show_progress) as pbar:
+            for future in asyncio.as_completed(tasks):
+                records.append(await future)
+                pbar.update(1)
+    finally:
+        probe_cache.save()
+
+    wall_sec = time.perf_counter() - start_time
+    report_file = report_file or str(speed_videos_path / REPORT_NAME)
+    await asyncio.to_thread(_write_report, report_file, records)
+
+    processed = [r for r in records if r["status"] == "processed"]
+    summary = {status: sum(r["status"] == status for r in records) for status in ("processed", "skipped", "error")}
+    summary.update(
+        total=len(records), wall_sec=round(wall_sec, 2),
+        avg_video_sec=round(sum(r["seconds"] for r in processed) / len(processed), 3) if processed else 0.0,
+        probe_cache_hits=probe_cache.hits, report_file=report_file,
+    )
+    logger.info(f"{summary['skipped']} videos skipped, {summary['processed']} videos processed, "
+                f"{summary['error']} errors, {len(vid_paths)} total in {wall_sec:.1f}s. Report: {report_file}")
+    logger.info(f"Stage latencies:\n{DEFAULT_METRICS.report()}")
+    return summary
+
+
+PREP_COMMAND = "prepare-videos"
+
+
+def prep_main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for `python -m inference prepare-videos`."""
+    parser = argparse.ArgumentParser(prog=f"python -m inference {PREP_COMMAND}",
+                                     description="Change the playback speed of extracted videos (single ffmpeg pass).")
+    parser.add_argument("command", choices=(PREP_COMMAND,))
+    parser.add_argument("--videos-dir", default="extracted_videos", help="Directory with the extracted *.mp4 files.")
+    parser.add_argument("--output-root", default="speed_videos", help="Outputs go to <output-root>/<speed>.")
+    parser.add_argument("--speed", type=float, default=0.5, help="VIDEO_SPEED_FACTOR.")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel ffmpeg processes (default: CPU count).")
+    parser.add_argument("--no-progress", action="store_true")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level="INFO", format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.StreamHandler(sys.stdout)])
+
+    vid_paths = sorted(Path(args.videos_dir).glob("*.mp4"))
+    summary = asyncio.run(prepare_videos(vid_paths, Path(args.output_root) / str(args.speed), args.speed,
+                                         args.workers, show_progress=not args.no_progress))
+    print(summary)
+    return 0 if summary["error"] == 0 else 1
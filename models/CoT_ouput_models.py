@@ -106,10 +106,7 @@ def get_model_name_gemini_2_5_pro_preview_03_25():
 def get_cot_model(model_name):
     """
     Returns the model name, prompt templates, and configuration for the specified model.
+    Built once per model by `models.registry`; later calls return the same objects.
     """
-    if model_name == "gemini-2.0-flash":
-        return get_model_name_gemini_2_0_flash()
-    elif model_name == "gemini-2.5-pro-preview-03-25":
-        return get_model_name_gemini_2_5_pro_preview_03_25()
-    else:
-        raise ValueError(f"Unknown model name: {model_name}")
\ No newline at end of file
+    from models.registry import get_model_config
+    return get_model_config("cot", model_name).as_tuple()
@@ -1,6 +1,4 @@
-from google import genai
 from google.genai import types
-from tqdm.auto import tqdm
 from pydantic import BaseModel, Field
 from typing import *
 import json
@@ -143,9 +141,5 @@ def get_brainstorm_prompt(model_name, number_of_questions: int = 5):
     Returns:
         tuple: A tuple containing the model name, system prompt, schema, config, requests per minute, max retries, and max async workers.
     """
-    
-    if model_name == "gemini-2.0-flash":
-        return get_brainstorm_prompt_gemini_2_0_flash(number_of_questions)
-    else:
-        raise ValueError(f"Model name '{model_name}' is not supported.")
-    
\ No newline at end of file
+    from models.registry import get_model_config
+    return get_model_config("brainstorm", model_name, num_questions=number_of_questions).as_tuple()
@@ -98,9 +98,5 @@ def get_model_name_gemini_2_5_pro_exp_03_25():
 
 
 def get_non_cot_model(model_name):
-    if model_name == "gemini-2.5-flash-preview-04-17":
-        return get_model_name_gemnini_2_5_flash_preview_04_17()
-    elif model_name == "gemini-2.5-pro-exp-03-25":
-        return get_model_name_gemini_2_5_pro_exp_03_25()
-    else:
-        raise ValueError(f"Unknown model name: {model_name}")
\ No newline at end of file
+    from models.registry import get_model_config
+    return get_model_config("noncot", model_name).as_tuple()
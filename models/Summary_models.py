@@ -140,11 +140,5 @@ def get_model_name_gemini_2_0_flash_ver3():
 
 
 def get_summary_model(model_name):
-    if model_name == "gemini-2.0-flash-ver1":
-        return get_model_name_gemini_2_0_flash_ver1()
-    elif model_name == "gemini-2.0-flash-ver2":
-        return get_model_name_gemini_2_0_flash_ver2()
-    elif model_name == "gemini-2.0-flash-ver3":
-        return get_model_name_gemini_2_0_flash_ver3()
-    else:
-        raise ValueError(f"Model name '{model_name}' is not recognized.")
\ No newline at end of file
+    from models.registry import get_model_config
+    return get_model_config("summary", model_name).as_tuple()
@@ -0,0 +1,112 @@
+import hashlib
+import importlib
+import json
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Registry
+# ──────────────────────────────────────────────────────────────────────────────
+# kind -> model name -> "module:getter". Modules (and with them `google.genai`) are
+# only imported the first time one of their configs is requested.
+
+MODEL_REGISTRY: Dict[str, Dict[str, str]] = {
+    "cot": {
+        "gemini-2.0-flash": "models.CoT_ouput_models:get_model_name_gemini_2_0_flash",
+        "gemini-2.5-pro-preview-03-25": "models.CoT_ouput_models:get_model_name_gemini_2_5_pro_preview_03_25",
+    },
+    "noncot": {
+        "gemini-2.5-flash-preview-04-17": "models.NonCoT_output_models:get_model_name_gemnini_2_5_flash_preview_04_17",
+        "gemini-2.5-pro-exp-03-25": "models.NonCoT_output_models:get_model_name_gemini_2_5_pro_exp_03_25",
+    },
+    "summary": {
+        "gemini-2.0-flash-ver1": "models.Summary_models:get_model_name_gemini_2_0_flash_ver1",
+        "gemini-2.0-flash-ver2": "models.Summary_models:get_model_name_gemini_2_0_flash_ver2",
+        "gemini-2.0-flash-ver3": "models.Summary_models:get_model_name_gemini_2_0_flash_ver3",
+    },
+    "brainstorm": {
+        "gemini-2.0-flash": "models.Generating_Questions_models:get_brainstorm_prompt_gemini_2_0_flash",
+    },
+}
+
+
+@dataclass(frozen=True)
+class ModelConfig:
+    """
+    One registered model configuration.
+
+    Equality and hashing use `(kind, name, params)` only, so a config can key dicts,
+    caches and metrics. Unpacks like the tuple of its `models/*` getter:
+    `MODEL_NAME, SYSTEM_PROMPT, PROMPT_TEMPLATES, CONFIG, ... = config`.
+    """
+    kind: str
+    name: str
+    params: Tuple[Tuple[str, Any], ...]
+    model_name: str = field(compare=False)
+    system_prompt: str = field(compare=False, repr=False)
+    generate_config: Any = field(compare=False, repr=False)          # `types.GenerateContentConfig`
+    prompt_templates: Optional[Dict[str, str]] = field(default=None, compare=False, repr=False)
+    schema: Optional[type] = field(default=None, compare=False, repr=False) # Structured output (brainstorm)
+    requests_per_minute: Optional[int] = field(default=None, compare=False)
+    max_retries: Optional[int] = field(default=None, compare=False)
+    max_async_workers: Optional[int] = field(default=None, compare=False)
+
+    def as_tuple(self) -> Tuple:
+        """The getter's original return value (3-tuple for summary models, else 7-tuple)."""
+        if self.kind == "summary":
+            return self.model_name, self.system_prompt, self.generate_config
+        templates_or_schema = self.schema if self.kind == "brainstorm" else self.prompt_templates
+        return (self.model_name, self.system_prompt, templates_or_schema, self.generate_config,
+                self.requests_per_minute, self.max_retries, self.max_async_workers)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.as_tuple())
+
+    @cached_property
+    def fingerprint(self) -> str:
+        """Hash of everything sent to the model; changes whenever a prompt or generation parameter does."""
+        payload = {
+            "model_name": self.model_name,
+            "system_prompt": self.system_prompt,
+            "prompt_templates": self.prompt_templates,
+            "config": self.generate_config.model_dump(exclude_none=True) if self.generate_config is not None else None,
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def registered_models(kind: str) -> List[str]:
+    return list(MODEL_REGISTRY.get(kind, {}))
+
+
+@lru_cache(maxsize=None)
+def _build(kind: str, name: str, params: Tuple[Tuple[str, Any], ...]) -> ModelConfig:
+    module_name, getter_name = MODEL_REGISTRY[kind][name].split(":")
+    values = getattr(importlib.import_module(module_name), getter_name)(**dict(params))
+    if kind == "summary":
+        model_name, system_prompt, config = values
+        return ModelConfig(kind, name, params, model_name, system_prompt, config)
+    model_name, system_prompt, templates_or_schema, config, rpm, max_retries, max_workers = values
+    templates, schema = (None, templates_or_schema) if kind == "brainstorm" else (templates_or_schema, None)
+    return ModelConfig(kind, name, params, model_name, system_prompt, config, templates, schema,
+                       rpm, max_retries, max_workers)
+
+
+def get_model_config(kind: str, name: str, **params: Any) -> ModelConfig:
+    """
+    Returns the memoized config of a registered model; prompts, schemas and the
+    `GenerateContentConfig` are built once per `(kind, name, params)`.
+
+    Args:
+        kind (str): "cot", "noncot", "summary" or "brainstorm".
+        name (str): Registered model name.
+        **params: Getter arguments (brainstorm: `num_questions`).
+
+    Returns:
+        ModelConfig: Shared instance; treat it (and its config) as read-only.
+    """
+    if name not in MODEL_REGISTRY.get(kind, {}):
+        raise ValueError(f"Unknown {kind} model name: {name}. Registered: {', '.join(registered_models(kind)) or 'none'}")
+    if kind == "brainstorm":
+        params.setdefault("num_questions", 5)
+    return _build(kind, name, tuple(sorted(params.items())))
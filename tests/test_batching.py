@@ -0,0 +1,93 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pydantic
+import pytest
+
+from inference.batching import batch_config, batch_response_schema, group_into_batches, split_batch_answers
+from inference.engine import perform_batch_inference_async
+from inference.fake_client import FakeGeminiClient, FakeResponse
+from inference.jobs import InferenceJob, text_response
+
+QIDS = ["q1", "q2", "q3"]
+
+
+class _BatchClient(FakeGeminiClient):
+    """Answers batched requests with `batch_entries` (None: the fake structured payload), single ones with their qid."""
+    def __init__(self, batch_entries=None):
+        super().__init__()
+        self.batch_entries = batch_entries
+        self.single_qids = []
+        generate = self.aio.models.generate_content
+
+        async def generate_content(*, model, contents, config=None):
+            if getattr(config, "response_schema", None) is None:
+                self.single_qids.append(contents[0])
+                return FakeResponse(text=f"Single {contents[0]}.")
+            if self.batch_entries is None:
+                return await generate(model=model, contents=contents, config=config)
+            if isinstance(self.batch_entries, str): # Raw response text
+                return FakeResponse(text=self.batch_entries)
+            return FakeResponse(text=json.dumps({"answers": self.batch_entries}))
+        self.aio.models.generate_content = generate_content
+
+
+def _answer(client):
+    job = InferenceJob(model_name="m", config=None, build_contents=lambda item, part: [item["qid"], part],
+                       parse_response=text_response,
+                       build_batch_contents=lambda questions, part: (["batch", part],
+                                                                     batch_config(None, [q["qid"] for q in questions])))
+    items = [{"qid": qid, "video_id": "v1", "file_api_name": "files/v1"} for qid in QIDS]
+    [batch] = group_into_batches(items)
+    queue = asyncio.Queue()
+    asyncio.run(perform_batch_inference_async(batch, client, job, asyncio.Semaphore(4), None, queue))
+    rows = [queue.get_nowait() for _ in range(queue.qsize())]
+    return {row["qid"]: row["pred"] for row in rows}
+
+
+def test_full_batch_is_split_per_qid():
+    client = _BatchClient()
+    preds = _answer(client)
+    assert set(preds) == set(QIDS) and client.calls == 1 and client.single_qids == []
+
+
+def test_malformed_entry_falls_back_alone():
+    client = _BatchClient([{"qid": "q1", "answer": "A."}, {"qid": "q2", "answer": "  "}, {"qid": "q3", "answer": "C."}])
+    assert _answer(client) == {"q1": "A.", "q2": "Single q2.", "q3": "C."}
+    assert client.single_qids == ["q2"]
+
+
+def test_missing_qid_falls_back():
+    client = _BatchClient([{"qid": "q1", "answer": "A."}, {"qid": "q3", "answer": "C."}])
+    assert _answer(client) == {"q1": "A.", "q2": "Single q2.", "q3": "C."}
+    assert client.single_qids == ["q2"]
+
+
+def test_unexpected_qid_is_dropped():
+    client = _BatchClient([{"qid": "q1", "answer": "A."}, {"qid": "q9", "answer": "B?"}, {"qid": "q3", "answer": "C."}])
+    assert _answer(client) == {"q1": "A.", "q2": "Single q2.", "q3": "C."}
+    assert client.single_qids == ["q2"]
+
+
+def test_unparseable_batch_answers_every_question_singly():
+    client = _BatchClient("Sorry, here are my answers: A, B, C.")
+    assert _answer(client) == {qid: f"Single {qid}." for qid in QIDS}
+
+
+def test_split_handles_parsed_fenced_and_duplicate_entries():
+    schema = batch_response_schema(QIDS)
+    parsed = schema.model_validate({"answers": [{"qid": q, "answer": f"{q} answer"} for q in QIDS]})
+    assert split_batch_answers(SimpleNamespace(parsed=parsed, text=""), QIDS) == {q: f"{q} answer" for q in QIDS}
+    fenced = '```json\n{"answers": [{"qid": "q1", "answer": "first"}, {"qid": "q1", "answer": "second"}, "junk"]}\n```'
+    assert split_batch_answers(SimpleNamespace(parsed=None, text=fenced), QIDS) == {"q1": "first"}
+    assert split_batch_answers(SimpleNamespace(parsed=None, text="{not json"), QIDS) == {}
+
+
+def test_schema_pins_qids_and_count():
+    schema = batch_response_schema(["q1", "q2"])
+    schema.model_validate({"answers": [{"qid": "q1", "answer": "A"}, {"qid": "q2", "answer": "B"}]})
+    with pytest.raises(pydantic.ValidationError):
+        schema.model_validate({"answers": [{"qid": "q1", "answer": "A"}, {"qid": "q7", "answer": "B"}]})
+    with pytest.raises(pydantic.ValidationError):
+        schema.model_validate({"answers": [{"qid": "q1", "answer": "A"}]})
@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from inference.chat_builder import build_chat_history_async, make_chat_job
+from inference.fake_client import FakeGeminiClient, FakeNotFound
+from inference.retry import RetryPolicy
+
+
+class _FailingTurnClient(FakeGeminiClient):
+    """Raises `error` for the request whose last message asks `question`."""
+    def __init__(self, question, error):
+        super().__init__(response_text="Fake answer.")
+        generate = self.aio.models.generate_content
+
+        async def generate_content(*, model, contents, config=None):
+            if contents[-1].parts[0].text == question:
+                raise error
+            return await generate(model=model, contents=contents, config=config)
+        self.aio.models.generate_content = generate_content
+
+
+def _answer_video(client, answers_dir):
+    job = make_chat_job(("m", "", {}, None, None, 0, 2), {"v1": ["Q1?", "Q2?", "Q3?"]}, str(answers_dir))
+    job.retry_policy = RetryPolicy(max_retries=0)
+    queue = asyncio.Queue()
+
+    async def scenario():
+        await build_chat_history_async({"video_id": "v1", "file_api_name": "files/v1"}, client, job,
+                                       asyncio.Semaphore(2), None, queue)
+        return queue.get_nowait()
+
+    return asyncio.run(scenario())
+
+
+def _saved_answers(answers_dir):
+    with open(answers_dir / "v1.json") as f:
+        chat = json.load(f)
+    return [turn["parts"][0] for turn in chat if turn["role"] == "model"]
+
+
+def test_failed_turn_is_saved_as_its_answer(tmp_path):
+    result = _answer_video(_FailingTurnClient("Q2?", FakeNotFound(400, "bad request")), tmp_path)
+    assert result["status"] == "Success" and "handle_error" not in result
+    answers = _saved_answers(tmp_path)
+    assert answers[0] == answers[2] == "Fake answer."
+    assert answers[1].startswith("ERROR: ") and "bad request" in answers[1]
+
+
+def test_expired_handle_leaves_the_video_unsaved(tmp_path):
+    result = _answer_video(_FailingTurnClient("Q2?", FakeNotFound(403, "expired")), tmp_path)
+    assert result["status"] == "Failed (Input)" and result["handle_error"]
+    assert not (tmp_path / "v1.json").exists()
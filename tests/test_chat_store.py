@@ -0,0 +1,38 @@
+import json
+import os
+
+from inference.chat_store import ChatHistoryStore, default_pack_path, pack_chat_histories
+
+
+def _write_chat(answers_dir, video_id, answer, mtime):
+    path = answers_dir / f"{video_id}.json"
+    path.write_text(json.dumps([{"role": "user", "parts": ["Q?"]}, {"role": "model", "parts": [answer]}]))
+    os.utime(path, (mtime, mtime))
+
+
+def _answer(store, video_id):
+    return store.get(video_id)[1].parts[0].text
+
+
+def test_packed_histories_are_read_from_the_pack(tmp_path):
+    _write_chat(tmp_path, "v1", "Packed 1.", 1_000)
+    _write_chat(tmp_path, "v2", "Packed 2.", 1_000)
+    assert pack_chat_histories(str(tmp_path)) == 2
+    store = ChatHistoryStore(str(tmp_path))
+    assert store.stats()["packed"] == 2
+    os.remove(tmp_path / "v1.json") # Served from the pack alone
+    assert _answer(store, "v1") == "Packed 1."
+    store.close()
+
+
+def test_newer_json_supersedes_its_packed_copy(tmp_path):
+    _write_chat(tmp_path, "v1", "Old answer.", 1_000)
+    _write_chat(tmp_path, "v2", "Kept answer.", 1_000)
+    pack_chat_histories(str(tmp_path))
+    pack_mtime = os.stat(default_pack_path(str(tmp_path))).st_mtime
+    _write_chat(tmp_path, "v1", "New answer.", pack_mtime + 10) # Answers stage re-run after packing
+    store = ChatHistoryStore(str(tmp_path))
+    assert store.stats()["packed"] == 1
+    assert _answer(store, "v1") == "New answer."
+    assert _answer(store, "v2") == "Kept answer."
+    store.close()
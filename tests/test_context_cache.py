@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from inference.context_cache import ContextCacheManager
+from inference.engine import generate_with_context_cache
+from inference.fake_client import FakeGeminiClient
+from inference.jobs import InferenceJob, text_response
+
+
+def _job(client, **cache_options):
+    job = InferenceJob(model_name="m", config=None, build_contents=lambda item, part: [part, item["qid"]],
+                       parse_response=text_response)
+    job.context_cache = ContextCacheManager(client, job.model_name, **cache_options)
+    return job
+
+
+async def _ask(client, job, video_id, question):
+    prefix = [f"video {video_id}"]
+    return await generate_with_context_cache(client, job, video_id, prefix, [question], prefix + [question],
+                                             asyncio.Semaphore(8), None, question)
+
+
+def test_one_cache_per_video_deleted_after_its_last_use():
+    client = FakeGeminiClient(latency_sec=0.01)
+    job = _job(client)
+    cache = job.context_cache
+    questions = {"v1": ["a", "b", "c"], "v2": ["d", "e"]}
+    for video_id, qs in questions.items():
+        cache.plan(video_id, len(qs))
+
+    async def scenario():
+        await asyncio.gather(*(_ask(client, job, v, q) for v, qs in questions.items() for q in qs))
+
+    asyncio.run(scenario())
+    assert cache.created == 2 and cache.deleted == 2 and cache.fallbacks == 0
+    assert client.caches == {} # Nothing left to bill for storage
+    assert cache.stats()["cached_tokens"] > 0
+
+
+def test_cache_stays_alive_while_uses_remain():
+    client = FakeGeminiClient()
+    job = _job(client)
+    job.context_cache.plan("v1", 2)
+
+    async def scenario():
+        await _ask(client, job, "v1", "a")
+        assert len(client.caches) == 1 # One planned use left
+        await _ask(client, job, "v1", "b")
+
+    asyncio.run(scenario())
+    assert client.caches == {} and job.context_cache.created == 1
+
+
+def test_single_use_videos_are_not_cached():
+    client = FakeGeminiClient()
+    job = _job(client)
+    job.context_cache.plan("v1", 1)
+    response = asyncio.run(_ask(client, job, "v1", "a"))
+    assert response.text and job.context_cache.created == 0 and job.context_cache.fallbacks == 1
+
+
+def test_rejected_cache_is_recreated():
+    client = FakeGeminiClient()
+    job = _job(client)
+    cache = job.context_cache
+    cache.plan("v1", 3)
+
+    async def scenario():
+        await _ask(client, job, "v1", "a")
+        client.caches.clear() # Expired on the server: the next cached request gets a 404
+        response = await _ask(client, job, "v1", "b") # Answered without the cache
+        assert response.usage_metadata.cached_content_token_count is None
+        await _ask(client, job, "v1", "c")
+
+    asyncio.run(scenario())
+    assert cache.created == 2 # Recreated for the last question
+    assert cache.stats()["failures"] == 0 and client.caches == {}
+
+
+def test_expired_entry_is_recreated_and_near_expiry_refreshed():
+    client = FakeGeminiClient()
+    job = _job(client, ttl_sec=600)
+    cache = job.context_cache
+    cache.plan("v1", 3)
+
+    async def scenario():
+        await _ask(client, job, "v1", "a")
+        entry = cache._entries["v1"]
+        entry.expires_at -= 550 # 50s left: extended before use
+        await _ask(client, job, "v1", "b")
+        assert entry.expires_at > time.time() + 500
+        entry.expires_at = 0.0 # Past its TTL
+        await _ask(client, job, "v1", "c")
+
+    asyncio.run(scenario())
+    assert cache.created == 2
@@ -0,0 +1,72 @@
+import hashlib
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from inference import ingest
+
+PAYLOAD = bytes(range(256)) * 4096 # 1 MiB
+DIGEST = hashlib.sha256(PAYLOAD).hexdigest()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Hugging Face-like `/resolve/` redirect; the first blob response is cut off halfway."""
+    blob_requests = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path == "/resolve/a.zip":
+            self.send_response(302)
+            self.send_header("Location", "/blob/a.zip")
+            self.send_header("X-Linked-ETag", f'"{self.server.linked_etag}"')
+            self.send_header("X-Linked-Size", str(len(PAYLOAD)))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        type(self).blob_requests += 1
+        start = int(self.headers["Range"].split("=")[1].rstrip("-")) if self.headers.get("Range") else 0
+        self.send_response(206 if start else 200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(PAYLOAD) - start))
+        self.end_headers()
+        body = PAYLOAD[start:]
+        if type(self).blob_requests == 1:
+            self.wfile.write(body[:len(body) // 2]) # Drop the connection mid-file
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    _Handler.blob_requests = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.linked_etag = DIGEST
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+
+
+def test_resumed_download_is_verified_against_the_redirect_etag(server, tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(ingest.time, "sleep", lambda _s: None)
+    url = f"http://127.0.0.1:{server.server_address[1]}/resolve/a.zip"
+    with caplog.at_level(logging.INFO, logger="inference.ingest"):
+        digest = ingest.download_resumable(url, tmp_path / "a.zip", show_progress=False)
+    assert digest == DIGEST
+    assert (tmp_path / "a.zip").read_bytes() == PAYLOAD
+    assert _Handler.blob_requests == 2
+    assert "verified" in caplog.text
+
+
+def test_wrong_redirect_etag_fails_the_download(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest.time, "sleep", lambda _s: None)
+    server.linked_etag = "0" * 64
+    url = f"http://127.0.0.1:{server.server_address[1]}/resolve/a.zip"
+    with pytest.raises(RuntimeError, match="Checksum mismatch"):
+        ingest.download_resumable(url, tmp_path / "a.zip", show_progress=False)
+    assert not (tmp_path / "a.zip").exists()
@@ -0,0 +1,115 @@
+import csv
+import json
+
+from inference.chat_store import pack_chat_histories
+from inference.fake_client import FakeGeminiClient
+from inference.pipeline import pipeline_main, plan_videos
+
+STAGES = ["questions", "answers", "cocot", "summary"]
+
+
+def _rows(video_id, *qids):
+    return [{"qid": qid, "video_id": video_id, "file_api_name": f"files/{video_id}"} for qid in qids]
+
+
+def test_videos_resume_after_their_last_completed_stage():
+    video_questions = {"new": _rows("new", "n1"), "asked": _rows("asked", "a1"), "chatted": _rows("chatted", "c1"),
+                       "half": _rows("half", "h1", "h2"), "answered": _rows("answered", "d1"),
+                       "summarized": _rows("summarized", "s1")}
+    generated = {v: ["Q?"] for v in ("asked", "chatted", "half", "answered", "summarized")}
+    answered = {"chatted", "half", "answered", "summarized"}
+    done_keys = {"cocot": {"h1", "d1", "s1"}, "summary": {"s1"}}
+    works, counts = plan_videos(video_questions, STAGES, generated, answered, done_keys, {"h1": "A.", "d1": "B."})
+    assert {w.video_id: w.stage for w in works} == {"new": "questions", "asked": "answers", "chatted": "cocot",
+                                                    "half": "cocot", "answered": "summary"}
+    assert counts == {"questions": 1, "answers": 1, "cocot": 2, "summary": 1, "done": 1}
+    assert next(w for w in works if w.video_id == "answered").preds == {"d1": "B."}
+    assert next(w for w in works if w.video_id == "half").preds == {"h1": "A."} # Kept for the summary stage
+
+
+def test_selected_stages_bound_the_plan():
+    video_questions = {"new": _rows("new", "n1"), "asked": _rows("asked", "a1"), "chatted": _rows("chatted", "c1")}
+    generated = {"asked": ["Q?"], "chatted": ["Q?"]}
+    works, counts = plan_videos(video_questions, ["answers", "cocot"], generated, {"chatted"}, {}, {})
+    assert {w.video_id: w.stage for w in works} == {"asked": "answers", "chatted": "cocot"}
+    assert counts == {"missing questions": 1, "answers": 1, "cocot": 1}
+    works, counts = plan_videos(video_questions, ["questions"], generated, {"chatted"}, {}, {})
+    assert [w.video_id for w in works] == ["new"] and counts == {"questions": 1, "done": 2}
+
+
+def test_fake_run_starts_each_video_at_its_next_stage(tmp_path):
+    metadata = tmp_path / "metadata.csv"
+    with open(metadata, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["qid", "video_id", "question", "file_api_name"])
+        writer.writeheader()
+        writer.writerows([{"qid": "q1", "video_id": "v1", "question": "What?", "file_api_name": "files/v1"},
+                          {"qid": "q2", "video_id": "v2", "question": "Why?", "file_api_name": "files/v2"}])
+    # v2 already has its questions and chat history from an earlier run
+    questions, answers_dir = tmp_path / "questions.csv", tmp_path / "chat_history"
+    with open(questions, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["video_id", "questions", "status"])
+        writer.writeheader()
+        writer.writerow({"video_id": "v2", "questions": "['Old question?']", "status": "Success"})
+    answers_dir.mkdir()
+    (answers_dir / "v2.json").write_text(json.dumps([{"role": "user", "parts": ["Old question?"]},
+                                                     {"role": "model", "parts": ["Old answer."]}]))
+    results = tmp_path / "results.csv"
+
+    argv = ["pipeline", "--model", "gemini-2.0-flash", "--stages", "questions,answers,cocot",
+            "--metadata", str(metadata), "--questions-results", str(questions), "--answers-dir", str(answers_dir),
+            "--answers-results", str(tmp_path / "answers.csv"), "--results", str(results),
+            "--handle-cache", "none", "--fake-client", "--fake-latency", "0", "--no-progress"]
+    assert pipeline_main(argv) == 0
+
+    with open(questions, newline="") as f:
+        assert [row["video_id"] for row in csv.DictReader(f)] == ["v2", "v1"] # v2 was not asked again
+    assert json.loads((answers_dir / "v2.json").read_text())[1]["parts"] == ["Old answer."]
+    assert (answers_dir / "v1.json").is_file()
+    with open(results, newline="") as f:
+        assert sorted((row["qid"], row["status"]) for row in csv.DictReader(f)) == [("q1", "Success"), ("q2", "Success")]
+    with open(tmp_path / "answers.csv", newline="") as f:
+        assert [row["video_id"] for row in csv.DictReader(f)] == ["v1"]
+
+
+class _RecordingClient(FakeGeminiClient):
+    """Keeps the text of every request, in `last.requests`."""
+    last = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.requests = []
+        _RecordingClient.last = self
+        generate = self.aio.models.generate_content
+
+        async def generate_content(*, model, contents, config=None):
+            self.requests.append(repr(contents))
+            return await generate(model=model, contents=contents, config=config)
+        self.aio.models.generate_content = generate_content
+
+
+def test_cocot_reads_histories_answered_in_the_same_run(tmp_path, monkeypatch):
+    metadata = tmp_path / "metadata.csv"
+    with open(metadata, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["qid", "video_id", "question", "file_api_name"])
+        writer.writeheader()
+        writer.writerow({"qid": "q1", "video_id": "v1", "question": "What?", "file_api_name": "files/v1"})
+    questions, answers_dir = tmp_path / "questions.csv", tmp_path / "chat_history"
+    with open(questions, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["video_id", "questions", "status"])
+        writer.writeheader()
+        writer.writerow({"video_id": "v1", "questions": "['New question?']", "status": "Success"})
+    # An old pack still holds v1, whose .json was deleted to answer it again
+    answers_dir.mkdir()
+    (answers_dir / "v1.json").write_text(json.dumps([{"role": "user", "parts": ["Old question?"]},
+                                                     {"role": "model", "parts": ["Stale answer."]}]))
+    pack_chat_histories(str(answers_dir))
+    (answers_dir / "v1.json").unlink()
+
+    monkeypatch.setattr("inference.fake_client.FakeGeminiClient", _RecordingClient)
+    argv = ["pipeline", "--model", "gemini-2.0-flash", "--stages", "answers,cocot",
+            "--metadata", str(metadata), "--questions-results", str(questions), "--answers-dir", str(answers_dir),
+            "--answers-results", str(tmp_path / "answers.csv"), "--results", str(tmp_path / "results.csv"),
+            "--handle-cache", "none", "--fake-client", "--fake-latency", "0", "--no-progress"]
+    assert pipeline_main(argv) == 0
+    cocot_request = _RecordingClient.last.requests[-1]
+    assert "New question?" in cocot_request and "Stale answer." not in cocot_request
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import sqlite3
+import subprocess
+import sys
+from contextlib import closing
+from pathlib import Path
+
+import pytest
+from google.genai import types
+
+from inference.engine import run_bulk_inference_async
+from inference.fake_client import FakeGeminiClient, FakeResponse
+from inference.jobs import InferenceJob, text_response
+from inference.rate_limiter import QuotaManager
+from inference.response_cache import ResponseCache, request_key, video_key_for
+
+VIDEO = types.Part.from_uri(file_uri="https://fake.local/files/v1", mime_type="video/mp4")
+ITEM = {"qid": "q1", "video_id": "v1", "file_api_name": "files/v1", "content_sha256": "abc"}
+
+
+def _config(**overrides):
+    settings = {"temperature": 0.2, "system_instruction": "Answer carefully.",
+                "thinking_config": types.ThinkingConfig(thinking_budget=1024)}
+    settings.update(overrides)
+    return types.GenerateContentConfig(**settings)
+
+
+def _key(config=None, contents=None, item=ITEM):
+    return request_key("gemini-2.0-flash", config or _config(), contents or [VIDEO, "What happens?"], video_key_for(item))
+
+
+KEY_SCRIPT = """
+from google.genai import types
+from inference.response_cache import request_key
+config = types.GenerateContentConfig(system_instruction="Answer carefully.", temperature=0.2,
+                                     thinking_config=types.ThinkingConfig(thinking_budget=1024))
+video = types.Part.from_uri(file_uri="https://fake.local/files/v1", mime_type="video/mp4")
+print(request_key("gemini-2.0-flash", config, [video, "What happens?"], "content_sha256:abc"))
+"""
+
+
+def test_key_is_stable_across_processes_and_ordering():
+    keys = set()
+    for seed in ("1", "2"):
+        env = {**os.environ, "PYTHONHASHSEED": seed}
+        keys.add(subprocess.run([sys.executable, "-c", KEY_SCRIPT], env=env, capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parents[1], check=True).stdout.strip())
+    assert keys == {_key()} # The subprocess builds the config with its fields in another order
+
+
+def test_key_changes_with_every_request_input():
+    base = _key()
+    assert _key(_config(system_instruction="Answer briefly.")) != base
+    assert _key(_config(thinking_config=types.ThinkingConfig(thinking_budget=0))) != base
+    assert _key(contents=[VIDEO, "What happens next?"]) != base
+    assert _key(item={**ITEM, "content_sha256": "def"}) != base
+    # Same content under a new handle (re-upload) keeps the key
+    assert _key(contents=[types.Part.from_uri(file_uri="https://fake.local/files/v2", mime_type="video/mp4"),
+                          "What happens?"], item={**ITEM, "file_api_name": "files/v2"}) == base
+
+
+def test_only_complete_responses_are_stored(tmp_path):
+    with ResponseCache(str(tmp_path / "c.sqlite")) as cache:
+        assert cache.put("stop", FakeResponse("A."))
+        assert not cache.put("max_tokens", FakeResponse("A. Because", finish_reason="MAX_TOKENS"))
+        assert not cache.put("safety", FakeResponse("", finish_reason="SAFETY"))
+        assert not cache.put("empty", FakeResponse(""))
+        assert not cache.put("replayed", cache.get("stop")) # Never re-stores its own hits
+        assert len(cache) == 1 and cache.get("stop").text == "A." and cache.get("max_tokens") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    with ResponseCache(str(tmp_path / "c.sqlite"), max_entries=2) as cache:
+        cache.put("a", FakeResponse("A."))
+        cache.put("b", FakeResponse("B."))
+        assert cache.get("a") is not None # "b" is now the least recently used
+        cache.put("c", FakeResponse("C."))
+        assert len(cache) == 2 and cache.stats()["evictions"] == 1
+        assert cache.get("b") is None and cache.get("a") is not None and cache.get("c") is not None
+
+
+def _rows(path):
+    with closing(sqlite3.connect(path)) as conn:
+        return conn.execute("SELECT key, last_used FROM responses").fetchall()
+
+
+def test_read_only_cache_never_writes(tmp_path):
+    path = str(tmp_path / "c.sqlite")
+    with ResponseCache(path) as cache:
+        cache.put("a", FakeResponse("A."))
+    before = _rows(path)
+    with ResponseCache(path, read_only=True) as cache:
+        assert cache.get("a").text == "A."
+        assert not cache.put("b", FakeResponse("B."))
+        assert len(cache) == 1 and cache.stats()["writes"] == 0
+    assert _rows(path) == before
+    with pytest.raises(sqlite3.OperationalError):
+        ResponseCache(str(tmp_path / "missing.sqlite"), read_only=True)
+
+
+def test_rerun_is_served_from_the_cache(tmp_path):
+    items = [{"qid": f"q{i}", "video_id": "v1", "file_api_name": "files/v1"} for i in range(3)]
+    job = InferenceJob(model_name="m", config=None, build_contents=lambda item, part: [part, item["qid"]],
+                       parse_response=text_response)
+    client = FakeGeminiClient(response_text="A.")
+    with ResponseCache(str(tmp_path / "c.sqlite")) as cache:
+        job.response_cache = cache
+        for run in ("first", "second"):
+            asyncio.run(run_bulk_inference_async(items, client, job, str(tmp_path / f"{run}.csv"),
+                                                 show_progress=False, quota_manager=QuotaManager()))
+        assert client.calls == 3 and cache.stats()["hits"] == 3
@@ -0,0 +1,47 @@
+import asyncio
+
+from inference.engine import run_bulk_inference_async
+from inference.fake_client import FakeGeminiClient
+from inference.jobs import InferenceJob, text_response
+from inference.rate_limiter import QuotaManager
+from inference.results_store import PARTIAL_STATUS, ResultsStore
+
+
+def _row(qid, pred, status):
+    return {"qid": qid, "pred": pred, "status": status, "duration": 1.0, "finish_reason": "STOP"}
+
+
+def test_success_is_never_overwritten(tmp_path):
+    with ResultsStore(str(tmp_path / "r.sqlite")) as store:
+        store.write_many([_row("q1", "A", "Success"), _row("q2", "ERROR", "Failed (Retries)")])
+        store.write_many([_row("q1", "ERROR", "Failed (Retries)"), _row("q2", "B", "Success")])
+        store.write_many([_row("q1", "C", "Success"), _row("q2", "ERROR", "Blocked/Empty")])
+        rows = {row["qid"]: row for row in store.iter_rows()}
+        assert (rows["q1"]["pred"], rows["q1"]["status"]) == ("A", "Success")
+        assert (rows["q2"]["pred"], rows["q2"]["status"]) == ("B", "Success")
+        assert store.done_keys() == {"q1", "q2"}
+
+
+def test_failures_are_replaced_and_counted(tmp_path):
+    with ResultsStore(str(tmp_path / "r.sqlite")) as store:
+        store.write_many([_row("q1", "ERROR", "Failed (Retries)")])
+        store.write_many([_row("q1", "ERROR", "Blocked/Empty")])
+        assert store.done_keys() == set() and store.done_keys(successful_only=False) == {"q1"}
+        store.write_many([_row("q1", "A.", PARTIAL_STATUS)]) # Streaming progress is not an attempt
+        store.write_many([_row("q1", "A. Done", "Success")])
+        attempts, = store._conn.execute("SELECT attempts FROM results WHERE key = 'q1'").fetchone()
+        assert attempts == 3
+        assert next(store.iter_rows())["pred"] == "A. Done"
+
+
+def test_fake_run_keeps_successes_on_rerun(tmp_path):
+    path = str(tmp_path / "r.sqlite")
+    items = [{"qid": f"q{i}", "video_id": f"v{i % 2}", "file_api_name": f"files/v{i % 2}"} for i in range(4)]
+    job = InferenceJob(model_name="m", config=None, build_contents=lambda item, part: [item["qid"], part],
+                       parse_response=text_response)
+    asyncio.run(run_bulk_inference_async(items, FakeGeminiClient(response_text="A."), job, path,
+                                         show_progress=False, quota_manager=QuotaManager()))
+    with ResultsStore(path) as store:
+        assert store.done_keys() == {"q0", "q1", "q2", "q3"}
+        store.write_many([_row("q0", "ERROR", "Failed (Retries)")]) # e.g. a stale shard replaying a failure
+        assert store.summary()["by_status"] == {"Success": 4}
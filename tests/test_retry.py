@@ -0,0 +1,80 @@
+import asyncio
+import random
+from dataclasses import dataclass, field
+
+import pytest
+
+from inference.engine import RetriesExhausted, generate_with_retries
+from inference.fake_client import FakeGeminiClient, FakeNotFound
+from inference.jobs import InferenceJob, text_response
+from inference.retry import RetryPolicy, retry_after_seconds
+
+
+def test_backoff_stays_within_the_jitter_ceiling():
+    policy = RetryPolicy(initial_backoff_sec=2.0, max_backoff_sec=10.0)
+    random.seed(0)
+    for attempt, ceiling in enumerate([2.0, 4.0, 8.0, 10.0, 10.0]):
+        delays = [policy.backoff(attempt) for _ in range(500)]
+        assert all(0.0 <= d <= ceiling for d in delays)
+        assert max(delays) > 0.8 * ceiling and min(delays) < 0.2 * ceiling # Full jitter, not a fixed step
+
+
+def test_server_retry_delay_is_a_floor():
+    policy = RetryPolicy(initial_backoff_sec=1.0, max_backoff_sec=4.0)
+    assert retry_after_seconds(FakeNotFound(429, "Quota exceeded. {'retryDelay': '17s'}")) == 17.0
+    assert all(policy.backoff(0, retry_after=17.0) == 17.0 for _ in range(50))
+    assert all(policy.backoff(2, retry_after=5.0) == 5.0 for _ in range(50)) # Above the 4s ceiling
+
+
+def test_deadline_and_retry_count():
+    policy = RetryPolicy(max_retries=2, deadline_sec=10.0)
+    assert policy.can_retry(0, elapsed_sec=1.0, next_delay=5.0)
+    assert not policy.can_retry(0, elapsed_sec=6.0, next_delay=5.0)
+    assert not policy.can_retry(2, elapsed_sec=0.0, next_delay=0.0)
+    assert RetryPolicy(max_retries=5, deadline_sec=None).can_retry(4, elapsed_sec=1e6, next_delay=1e6)
+
+
+@dataclass
+class _RecordingPolicy(RetryPolicy):
+    delays: list = field(default_factory=list)
+
+    def backoff(self, attempt, retry_after=None):
+        delay = super().backoff(attempt, retry_after)
+        self.delays.append((attempt, delay))
+        return delay
+
+
+class _ThrottledClient(FakeGeminiClient):
+    """Answers 429 to the first `failures` requests."""
+    def __init__(self, failures):
+        super().__init__(response_text="A.")
+        self.failures = failures
+        generate = self.aio.models.generate_content
+
+        async def generate_content(*, model, contents, config=None):
+            if self.failures > 0:
+                self.failures -= 1
+                raise FakeNotFound(429, "Resource exhausted.")
+            return await generate(model=model, contents=contents, config=config)
+        self.aio.models.generate_content = generate_content
+
+
+def _send(client, policy):
+    job = InferenceJob(model_name="m", config=None, build_contents=lambda item, part: [part],
+                       parse_response=text_response, retry_policy=policy)
+    return asyncio.run(generate_with_retries(client, job, ["q"], asyncio.Semaphore(1), None))
+
+
+def test_retries_back_off_within_bounds():
+    policy = _RecordingPolicy(max_retries=3, initial_backoff_sec=0.01, max_backoff_sec=0.02)
+    client = _ThrottledClient(failures=3)
+    assert _send(client, policy).text == "A."
+    assert [attempt for attempt, _ in policy.delays] == [0, 1, 2]
+    assert all(0.0 <= delay <= min(0.02, 0.01 * 2 ** attempt) for attempt, delay in policy.delays)
+
+
+def test_retries_exhausted_keeps_the_last_error():
+    policy = _RecordingPolicy(max_retries=1, initial_backoff_sec=0.01)
+    with pytest.raises(RetriesExhausted) as info:
+        _send(_ThrottledClient(failures=5), policy)
+    assert info.value.last_error.code == 429 and len(policy.delays) == 2
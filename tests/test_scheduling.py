@@ -0,0 +1,148 @@
+import asyncio
+import csv
+
+from inference.engine import run_bulk_inference_async
+from inference.fake_client import FakeGeminiClient, FakeNotFound
+from inference.jobs import InferenceJob, text_response
+from inference.rate_limiter import QuotaManager
+from inference.retry import RetryPolicy, is_handle_error
+from inference.scheduling import HedgePolicy, RequeueTap, TailScheduler, order_longest_first, predicted_makespan
+
+
+def _warm_up(policy: HedgePolicy, latency: float = 0.01):
+    for _ in range(policy.min_samples):
+        policy.served.observe(latency)
+        policy.unhedged.observe(latency)
+
+
+def test_losing_original_keeps_the_reserved_slot():
+    async def scenario():
+        policy = HedgePolicy(budget=1.0)
+        _warm_up(policy)
+        policy.requests = policy.min_samples
+        semaphore = asyncio.Semaphore(2)
+        calls = []
+
+        async def send():
+            calls.append(None)
+            await asyncio.sleep(5.0 if len(calls) == 1 else 0.01) # The original straggles
+            return len(calls)
+
+        async with semaphore:
+            await policy.run(send, semaphore)
+        assert policy.hedge_wins == 1
+        # The original is still in flight and must still hold a slot
+        assert len(policy._stragglers) == 1
+        assert semaphore._value == 1
+        await policy.close()
+        await asyncio.sleep(0.01)
+        assert semaphore._value == 2
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_hedge_releases_its_slot():
+    async def scenario():
+        policy = HedgePolicy(budget=1.0)
+        _warm_up(policy)
+        policy.requests = policy.min_samples
+        semaphore = asyncio.Semaphore(2)
+        calls = []
+
+        async def send():
+            calls.append(None)
+            await asyncio.sleep(0.03 if len(calls) == 1 else 5.0) # The hedge straggles
+            return len(calls)
+
+        async with semaphore:
+            assert await policy.run(send, semaphore) == 2
+        await asyncio.sleep(0.01) # Let the cancelled hedge finish
+        assert policy.hedged == 1 and policy.hedge_wins == 0
+        assert not policy._stragglers
+        assert semaphore._value == 2
+
+    asyncio.run(scenario())
+
+
+def test_no_hedge_without_a_free_slot():
+    async def scenario():
+        policy = HedgePolicy(budget=1.0)
+        _warm_up(policy)
+        policy.requests = policy.min_samples
+        semaphore = asyncio.Semaphore(1)
+
+        async def send():
+            await asyncio.sleep(0.05)
+            return "ok"
+
+        async with semaphore:
+            assert await policy.run(send, semaphore) == "ok"
+        assert policy.hedged == 0
+
+    asyncio.run(scenario())
+
+
+def test_longest_first_keeps_videos_together():
+    items = [{"qid": "a0", "video_id": "a"}, {"qid": "a1", "video_id": "a"},
+             {"qid": "b0", "video_id": "b"}, {"qid": "b1", "video_id": "b"}]
+    ordered = order_longest_first(items, [1.0, 2.0, 9.0, 3.0])
+    assert [item["qid"] for item in ordered] == ["b0", "b1", "a1", "a0"]
+
+
+def test_predicted_makespan():
+    assert predicted_makespan([1.0, 1.0, 10.0], workers=2) == 11.0
+    assert predicted_makespan([10.0, 1.0, 1.0], workers=2) == 10.0
+
+
+# --- Requeue classification ---
+def test_handle_errors_are_classified_by_exception():
+    assert is_handle_error(FileNotFoundError("File API 'files/x' not found."))
+    assert is_handle_error(FakeNotFound(404, "File not found."))
+    assert is_handle_error(FakeNotFound(403, "PERMISSION_DENIED"))
+    assert not is_handle_error(ValueError("Missing File API name."))
+    assert not is_handle_error(RuntimeError("quota 403 exceeded, request id 404"))
+    assert not is_handle_error(FakeNotFound(400, "Invalid argument near token 404"))
+
+
+def test_requeue_tap_holds_only_retryable_failures():
+    async def scenario():
+        queue: asyncio.Queue = asyncio.Queue()
+        tap = RequeueTap(queue, "qid", hold=True)
+        await tap.put({"qid": "a", "status": "Failed (Retries)", "duration": 1.0})
+        await tap.put({"qid": "b", "status": "Failed (Unexpected Error)", "pred": "ERROR: - 404 in the text"})
+        await tap.put({"qid": "c", "status": "Failed (Unexpected Error)", "handle_error": True})
+        await tap.put({"qid": "d", "status": "Success"})
+        assert set(tap.held) == {"a", "c"}
+        assert [queue.get_nowait()["qid"] for _ in range(queue.qsize())] == ["b", "d"]
+
+    asyncio.run(scenario())
+
+
+class _FailingOnceClient(FakeGeminiClient):
+    """Fails the first request of each qid listed in `errors` with the given exception."""
+    def __init__(self, errors):
+        super().__init__()
+        self.errors = dict(errors)
+        generate = self.aio.models.generate_content
+
+        async def generate_content(*, model, contents, config=None):
+            error = self.errors.pop(contents[0], None)
+            if error is not None:
+                raise error
+            return await generate(model=model, contents=contents, config=config)
+        self.aio.models.generate_content = generate_content
+
+
+def test_requeue_pass_recovers_retryable_failures(tmp_path):
+    client = _FailingOnceClient({"q0": FakeNotFound(503, "unavailable"), "q1": FakeNotFound(403, "expired"),
+                                 "q2": FakeNotFound(400, "bad request 404")})
+    job = InferenceJob(model_name="m", config=None, build_contents=lambda item, part: [item["qid"], part],
+                       parse_response=text_response, retry_policy=RetryPolicy(max_retries=0))
+    items = [{"qid": f"q{i}", "video_id": "v", "file_api_name": "files/v"} for i in range(4)]
+    results = tmp_path / "r.csv"
+    summary = asyncio.run(run_bulk_inference_async(items, client, job, str(results), show_progress=False,
+                                                   quota_manager=QuotaManager(), scheduler=TailScheduler()))
+    assert summary["scheduler"]["requeued"] == 2 and summary["scheduler"]["recovered"] == 2
+    with open(results, newline="", encoding="utf-8") as f:
+        statuses = {row["qid"]: row["status"] for row in csv.DictReader(f)}
+    assert statuses == {"q0": "Success", "q1": "Success", "q2": "Failed (Unexpected Error)", "q3": "Success"}
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import csv
+
+import pytest
+
+from inference.engine import run_bulk_inference_async
+from inference.fake_client import FakeGeminiClient
+from inference.jobs import InferenceJob, text_response
+from inference.rate_limiter import QuotaManager
+from inference.results_store import ResultsStore
+from inference.sharding import merge_segments, parse_shard, segment_path, shard_of
+
+
+def test_shard_of_is_stable_and_spread():
+    video_ids = [f"video_{i}" for i in range(400)]
+    shards = [shard_of(v, 4) for v in video_ids]
+    assert shards == [shard_of(v, 4) for v in video_ids]
+    assert shard_of("video_0", 4) == 3 and shard_of("video_1", 4) == 2 # Fixed by sha1, not PYTHONHASHSEED
+    assert all(70 <= shards.count(k) <= 130 for k in range(4))
+    assert {shard_of(v, 1) for v in video_ids} == {0}
+
+
+def test_parse_shard():
+    assert parse_shard("2/5") == (2, 5)
+    for spec in ("5/5", "-1/3", "1", "a/b"):
+        with pytest.raises(argparse.ArgumentTypeError):
+            parse_shard(spec)
+
+
+def test_merge_orders_keys_and_prefers_success(tmp_path):
+    first, second = str(tmp_path / "a.sqlite"), str(tmp_path / "b.sqlite")
+    with ResultsStore(first) as store:
+        store.write_many([{"qid": "q3", "pred": "C", "status": "Success"},
+                          {"qid": "q1", "pred": "ERROR", "status": "Failed (Retries)"}])
+    with ResultsStore(second) as store:
+        store.write_many([{"qid": "q2", "pred": "B", "status": "Success"},
+                          {"qid": "q1", "pred": "A", "status": "Success"},
+                          {"qid": "q4", "pred": "ERROR", "status": "Blocked/Empty"}])
+    output = tmp_path / "merged.csv"
+    assert merge_segments([first, second, str(tmp_path / "missing.sqlite")], str(output)) == 4
+    with open(output, newline="") as f:
+        rows = [(row["qid"], row["pred"], row["status"]) for row in csv.DictReader(f)]
+    assert rows == [("q1", "A", "Success"), ("q2", "B", "Success"), ("q3", "C", "Success"),
+                    ("q4", "ERROR", "Blocked/Empty")]
+
+
+def _run(items, results_file):
+    job = InferenceJob(model_name="m", config=None, build_contents=lambda item, part: [item["qid"], part],
+                       parse_response=text_response)
+    asyncio.run(run_bulk_inference_async(items, FakeGeminiClient(response_text="A."), job, results_file,
+                                         show_progress=False, quota_manager=QuotaManager()))
+
+
+def test_sharded_fake_run_merges_like_a_single_run(tmp_path):
+    items = [{"qid": f"q{i:02d}", "video_id": f"v{i % 7}", "file_api_name": f"files/v{i % 7}"} for i in range(30)]
+    _run(items, str(tmp_path / "single.sqlite"))
+    merge_segments([str(tmp_path / "single.sqlite")], str(tmp_path / "single.csv"), columns=["qid", "pred"])
+
+    num_shards = 3
+    segments = [segment_path(str(tmp_path / "shards"), k, num_shards) for k in range(num_shards)]
+    for k, segment in enumerate(segments):
+        _run([item for item in items if shard_of(item["video_id"], num_shards) == k], segment)
+    assert merge_segments(reversed(segments), str(tmp_path / "merged.csv"), columns=["qid", "pred"]) == 30
+    assert (tmp_path / "merged.csv").read_bytes() == (tmp_path / "single.csv").read_bytes()
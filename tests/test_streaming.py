@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from inference.fake_client import FakeGeminiClient
+from inference.jobs import MCQ_QUESTION_TYPE
+from inference.streaming import EARLY_STOP_REASON, answer_section_complete, stream_generate
+
+MCQ = {"question_type": MCQ_QUESTION_TYPE}
+THINKING = "```thinking\n- The person picks up the red cup first.\n```\n"
+
+
+@pytest.mark.parametrize("answer", [
+    "A.\n",
+    "B\n",
+    "(C)\n",
+    "D) The blue one\n",
+    "  **E.** None of the above\n",
+    "**B**\n",
+    "Answer: C\n",
+    "answer: C\n",
+    "**Final Answer:** A\n",
+    "Final answer: (D)\n",
+    "\nB. Because the cup is red.\n",
+])
+def test_final_answer_lines_cut_off(answer):
+    assert answer_section_complete(MCQ, THINKING + answer)
+    assert answer_section_complete(MCQ, THINKING.replace("```", "'''") + answer)
+
+
+@pytest.mark.parametrize("answer", [
+    "A. The red",                  # Line still streaming
+    "Answer: C",                   # Line still streaming
+    "",                            # Nothing after the thinking block yet
+    "Because the cup is red.\n",   # Starts with a letter, but is not an option
+    "Answer: B because it is red.\n",
+    "Every option fits.\n",
+    "F.\n",                        # Not an option letter
+    "The answer is A.\n",          # Letter not at the start of the line
+])
+def test_other_lines_do_not_cut_off(answer):
+    assert not answer_section_complete(MCQ, THINKING + answer)
+
+
+def test_only_closed_thinking_blocks_and_mcq_questions_cut_off():
+    assert not answer_section_complete(MCQ, "```thinking\nA.\n") # Letter inside an open thinking block
+    assert not answer_section_complete(MCQ, "A.\n")              # No thinking block at all
+    assert not answer_section_complete({"question_type": "open-ended"}, THINKING + "A.\n")
+
+
+class _ClosableStreamClient(FakeGeminiClient):
+    """Records whether the stream was closed and how many chunks were pulled from it."""
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.closed = False
+        self.pulled = 0
+        stream = self.aio.models.generate_content_stream
+
+        async def generate_content_stream(*, model, contents, config=None):
+            chunks = await stream(model=model, contents=contents, config=config)
+            owner = self
+
+            class Stream:
+                def __aiter__(self):
+                    return self
+
+                async def __anext__(self):
+                    chunk = await chunks.__anext__()
+                    owner.pulled += 1
+                    return chunk
+
+                async def aclose(self):
+                    owner.closed = True
+                    await chunks.aclose()
+            return Stream()
+        self.aio.models.generate_content_stream = generate_content_stream
+
+
+def test_on_text_true_closes_the_stream_early():
+    text = THINKING + "C.\nThe explanation that follows is not needed for grading." * 3
+    client = _ClosableStreamClient(response_text=text, stream_chunks=20)
+    seen = []
+
+    def on_text(so_far):
+        seen.append(so_far)
+        return answer_section_complete(MCQ, so_far)
+
+    response = asyncio.run(stream_generate(client, "m", ["q"], on_text=on_text))
+    assert response.cut_off and response.candidates[0].finish_reason.name == EARLY_STOP_REASON
+    assert client.closed and client.pulled < 20
+    assert response.text == seen[-1] and THINKING + "C.\n" in response.text and len(response.text) < len(text)
+
+
+def test_stream_runs_to_the_end_without_a_cut_off():
+    client = _ClosableStreamClient(response_text=THINKING + "Open-ended answer.", stream_chunks=5)
+    response = asyncio.run(stream_generate(client, "m", ["q"], on_text=lambda so_far: False))
+    assert not response.cut_off and response.candidates[0].finish_reason.name == "STOP"
+    assert response.text == THINKING + "Open-ended answer." and response.ttft_sec is not None
@@ -0,0 +1,48 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from inference.uploads import FILE_API_EXPIRY_MARGIN_SEC, FileApiUploader, UploadIndex, UploadManager, content_digest
+
+
+class _FakeFiles:
+    def __init__(self, listed):
+        self.listed = listed
+        self.uploads = 0
+
+    def list(self, config=None):
+        return self.listed
+
+    def upload(self, file, config=None):
+        self.uploads += 1
+        return SimpleNamespace(name=f"files/new{self.uploads}")
+
+
+def _remote(name, digest, expires_in_sec):
+    return SimpleNamespace(name=name, display_name=digest, state=SimpleNamespace(name="ACTIVE"),
+                           expiration_time=datetime.now(timezone.utc) + timedelta(seconds=expires_in_sec))
+
+
+def _ensure(manager, path):
+    return asyncio.run(manager.ensure_uploaded("vid", path, 0.5, asyncio.Semaphore(1)))
+
+
+def test_remote_object_is_indexed_with_its_real_expiry(tmp_path):
+    path = tmp_path / "vid.mp4"
+    path.write_bytes(b"video")
+    digest = content_digest(path, 0.5)
+    files = _FakeFiles([_remote("files/old", digest, expires_in_sec=8 * 3600)])
+    index = UploadIndex(str(tmp_path / "index.jsonl"))
+    result = _ensure(UploadManager(FileApiUploader(files), index), path)
+    assert (result.source, result.resource_id) == ("remote", "files/old")
+    record = index._objects["file_api"][digest]
+    assert abs(record["expires_at"] - (time.time() + 8 * 3600 - FILE_API_EXPIRY_MARGIN_SEC)) < 60
+
+
+def test_remote_object_close_to_expiry_is_uploaded_again(tmp_path):
+    path = tmp_path / "vid.mp4"
+    path.write_bytes(b"video")
+    files = _FakeFiles([_remote("files/old", content_digest(path, 0.5), expires_in_sec=600)])
+    result = _ensure(UploadManager(FileApiUploader(files), UploadIndex(str(tmp_path / "index.jsonl"))), path)
+    assert (result.source, result.resource_id) == ("upload", "files/new1")
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from inference.fake_client import FakeGeminiClient, FakeNotFound
+from inference.video_cache import VideoHandleCache
+
+ITEM = {"video_id": "v1", "file_api_name": "files/v1"}
+
+
+def test_concurrent_lookups_share_one_files_get():
+    client = FakeGeminiClient(files_latency_sec=0.02)
+    cache = VideoHandleCache(client, use_vertex=False)
+
+    async def scenario():
+        return await asyncio.gather(*(cache.get_part(dict(ITEM)) for _ in range(20)))
+
+    parts = asyncio.run(scenario())
+    assert client.file_gets == 1
+    assert all(part is parts[0] for part in parts) and parts[0].file_data.file_uri == "https://fake.local/files/v1"
+    assert cache.stats() == {"entries": 1, "hits": 19, "misses": 1}
+
+
+def test_expired_entry_is_fetched_again():
+    client = FakeGeminiClient()
+    cache = VideoHandleCache(client, use_vertex=False, ttl_sec=0.05)
+
+    async def scenario():
+        await cache.get_part(ITEM)
+        await cache.get_part(ITEM)
+        assert client.file_gets == 1
+        await asyncio.sleep(0.06)
+        await cache.get_part(ITEM)
+
+    asyncio.run(scenario())
+    assert client.file_gets == 2
+
+
+def test_file_api_expiry_margin_bounds_an_entry():
+    client = FakeGeminiClient()
+
+    async def get(*, name):
+        client.file_gets += 1
+        return SimpleNamespace(name=name, uri=f"https://fake.local/{name}", mime_type="video/mp4",
+                               expiration_time=datetime.now(timezone.utc) + timedelta(minutes=5))
+    client.aio.files.get = get
+    cache = VideoHandleCache(client, use_vertex=False, expiry_margin_sec=600)
+
+    async def scenario():
+        await cache.get_part(ITEM)
+        await cache.get_part(ITEM) # Expires within the margin: never reused
+
+    asyncio.run(scenario())
+    assert client.file_gets == 2
+
+
+def test_handles_persist_across_runs(tmp_path):
+    path = str(tmp_path / "handles.json")
+    cache = VideoHandleCache(FakeGeminiClient(), use_vertex=False, persist_path=path)
+    asyncio.run(cache.get_part(ITEM))
+    cache.save()
+
+    with open(path) as f:
+        raw = json.load(f)
+    raw["files/old"] = {**raw["files/v1"], "expires_at": 0}
+    with open(path, "w") as f:
+        json.dump(raw, f)
+
+    client = FakeGeminiClient()
+    reloaded = VideoHandleCache(client, use_vertex=False, persist_path=path)
+    assert len(reloaded) == 1 # The expired handle is dropped on load
+    part = asyncio.run(reloaded.get_part(ITEM))
+    assert client.file_gets == 0 and part.file_data.file_uri == "https://fake.local/files/v1"
+
+
+def test_missing_file_is_an_input_error():
+    client = FakeGeminiClient()
+
+    async def get(*, name):
+        raise FakeNotFound(404, f"{name} not found")
+    client.aio.files.get = get
+    cache = VideoHandleCache(client, use_vertex=False)
+    with pytest.raises(FileNotFoundError):
+        asyncio.run(cache.get_part(ITEM))
+    assert len(cache) == 0